@@ -83,6 +83,8 @@ function print_help() {
     echo "Commands:"
     echo "    application"
     echo "        Start a Django webserver (gunicorn)."
+    echo "    beat"
+    echo "        Start the Celery beat scheduler for periodic tasks."
     echo "    devmode"
     echo "        Start a Django webserver (manage.py runserver)."
     echo "    init-only [port]"
@@ -357,6 +359,10 @@ case "$COMMAND" in
         banner "Starting production appserver"
         exec gunicorn -w 4 -b 0.0.0.0:8000 edd.wsgi:application
         ;;
+    beat)
+        banner "Starting Celery beat"
+        exec celery -A edd beat -l info -s /tmp/celerybeat-schedule
+        ;;
     devmode)
         banner "Starting development appserver"
         exec python manage.py runserver 0.0.0.0:8000
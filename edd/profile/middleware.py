@@ -36,7 +36,7 @@ class TaskNotification(object):
             task.notified = True
             task.save()
         elif result.failed():
-            msg = _('An import task failed with error: %(task_error)s') % {
+            msg = _('A background task failed with error: %(task_error)s') % {
                 'task_error': result.info,
             }
             messages.add_message(request, msg_constants.ERROR_PERSISTENT, msg)
@@ -300,6 +300,53 @@ class MeasurementValuesTests(EddApiTestCaseMixin, APITestCase):
     @classmethod
     def setUpTestData(cls):
         super(MeasurementValuesTests, cls).setUpTestData()
+        User = get_user_model()
+        cls.superuser = User.objects.get(username='superuser')
+
+    def test_packed_values(self):
+        """
+        Check that values of a measurement packed into a series are listed like other values.
+        """
+        study = models.Study.objects.get(pk=23)
+        line = study.line_set.create(name='Packed line')
+        assay = line.assay_set.create(
+            name='Packed assay',
+            protocol=models.Protocol.objects.get(name='OD600'),
+            experimenter=self.superuser,
+        )
+        hours = models.MeasurementUnit.objects.get(unit_name='hours')
+        measurement = assay.measurement_set.create(
+            measurement_type=models.Metabolite.objects.get(short_name='ac'),
+            x_units=hours,
+            y_units=hours,
+        )
+        for i in range(3):
+            measurement.measurementvalue_set.create(x=[i], y=[i * 2])
+        measurement.pack_values()
+        self.assertFalse(measurement.measurementvalue_set.exists())
+        self.client.force_login(self.superuser)
+        url = reverse('rest:values-list')
+        response = self._check_status(
+            self.client.get(url, {'measurement': measurement.pk}),
+            status.HTTP_200_OK,
+        )
+        results = response.json()['results']
+        points = [(float(r['x'][0]), float(r['y'][0])) for r in results]
+        self.assertEqual(points, [(0, 0), (1, 2), (2, 4)])
+        self.assertEqual({r['measurement'] for r in results}, {measurement.pk})
+        # range parameters apply to each point of the series
+        response = self._check_status(
+            self.client.get(url, {'measurement': measurement.pk, 'y__gt': 1}),
+            status.HTTP_200_OK,
+        )
+        self.assertEqual(response.json()['count'], 2)
+        # nested study resource includes packed values too
+        url = reverse('rest:study-values-list', kwargs={'study_pk': study.pk})
+        response = self._check_status(self.client.get(url), status.HTTP_200_OK)
+        self.assertEqual(
+            len([r for r in response.json()['results'] if r['measurement'] == measurement.pk]),
+            3,
+        )
 
 
 class EddObjectSearchTest(EddApiTestCaseMixin, APITestCase):
@@ -10,6 +10,7 @@ main/views.py, but are not accessible using the same URL scheme.
 """
 
 import logging
+import operator
 
 from django.contrib.auth import get_user_model
 from django.db.models import Q
@@ -107,13 +108,19 @@ class StudyInternalsFilterMixin(object):
 
     def filter_queryset(self, queryset):
         queryset = super(StudyInternalsFilterMixin, self).filter_queryset(queryset)
+        return self.filter_visible(queryset)
+
+    def filter_visible(self, queryset):
+        """
+        Filters a queryset to only the objects in studies the requesting user may view, using
+        the _filter_prefix lookup to the study.
+        """
         if not models.Study.user_role_can_read(self.request.user):
-            q_filter = models.Study.user_permission_q(
+            study_ids = models.Study.user_permission_ids(
                 self.request.user,
                 models.StudyPermission.CAN_VIEW,
-                self._filter_prefix,
             )
-            queryset = queryset.filter(q_filter)
+            queryset = queryset.filter(**{'%spk__in' % self._filter_prefix: study_ids})
         return queryset
 
     def get_nested_filter(self):
@@ -340,6 +347,96 @@ class MeasurementValueFilter(filters.FilterSet):
         fields = {'measurement': ['exact', 'in']}
 
 
+class MeasurementSeriesFilter(filters.FilterSet):
+    """
+    Filters packed series with the same parameters as MeasurementValueFilter; the x and y range
+    parameters are applied to each point of a series, after it is unpacked.
+    """
+    assay = django_filters.ModelChoiceFilter(
+        name='measurement__assay',
+        queryset=models.Assay.objects.all(),
+    )
+    created_before = django_filters.IsoDateTimeFilter(
+        name='updated__mod_time',
+        lookup_expr='lte',
+    )
+    created_after = django_filters.IsoDateTimeFilter(
+        name='updated__mod_time',
+        lookup_expr='gte',
+    )
+    line = django_filters.ModelChoiceFilter(
+        name='measurement__assay__line',
+        queryset=models.Line.objects.all(),
+    )
+
+    class Meta:
+        model = models.MeasurementSeries
+        fields = {'measurement': ['exact', 'in']}
+
+
+# maps the range parameters of MeasurementValueFilter to the axis and comparison of each point
+POINT_BOUNDS = {
+    'x__gt': ('x', operator.ge),
+    'x__lt': ('x', operator.le),
+    'y__gt': ('y', operator.ge),
+    'y__lt': ('y', operator.le),
+}
+
+
+class PackedValueList(object):
+    """
+    A sequence of MeasurementValue records, followed by unsaved MeasurementValue objects unpacked
+    from MeasurementSeries, so packed measurements are paginated like any other values. Series are
+    only unpacked when counting, or when a page reaches past the end of the saved records.
+    """
+
+    def __init__(self, values, series, bounds=None):
+        self._values = values
+        self._series = series
+        self._bounds = bounds or {}
+        self._values_count = None
+        self._unpacked = None
+
+    def count(self):
+        return self._count_values() + len(self._unpack())
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        # only slices are used in pagination
+        values_count = self._count_values()
+        start, stop = index.start or 0, index.stop
+        items = list(self._values[start:min(stop, values_count)]) if start < values_count else []
+        items.extend(self._unpack()[max(start - values_count, 0):max(stop - values_count, 0)])
+        return items
+
+    def _count_values(self):
+        if self._values_count is None:
+            self._values_count = self._values.count()
+        return self._values_count
+
+    def _in_bounds(self, value):
+        for key, (axis, compare) in POINT_BOUNDS.items():
+            limit = self._bounds.get(key, None)
+            if limit is not None:
+                point = getattr(value, axis)
+                # like the database filters, a point without a value is never in bounds
+                if not point or not compare(point[0], float(limit)):
+                    return False
+        return True
+
+    def _unpack(self):
+        if self._unpacked is None:
+            self._unpacked = []
+            for series in self._series:
+                for value in series.to_values():
+                    if self._in_bounds(value):
+                        value.updated = series.updated
+                        self._unpacked.append(value)
+        return self._unpacked
+
+
 class ValuesFilterMixin(StudyInternalsFilterMixin):
     filter_class = MeasurementValueFilter
     serializer_class = serializers.MeasurementValueSerializer
@@ -349,6 +446,30 @@ class ValuesFilterMixin(StudyInternalsFilterMixin):
     def get_queryset(self):
         return models.MeasurementValue.objects.order_by('pk').select_related('updated')
 
+    def get_series_queryset(self):
+        return models.MeasurementSeries.objects.order_by('pk').select_related('updated')
+
+    def list(self, request, *args, **kwargs):
+        # packed measurements have no MeasurementValue records, their series are listed after
+        values = self.filter_queryset(self.get_queryset())
+        series = MeasurementSeriesFilter(
+            request.query_params,
+            queryset=self.get_series_queryset(),
+        ).qs
+        series = self.filter_visible(series)
+        form = MeasurementValueFilter(request.query_params).form
+        if form.is_valid():
+            bounds = form.cleaned_data
+        else:
+            bounds, series = {}, series.none()
+        combined = PackedValueList(values, series, bounds)
+        page = self.paginate_queryset(combined)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(combined[0:len(combined)], many=True)
+        return response.Response(serializer.data)
+
 
 class MeasurementValuesViewSet(ValuesFilterMixin, viewsets.ReadOnlyModelViewSet):
     """
@@ -365,6 +486,10 @@ class StudyValuesViewSet(ValuesFilterMixin, viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         return super(StudyValuesViewSet, self).get_queryset().filter(self.get_nested_filter())
 
+    def get_series_queryset(self):
+        qs = super(StudyValuesViewSet, self).get_series_queryset()
+        return qs.filter(self.get_nested_filter())
+
 
 class MeasurementTypesFilter(filters.FilterSet):
     type_name = django_filters.CharFilter(name='type_name', lookup_expr='iregex')
@@ -55,6 +55,12 @@ ICE_ADMIN_ACCOUNT = env('ICE_ADMIN_USER', default='Administrator')
 ICE_URL = env('ICE_URL', default='https://registry-test.jbei.org/')
 # HTTP request connection and read timeouts, respectively (seconds)
 ICE_REQUEST_TIMEOUT = (10, 10)
+# maximum number of concurrent requests to ICE when looking up parts in an experiment description
+EDD_ICE_LOOKUP_WORKERS = 8
+# seconds to cache ICE entries in Redis; set to 0 to always request entries from ICE
+EDD_ICE_ENTRY_CACHE_TTL = 86400
+# seconds before a cached ICE entry is refreshed in the background; None to never refresh
+EDD_ICE_ENTRY_REFRESH = 3600
 
 # Be very careful in changing this value!! Useful to avoid heachaches in *LOCAL* testing against a
 # non-TLS ICE deployment. Also barring another solution, useful as a temporary/risky workaround for
@@ -68,12 +74,23 @@ VERIFY_ICE_CERT = True
 # specify the name of the JSON serializer in use
 EDD_SERIALIZE_NAME = 'edd-json'
 
+# number of data series committed in each transaction by the background table import task
+EDD_IMPORT_CHUNK_SIZE = 50
+# seconds the output of a background export remains available for download
+EDD_EXPORT_TTL = 86400
+
 ##############################
 # Solr/Haystack Configuration
 ##############################
 EDD_MAIN_SOLR = {
     'default': env.search_url(default='solr://solr:8983/solr/'),
 }
+# number of documents sent in each request by the task draining the queue of Solr changes
+EDD_SOLR_BATCH_SIZE = 1000
+# milliseconds Solr may wait to commit queued changes
+EDD_SOLR_COMMIT_WITHIN = 10000
+# seconds to cache results of Solr searches
+EDD_SEARCH_CACHE_TTL = 10
 
 
 # most of these just explicitly set the Django defaults, but since it affects Django, Celery, and
@@ -26,6 +26,23 @@ CELERY_TASK_DEFAULT_ROUTING_KEY = 'edd'
 CELERY_TASK_PUBLISH_RETRY = False
 
 
+###################################################################################################
+# Periodic tasks sent by celery beat
+###################################################################################################
+CELERY_BEAT_SCHEDULE = {
+    # send queued changes to Solr every 10 seconds
+    'drain-solr-queue': {
+        'task': 'main.tasks.drain_solr_queue',
+        'schedule': 10.0,
+    },
+    # remove expired background export files every hour
+    'expire-exports': {
+        'task': 'main.tasks.expire_exports',
+        'schedule': 3600.0,
+    },
+}
+
+
 ###################################################################################################
 # Configure database backend to store task state and results
 ###################################################################################################
@@ -0,0 +1,119 @@
+# coding: utf-8
+from __future__ import absolute_import, division, unicode_literals
+
+"""
+Functions to reduce the number of points in a time-series, for storing and plotting dense curves.
+Each method takes parallel sequences of x- and y-values, sorted by x, and returns the sorted
+indices of at most max_points points to keep. The first and last points are always kept.
+"""
+
+
+def stride(x, y, max_points):
+    """ Keeps evenly-spaced points, ignoring y-values. """
+    n = len(x)
+    if max_points >= n:
+        return list(range(n))
+    if max_points < 2:
+        return [0]
+    step = (n - 1) / (max_points - 1)
+    return sorted({int(round(i * step)) for i in range(max_points)})
+
+
+def minmax(x, y, max_points):
+    """ Splits points into buckets, keeping the minimum and maximum y-value in each bucket. """
+    n = len(x)
+    if max_points >= n:
+        return list(range(n))
+    if max_points < 4:
+        return stride(x, y, max_points)
+    # one bucket each for the first and last points, then a min and a max for each other bucket
+    buckets = (max_points - 2) // 2
+    size = (n - 2) / buckets
+    keep = {0, n - 1}
+    for b in range(buckets):
+        bucket = range(int(b * size) + 1, int((b + 1) * size) + 1)
+        keep.add(min(bucket, key=y.__getitem__))
+        keep.add(max(bucket, key=y.__getitem__))
+    return sorted(keep)
+
+
+def lttb(x, y, max_points):
+    """
+    Largest-Triangle-Three-Buckets: splits points into buckets, keeping the point in each bucket
+    forming the largest triangle with the point kept from the previous bucket and the average of
+    the next bucket. Preserves the visual shape of a curve better than the other methods.
+    """
+    n = len(x)
+    if max_points >= n:
+        return list(range(n))
+    if max_points < 3:
+        return stride(x, y, max_points)
+    size = (n - 2) / (max_points - 2)
+    keep = [0]
+    a = 0
+    for b in range(max_points - 2):
+        # average of the following bucket; for the last bucket, this is the last point
+        next_start = int((b + 1) * size) + 1
+        next_end = min(int((b + 2) * size) + 1, n)
+        span = next_end - next_start
+        avg_x = sum(x[next_start:next_end]) / span
+        avg_y = sum(y[next_start:next_end]) / span
+        # find the point in this bucket making the largest triangle
+        ax, ay = x[a], y[a]
+        # undefined (NaN) areas never compare greater, then the first point in bucket is kept
+        a = int(b * size) + 1
+        best_area = -1
+        for i in range(a, next_start):
+            area = abs((ax - avg_x) * (y[i] - ay) - (ax - x[i]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                a = i
+        keep.append(a)
+    keep.append(n - 1)
+    return keep
+
+
+# maps names used in options and request parameters to the downsampling functions
+METHODS = {
+    'lttb': lttb,
+    'minmax': minmax,
+    'stride': stride,
+}
+DEFAULT_METHOD = 'lttb'
+
+
+def downsample(x, y, max_points, method=DEFAULT_METHOD):
+    """
+    Finds the points to keep from a time-series.
+
+    :param x: sequence of x-values, sorted
+    :param y: sequence of numeric y-values, matching x
+    :param max_points: the maximum number of points to keep; None or less than one keeps all
+        points
+    :param method: a key in METHODS, or a function with the same signature as those in METHODS
+    :return: sorted list of indices of the points to keep
+    :raises ValueError: if method is not a known method name
+    """
+    if max_points is None or max_points < 1 or len(x) <= max_points:
+        return list(range(len(x)))
+    if not callable(method):
+        try:
+            method = METHODS[method]
+        except KeyError:
+            raise ValueError('Unknown downsampling method %s' % method)
+    return method(x, y, max_points)
+
+
+def thin_points(points, max_points, method=DEFAULT_METHOD):
+    """
+    Downsamples a list of [x, y] pairs with numeric values.
+
+    :return: a list of the kept [x, y] pairs sorted by x, or the original list when nothing is
+        removed
+    """
+    if max_points is None or max_points < 1 or len(points) <= max_points:
+        return points
+    points = sorted(points, key=lambda p: p[0])
+    x = [float(p[0]) for p in points]
+    y = [float(p[1]) for p in points]
+    return [points[i] for i in downsample(x, y, max_points, method)]
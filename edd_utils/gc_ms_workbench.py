@@ -47,7 +47,8 @@ def process_gc_ms_form_and_parse_file (form, file) :
   auto_peaks = (form.get("auto_peaks") == "auto")
   if (auto_peaks) :
     return result.find_peaks_automatically_and_export(
-      include_headers=True)
+      include_headers=True,
+      cross_validate=(form.get("cross_validate") == "1"))
   else :
     n_mols = extract_integers_from_form(form, "n_mols")
     rt_std_min = extract_floats_from_form(form, "rt_standard_min")
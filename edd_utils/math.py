@@ -8,22 +8,103 @@ Additional utility functions for processing GC-MS data.  Probably unnecessary.
 import numpy as np
 import sys
 
-from scipy.stats import gaussian_kde
-from sklearn.model_selection import GridSearchCV
-from sklearn.neighbors import KernelDensity
+
+SQRT_2PI = np.sqrt(2 * np.pi)
 
 
-# http://stackoverflow.com/a/17909007
 def local_maxima(xval, yval):
-    xval = np.asarray(xval)
-    yval = np.asarray(yval)
-    sort_idx = np.argsort(xval)
-    yval = yval[sort_idx]
-    gradient = np.diff(yval)
-    maxima = np.diff((gradient > 0).view(np.int8))
-    return np.concatenate((([0],) if gradient[0] < 0 else ()) +
-                          (np.where(maxima == -1)[0] + 1,) +
-                          (([len(yval)-1],) if gradient[-1] > 0 else ()))
+    """
+    Finds the indices of local maxima in yval, with points ordered by xval.  The first and last
+    points count as maxima when higher than their single neighbor.
+    """
+    order = np.argsort(xval)
+    yval = np.asarray(yval)[order]
+    if len(yval) < 2:
+        return order
+    rising = np.concatenate(([False], yval[1:] > yval[:-1]))
+    falling = np.concatenate((yval[:-1] >= yval[1:], [False]))
+    ends = np.zeros(len(yval), dtype=bool)
+    ends[0] = yval[0] > yval[1]
+    ends[-1] = yval[-1] > yval[-2]
+    return order[np.flatnonzero((rising & falling) | ends)]
+
+
+def _bin_counts(x, x_grid):
+    """ Linear binning of values onto an evenly-spaced grid containing all the values. """
+    m = len(x_grid)
+    position = (x - x_grid[0]) / (x_grid[1] - x_grid[0])
+    lower = np.clip(np.floor(position).astype(int), 0, m - 2)
+    fraction = position - lower
+    return np.bincount(lower, 1 - fraction, m) + np.bincount(lower + 1, fraction, m)
+
+
+def _kernel_transforms(x_grid, bandwidths):
+    """ Fourier transforms of Gaussian kernels for each bandwidth, padded against wrap-around. """
+    size = 2 * len(x_grid)
+    lags = np.arange(size)
+    lags = np.minimum(lags, size - lags) * (x_grid[1] - x_grid[0])
+    bandwidths = np.asarray(bandwidths)[:, None]
+    kernels = np.exp(-0.5 * (lags / bandwidths) ** 2) / (bandwidths * SQRT_2PI)
+    return np.fft.rfft(kernels, axis=1)
+
+
+def _binned_density(counts, kernel_transforms, n):
+    """ Evaluates the kernel density of binned counts of n values, for each kernel. """
+    m = len(counts)
+    transform = np.fft.rfft(counts, 2 * m)
+    return np.fft.irfft(transform * kernel_transforms, 2 * m, axis=-1)[..., :m] / n
+
+
+def binned_kde(x, x_grid, bandwidth):
+    """
+    Gaussian kernel density estimate of x evaluated on the evenly-spaced x_grid, approximated by
+    convolving linearly-binned counts with the kernel using FFT.  Takes time proportional to the
+    grid size, instead of the product of the grid size and the number of values.
+    """
+    x = np.asarray(x, dtype=float)
+    counts = _bin_counts(x, x_grid)
+    return _binned_density(counts, _kernel_transforms(x_grid, [bandwidth]), len(x))[0]
+
+
+def binned_cv_bandwidth(x, x_grid, bandwidths, folds=20, neighbors=8):
+    """
+    Selects the bandwidth with the best held-out log-likelihood in k-fold cross-validation, the
+    same criterion as GridSearchCV(KernelDensity(), ...), using binned FFT densities.  Densities
+    too small to resolve from the binned estimate are computed exactly from the nearest training
+    values, as these outlying values are what penalize the smaller bandwidths.
+    """
+    x = np.asarray(x, dtype=float)
+    bandwidths = np.asarray(bandwidths, dtype=float)
+    n = len(x)
+    if n < 2:
+        return bandwidths[-1]
+    kernel_transforms = _kernel_transforms(x_grid, bandwidths)
+    total_counts = _bin_counts(x, x_grid)
+    scores = np.zeros(len(bandwidths))
+    for fold in np.array_split(np.arange(n), min(folds, n)):
+        held_out = x[fold]
+        train = np.sort(np.delete(x, fold))
+        counts = total_counts - _bin_counts(held_out, x_grid)
+        densities = _binned_density(counts, kernel_transforms, len(train))
+        for i, bandwidth in enumerate(bandwidths):
+            density = np.interp(held_out, x_grid, densities[i])
+            log_density = np.log(np.maximum(density, np.finfo(float).tiny))
+            far = density < densities[i].max() * 1e-8
+            if far.any():
+                log_density[far] = _nearest_log_density(held_out[far], train, bandwidth, neighbors)
+            scores[i] += log_density.sum()
+    return bandwidths[np.argmax(scores)]
+
+
+def _nearest_log_density(x, train, bandwidth, neighbors):
+    """ Log of Gaussian kernel density at x, using only the nearest values from sorted train. """
+    index = np.searchsorted(train, x)[:, None] + np.arange(-neighbors, neighbors)
+    valid = (index >= 0) & (index < len(train))
+    distance = x[:, None] - train[np.clip(index, 0, len(train) - 1)]
+    log_kernel = np.where(valid, -0.5 * (distance / bandwidth) ** 2, -np.inf)
+    top = log_kernel.max(axis=1)
+    log_sum = top + np.log(np.exp(log_kernel - top[:, None]).sum(axis=1))
+    return log_sum - np.log(len(train) * bandwidth * SQRT_2PI)
 
 
 def extract_peaks(max_values, pdf_max, n_expected=None, out=sys.stdout, err=sys.stderr):
@@ -50,6 +131,7 @@ def find_consensus_values(
         bandwidth_auto=True,
         min_bandwidth=0.02,     # XXX This is GC-MS specific
         default_bandwidth=0.1,  # XXX This too
+        cross_validate=False,
         show_plot=False,
         out=sys.stdout,
         err=sys.stderr):
@@ -57,28 +139,39 @@ def find_consensus_values(
     Use kernel density estimation to analyze the distribution of data points
     along the X-axis, and identify consensus values for major clusters.  This
     is used to identify common peaks in a set of related GC-MS samples.
+
+    With bandwidth_auto, the bandwidth is selected by 20-fold cross-validation
+    from 30 values between min_bandwidth and 0.1, scored on binned FFT density
+    estimates.  Set cross_validate to instead fit every candidate with
+    scikit-learn GridSearchCV, which is much slower on large batches.
     """
     if isinstance(x, list):
         x = np.array(x)
     x_grid = np.linspace(x.min() - 0.25, x.max() + 0.25, 1000)
-    if bandwidth_auto:
+    bandwidths = np.linspace(min_bandwidth, 0.1, 30)
+    if bandwidth_auto and cross_validate:
+        # delayed loading of scikit-learn, it is slow to import and only used here
+        from sklearn.model_selection import GridSearchCV
+        from sklearn.neighbors import KernelDensity
         # http://jakevdp.github.io/blog/2013/12/01/kernel-density-estimation/
         grid = GridSearchCV(KernelDensity(),
-                            {'bandwidth': np.linspace(min_bandwidth, 0.1, 30)},
+                            {'bandwidth': bandwidths},
                             cv=20)  # 20-fold cross-validation
         grid.fit(x[:, None])
         bandwidth = grid.best_params_['bandwidth']
         print("Best bandwidth: %.4f" % bandwidth, file=err)
-        kde = grid.best_estimator_
-        pdf = np.exp(kde.score_samples(x_grid[:, None]))
+        pdf = np.exp(grid.best_estimator_.score_samples(x_grid[:, None]))
+    elif bandwidth_auto:
+        bandwidth = binned_cv_bandwidth(x, x_grid, bandwidths)
+        print("Best bandwidth: %.4f" % bandwidth, file=err)
+        pdf = binned_kde(x, x_grid, bandwidth)
     else:
+        from scipy.stats import gaussian_kde
         bandwidth = default_bandwidth
         kde = gaussian_kde(x)
         pdf = kde.evaluate(x_grid)
     i_maxima = local_maxima(x_grid, pdf)
-    max_values = []
-    for i_max in i_maxima:
-        max_values.append((x_grid[i_max], pdf[i_max]))
+    max_values = list(zip(x_grid[i_maxima], pdf[i_maxima]))
     # sort maxima by value in distribution
     max_values.sort(key=lambda x: x[1], reverse=True)
     pdf_max = pdf.max()
@@ -92,11 +185,11 @@ def find_consensus_values(
     if show_plot:
         import matplotlib.pyplot as plt
         fig, ax = plt.subplots()
-        ax.plot(x_grid, pdf, linewidth=3, alpha=0.5, label='bw=%.2f' % kde.bandwidth)
+        ax.plot(x_grid, pdf, linewidth=3, alpha=0.5, label='bw=%.2f' % bandwidth)
         ax.hist(x, 50, fc='gray', histtype='stepfilled', alpha=0.3, normed=True)
         for rt, pdf_val in major_peaks:
             ax.axvline(rt, color='red')
             ax.axvline(rt-bandwidth, color='magenta')
             ax.axvline(rt+bandwidth, color='magenta')
         plt.show()
-    return [xval for xval, yval in major_peaks], float(bandwidth)
+    return [float(xval) for xval, yval in major_peaks], float(bandwidth)
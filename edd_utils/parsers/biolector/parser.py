@@ -7,11 +7,13 @@ Step 2 of the EDD Data Table Import page.
 
 from __future__ import unicode_literals
 
+from array import array
 from builtins import str
-from xml.dom import pulldom
-from xml.sax import handler
-from xml.sax.expatreader import ExpatParser as _ExpatParser
+from collections import deque
 from django.utils import six
+from future.utils import native_str
+from xml.parsers import expat
+from ...downsample import DEFAULT_METHOD, downsample
 from ..util import RawImportRecord
 
 import logging
@@ -19,256 +21,254 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# bytes read from the stream between checks for completed records
+CHUNK_SIZE = 1 << 16
+# array typecode for double-precision floats; must be a native str in Python 2
+_DOUBLE = native_str('d')
+
 
 class XMLImportError(Exception):
     """Something bad happened during deserialization."""
 
 
-def getRawImportRecordsAsJSON(stream_or_string, thin=0):
-    return [item.to_json() for item in BiolectorXMLReader(stream_or_string, thin=thin)]
+def getRawImportRecordsAsJSON(stream_or_string, thin=0, thin_method=DEFAULT_METHOD):
+    reader = BiolectorXMLReader(stream_or_string, thin=thin, thin_method=thin_method)
+    return [item.to_json() for item in reader]
 
 
 class BiolectorXMLReader(six.Iterator):
     """
     Given a Biolector XML document as a stream or string, translate it into a series of
-    RawImportRecord objects.
+    RawImportRecord objects. With a non-zero thin option, each curve is downsampled to at most
+    that many points, using the edd_utils.downsample method named in the thin_method option.
+
+    The document is fed to a hardened expat parser in chunks, and the parser callbacks run a small
+    state machine building records. Records are yielded as each Fermentation element closes, so
+    only a fragment of the input and the points of one Fermentation are in memory at a time; this
+    handles Biolector xml files in the hundreds-of-megabytes without trouble.
     """
 
     def __init__(self, stream_or_string, **options):
-
-        self.rawImportRecordBuffer = []
         self.options = options
         if isinstance(stream_or_string, six.string_types):
             self.stream = six.StringIO(stream_or_string)
         else:
             self.stream = stream_or_string
-
-        self.event_stream = pulldom.parse(self.stream, self._make_parser())
         self.thin = options.pop('thin', 0)
+        self.thin_method = options.pop('thin_method', DEFAULT_METHOD)
+        self._records = self._parse()
 
-    def _make_parser(self):
-        """Create a hardened XML parser (no custom/external entities)."""
-        return DefusedExpatParser()
+    def __iter__(self):
+        return self
 
     def __next__(self):
-        # If we have a built RawImportRecord in the buffer, return it.
-        if len(self.rawImportRecordBuffer) > 0:
-            return self.rawImportRecordBuffer.pop()
-
-        # If the buffer is empty, we add a new chunk of RawImportRecord objects to it, by rolling
-        # through this ugly finite state machine until we hit the closing of a Fermentation element.
-        # (RawImportRecords are most easy to create in quantity, since a Fermentation node contains
-        # many record' worth of measurements, and contains a Line name and metadata that applies to
-        # all of them.)
-
-        # Accumulated at the Fermantation element level
-        line_name = None
-        well = None
-        wellindex = None
-        content = None
-        # We turn this flag on when we're inside a '<CalibratedData>' element.
-        # That way we ignore any accumulated curve data that's inside a '<RawData>' element.
-        calibrated_data = False
-
-        # A template for metadata for each RawImportRecord, embedded en-masse at the close of a
-        # Fermantation element
-        metaData = {}
+        return next(self._records)
+
+    def _make_parser(self, encoding=None):
+        """
+        Create a hardened XML parser (no DTDs, custom/external entities). A non-empty encoding
+        overrides the encoding declared in the document.
+        """
+        parser = expat.ParserCreate(encoding)
+        parser.SetParamEntityParsing(expat.XML_PARAM_ENTITY_PARSING_NEVER)
+        parser.StartDoctypeDeclHandler = _forbid_doctype
+        parser.EntityDeclHandler = _forbid_entity
+        parser.UnparsedEntityDeclHandler = _forbid_unparsed_entity
+        parser.ExternalEntityRefHandler = _forbid_external_reference
+        parser.buffer_text = True
+        return parser
+
+    def _parse(self):
+        state = _FermentationState(self.thin, self.thin_method)
+        try:
+            chunk = self.stream.read(CHUNK_SIZE)
+            # bytes are fed unchanged for expat to decode with the declared encoding; text is
+            #   already decoded, so expat must read its UTF-8 form regardless of the declaration
+            text = isinstance(chunk, six.text_type)
+            parser = self._make_parser('utf-8' if text else None)
+            parser.StartElementHandler = state.start_element
+            parser.EndElementHandler = state.end_element
+            parser.CharacterDataHandler = state.characters
+            while True:
+                parser.Parse(chunk.encode('utf-8') if text else chunk, not chunk)
+                while state.records:
+                    yield state.records.popleft()
+                if not chunk:
+                    break
+                chunk = self.stream.read(CHUNK_SIZE)
+        except expat.ExpatError as e:
+            raise XMLImportError('Biolector XML could not be parsed: %s' % e)
+
+
+class _CurveRecord(RawImportRecord):
+    """
+    A RawImportRecord for a Biolector Curve, keeping the points in numeric arrays until the record
+    is converted to JSON.
+    """
 
-        # Accumulated at the Curve level
-        assay_name = None
-        measurement = None
-        new_import_record_buffer = []
+    def __init__(self, name, assay_name, metadata):
+        super(_CurveRecord, self).__init__('biolector', name, None, assay_name, [], metadata)
 
-        # Accumulated at the CurvePoint level
-        runtime = None
-        numeric_value = None
-        measurement_point_buffer = []
-
-        # Accumulated everywhere, whenever we encounter a text node in the document
-        temp_string_buffer = []
-        temp_string = ''
-
-        # Note that this code used to be written to leverage the 'expandNode' method.
-        # Well, 'expandNode' has a serious problem with fully populating grandchild nodes, and
-        # calling it on END_ELEMENT instead of START_ELEMENT often causes Python to iterate back
-        # on itself and dump core.
-        # Furthermore, one can't rely on a node's children or text elements of children to be
-        # populated when hitting an END_ELEMENT event, so we have to watch for each element
-        # individually and keep our own state to track where it is.
-        # On top of that, the CHARACTERS event is not guaranteed to handle entire text nodes at
-        # once, so we need to buffer sequential CHARACTERS events until we get some other event,
-        # then join and wipe the buffer.
-
-        # It's a lot of pain to work around, but the end result is, we can build a nice compact
-        # data-structure without ever keeping more than a tiny fragment of the input file in memory
-        # at a time, so we can handle Biolector xml files in the hundreds-of-megabytes without
-        # trouble.
-
-        for event, node in self.event_stream:
-            if event == pulldom.CHARACTERS:
-                temp_string_buffer.append(node.nodeValue)
-                continue
-            temp_string = ''.join(temp_string_buffer)
-            temp_string_buffer = []
-
-            if event == pulldom.START_ELEMENT and node.nodeName == "CalibratedData":
-                calibrated_data = True
-            if event == pulldom.END_ELEMENT and node.nodeName == "CalibratedData":
-                calibrated_data = False
-
-            if event == pulldom.END_ELEMENT and node.nodeName == "Description":
-                line_name = temp_string
-
-            # Accumulating the metadata structure
-            if event == pulldom.END_ELEMENT and node.nodeName == "Well":
-                well = temp_string
-                if well is not None and well != "":
-                    metaData["Bio:well"] = well
-            if event == pulldom.END_ELEMENT and node.nodeName == "WellIndex":
-                wellindex = temp_string
-                if wellindex is not None and wellindex != "":
-                    metaData["Bio:well index"] = wellindex
-            if event == pulldom.END_ELEMENT and node.nodeName == "Content":
-                content = temp_string
-                if content is not None and content != "":
-                    metaData["Bio:well content"] = content
-
-            if event == pulldom.END_ELEMENT and node.nodeName == "Key":
-                measurement = temp_string
-            if event == pulldom.END_ELEMENT and node.nodeName == "Name":
-                assay_name = temp_string
-            if event == pulldom.END_ELEMENT and node.nodeName == "Curve":
-                if calibrated_data:
-                    # At the end of each Curve element, we dump our accumulated measurements into
-                    # a new RawImportRecord.
-                    new_import_record_buffer.append(
-                        RawImportRecord("biolector", measurement, line_name, assay_name,
-                                        measurement_point_buffer, metaData)
-                    )
-                measurement_point_buffer = []
-
-            # At the close of every CurvePoint we append a measurement point to our buffer
-            if event == pulldom.END_ELEMENT and node.nodeName == "RunTime":
-                runtime = temp_string
-            if event == pulldom.END_ELEMENT and node.nodeName == "NumericValue":
-                numeric_value = temp_string
-            if event == pulldom.END_ELEMENT and node.nodeName == "CurvePoint":
-                measurement_point_buffer.append([runtime, numeric_value])
-                # This is not technically neccessary but is good housekeeping
-                runtime = None
-                numeric_value = None
-
-            # At the end of a Fermentation element, we run back over the accumulated list
-            # of new RawImportRecord objects and finalize their names.
-            if event == pulldom.END_ELEMENT and node.nodeName == "Fermentation":
-                if line_name is None or line_name == "":
-                    line_name = ' '.join([content, well, wellindex])
-                for new_import_record in new_import_record_buffer:
-                    new_import_record.line_name = line_name
-                self.rawImportRecordBuffer.extend(new_import_record_buffer)
-                new_import_record_buffer = []
-                metaData = {}
-                if len(self.rawImportRecordBuffer) > 0:
-                    return self.rawImportRecordBuffer.pop()
-
-            # If we haven't used the temp_string during the non-CHARACTERS event directly
-            # following it, we should consider it stale and discard it.
-            # At first this may seem overly restrictive but it actually makes sense.
-            temp_string = ''
-
-        # If buffer is empty and the stream is empty, we're done.
-        raise StopIteration
+    @property
+    def data(self):
+        return [[t, v] for t, v in zip(self.times, self.values)]
 
-    def __iter__(self):
-        return self
+    @data.setter
+    def data(self, points):
+        self.times = array(_DOUBLE, (point[0] for point in points))
+        self.values = array(_DOUBLE, (point[1] for point in points))
 
 
-def getTextInSubElement(node, name, default):
-    for sub_node in node.getElementsByTagName(name):
-        return getInnerText(sub_node)
-    return default
-
-
-#
-# Code below lifted from /django/core/serializers/xml_serializer.py
-#
-
-# Copyright (c) Django Software Foundation and individual contributors.
-# All rights reserved.
-#
-# Redistribution and use in source and binary forms, with or without modification,
-# are permitted provided that the following conditions are met:
-#
-#    1. Redistributions of source code must retain the above copyright notice,
-#       this list of conditions and the following disclaimer.
-#
-#    2. Redistributions in binary form must reproduce the above copyright
-#       notice, this list of conditions and the following disclaimer in the
-#       documentation and/or other materials provided with the distribution.
-#
-#    3. Neither the name of Django nor the names of its contributors may be used
-#       to endorse or promote products derived from this software without
-#       specific prior written permission.
-#
-# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
-# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
-# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
-# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
-# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
-# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
-# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
-# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
-# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
-# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
-
-
-def getInnerText(node):
+class _FermentationState(object):
     """
-    Get all the inner text of a DOM node (recursively).
+    Tracks the position in a Biolector document, collecting a RawImportRecord for each calibrated
+    Curve in a Fermentation element. Points are accumulated into numeric arrays, and only for
+    Curves inside a CalibratedData element; those inside RawData are ignored.
     """
-    # inspired by http://mail.python.org/pipermail/xml-sig/2005-March/011022.html
-    inner_text = []
-    for child in node.childNodes:
-        if child.nodeType == child.TEXT_NODE or child.nodeType == child.CDATA_SECTION_NODE:
-            inner_text.append(child.data)
-        elif child.nodeType == child.ELEMENT_NODE:
-            inner_text.extend(getInnerText(child))
-        else:
-            pass
-    return "".join(inner_text)
-
 
-class DefusedExpatParser(_ExpatParser):
-    """
-    An expat parser hardened against XML bomb attacks.
-    Forbids DTDs, external entity references
-    """
-    def __init__(self, *args, **kwargs):
-        _ExpatParser.__init__(self, *args, **kwargs)
-        self.setFeature(handler.feature_external_ges, False)
-        self.setFeature(handler.feature_external_pes, False)
-
-    def start_doctype_decl(self, name, sysid, pubid, has_internal_subset):
-        raise DTDForbidden(name, sysid, pubid)
-
-    def entity_decl(self, name, is_parameter_entity, value, base,
-                    sysid, pubid, notation_name):
-        raise EntitiesForbidden(name, value, base, sysid, pubid, notation_name)
-
-    def unparsed_entity_decl(self, name, base, sysid, pubid, notation_name):
-        # expat 1.2
-        raise EntitiesForbidden(name, None, base, sysid, pubid, notation_name)
-
-    def external_entity_ref_handler(self, context, base, sysid, pubid):
-        raise ExternalReferenceForbidden(context, base, sysid, pubid)
-
-    def reset(self):
-        _ExpatParser.reset(self)
-        parser = self._parser
-        parser.StartDoctypeDeclHandler = self.start_doctype_decl
-        parser.EntityDeclHandler = self.entity_decl
-        parser.UnparsedEntityDeclHandler = self.unparsed_entity_decl
-        parser.ExternalEntityRefHandler = self.external_entity_ref_handler
+    def __init__(self, thin=0, thin_method=DEFAULT_METHOD):
+        self._thin = thin
+        self._thin_method = thin_method
+        # completed records, ready to yield
+        self.records = deque()
+        # text of the element being closed; character data is buffered until the next event
+        self._text = []
+        # Accumulated at the Fermentation element level
+        self._line_name = None
+        self._metadata = {}
+        self._well = {}
+        self._curves = []
+        self._calibrated = False
+        # Accumulated at the Curve level
+        self._assay_name = None
+        self._measurement = None
+        self._times = array(_DOUBLE)
+        self._values = array(_DOUBLE)
+        # Accumulated at the CurvePoint level
+        self._runtime = None
+        self._value = None
+        self._end_handlers = {
+            'CalibratedData': self._end_calibrated,
+            'Content': self._end_content,
+            'Curve': self._end_curve,
+            'CurvePoint': self._end_point,
+            'Description': self._end_description,
+            'Fermentation': self._end_fermentation,
+            'Key': self._end_key,
+            'Name': self._end_name,
+            'NumericValue': self._end_value,
+            'RunTime': self._end_runtime,
+            'Well': self._end_well,
+            'WellIndex': self._end_well_index,
+        }
+
+    def characters(self, data):
+        self._text.append(data)
+
+    def start_element(self, name, attrs):
+        self._text = []
+        if name == 'CalibratedData':
+            self._calibrated = True
+
+    def end_element(self, name):
+        handler = self._end_handlers.get(name, None)
+        if handler is not None:
+            handler(''.join(self._text))
+        self._text = []
+
+    def _end_calibrated(self, text):
+        self._calibrated = False
+
+    def _end_content(self, text):
+        self._set_well('content', 'Bio:well content', text)
+
+    def _end_curve(self, text):
+        if self._calibrated:
+            record = _CurveRecord(self._measurement, self._assay_name, self._metadata)
+            times, values = self._times, self._values
+            keep = downsample(times, values, self._thin, self._thin_method)
+            if len(keep) < len(times):
+                times = array(_DOUBLE, (times[i] for i in keep))
+                values = array(_DOUBLE, (values[i] for i in keep))
+            record.times, record.values = times, values
+            self._curves.append(record)
+        self._times = array(_DOUBLE)
+        self._values = array(_DOUBLE)
+
+    def _end_description(self, text):
+        self._line_name = text
+
+    def _end_fermentation(self, text):
+        # At the end of a Fermentation element, finalize the names of the accumulated records
+        line_name = self._line_name
+        if not line_name:
+            line_name = ' '.join(
+                self._well.get(key, '') for key in ('content', 'well', 'wellindex')
+            )
+        for record in self._curves:
+            record.line_name = line_name
+        self.records.extend(self._curves)
+        self._curves = []
+        self._line_name = None
+        self._metadata = {}
+        self._well = {}
+
+    def _end_key(self, text):
+        self._measurement = text
+
+    def _end_name(self, text):
+        self._assay_name = text
+
+    def _end_point(self, text):
+        # skip points without a number for both time and value; there is nothing to plot
+        if self._calibrated and self._runtime is not None and self._value is not None:
+            self._times.append(self._runtime)
+            self._values.append(self._value)
+        self._runtime = None
+        self._value = None
+
+    def _end_runtime(self, text):
+        self._runtime = _to_float(text, self._calibrated)
+
+    def _end_value(self, text):
+        self._value = _to_float(text, self._calibrated)
+
+    def _end_well(self, text):
+        self._set_well('well', 'Bio:well', text)
+
+    def _end_well_index(self, text):
+        self._set_well('wellindex', 'Bio:well index', text)
+
+    def _set_well(self, key, meta_name, text):
+        self._well[key] = text
+        if text:
+            self._metadata[meta_name] = text
+
+
+def _to_float(text, wanted=True):
+    if not wanted:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _forbid_doctype(name, sysid, pubid, has_internal_subset):
+    raise DTDForbidden(name, sysid, pubid)
+
+
+def _forbid_entity(name, is_parameter_entity, value, base, sysid, pubid, notation_name):
+    raise EntitiesForbidden(name, value, base, sysid, pubid, notation_name)
+
+
+def _forbid_unparsed_entity(name, base, sysid, pubid, notation_name):
+    # expat 1.2
+    raise EntitiesForbidden(name, None, base, sysid, pubid, notation_name)
+
+
+def _forbid_external_reference(context, base, sysid, pubid):
+    raise ExternalReferenceForbidden(context, base, sysid, pubid)
 
 
 class DefusedXmlException(ValueError):
@@ -10,9 +10,11 @@ from __future__ import division
 from optparse import OptionParser
 from cStringIO import StringIO
 import jsonpickle
+import numpy as np
 import re
 import os.path
 import sys
+import weakref
 
 re_signal_new =   re.compile("\s*Signal[\s]{1,}:\s{1,}(EIC|TIC).*:")
 re_area_sum =     re.compile("Sum\ of\ corrected\ areas:")
@@ -40,9 +42,48 @@ class Peak (object) :
   def format_short (self) :
     return "%d @ %.3fm" % (self.peak_area, self.retention_time)
 
+def search_grouped (groups, values, query_groups, query_values, side="left") :
+  """
+  Like numpy.searchsorted, for values sorted within contiguous groups that are
+  themselves sorted by group.  Finds the position of each query value among
+  the values of its query group, with a single sort of all values and queries.
+  """
+  n = len(values)
+  # a query sorts before (left) or after (right) any equal value
+  tie = np.zeros(n + len(query_values), dtype=np.int8)
+  tie[n:] = -1 if (side == "left") else 1
+  order = np.lexsort((tie,
+    np.concatenate((values, query_values)),
+    np.concatenate((groups, query_groups))))
+  is_query = (order >= n)
+  values_before = np.cumsum(~is_query)
+  positions = np.empty(len(query_values), dtype=np.intp)
+  positions[order[is_query] - n] = values_before[is_query]
+  return positions
+
+class _PeakIndex (object) :
+  """
+  Retention times and areas of the peaks in a sample, in sorted arrays, with a
+  running sum of areas so the area of any range is a difference of two sums.
+  """
+  def __init__ (self, peaks) :
+    times = np.array([ p.retention_time for p in peaks ], dtype=float)
+    areas = np.array([ p.peak_area for p in peaks ], dtype=np.int64)
+    # stable sort, so peaks with the same retention time stay in report order
+    self.order = np.argsort(times, kind="mergesort")
+    self.times = times[self.order]
+    self.areas = areas[self.order]
+    self.area_sums = np.concatenate(([0], np.cumsum(self.areas)))
+
+# indexes of sample peaks, built on first use; kept out of the samples, so the
+# jsonpickle export of a sample only holds its ID and peaks
+_peak_indexes = weakref.WeakKeyDictionary()
+
 class Sample (object) :
   """
-  Information about a sample run, with any number of peaks.
+  Information about a sample run, with any number of peaks.  Peaks are kept
+  in report order, and indexed by retention time in sorted arrays for range
+  queries.
   """
   def __init__ (self, lines, sample_id) :
     self.sample_id = sample_id
@@ -50,6 +91,28 @@ class Sample (object) :
     for line in lines :
       self.peaks.append(Peak(line))
 
+  def _peak_index (self) :
+    index = _peak_indexes.get(self)
+    if (index is None) :
+      index = _peak_indexes[self] = _PeakIndex(self.peaks)
+    return index
+
+  @property
+  def peak_order (self) :
+    return self._peak_index().order
+
+  @property
+  def sorted_times (self) :
+    return self._peak_index().times
+
+  @property
+  def sorted_areas (self) :
+    return self._peak_index().areas
+
+  @property
+  def _area_sums (self) :
+    return self._peak_index().area_sums
+
   def __str__ (self) :
     return "Sample ID: %s\n%s" % (self.sample_id,
       "\n".join([ "  " + str(p) for p in self.peaks ]))
@@ -57,39 +120,55 @@ class Sample (object) :
   def retention_times (self) :
     return [ p.retention_time for p in self.peaks ]
 
+  def find_peak_ranges (self, rt_min, rt_max) :
+    """
+    Locates peaks with rt_min <= retention time <= rt_max, for scalar or
+    array range bounds.  Returns the start and end positions of each range in
+    the sorted retention times.
+    """
+    start = np.searchsorted(self.sorted_times, rt_min, side="left")
+    end = np.searchsorted(self.sorted_times, rt_max, side="right")
+    return start, np.maximum(start, end)
+
+  def peaks_between (self, start, end) :
+    """
+    Returns the peaks between start and end positions from find_peak_ranges,
+    in report order.
+    """
+    return [ self.peaks[i] for i in np.sort(self.peak_order[start:end]) ]
+
+  def mark_picked_peaks (self, covered) :
+    """
+    Sets is_picked on each peak from a boolean array over the sorted
+    retention times, returning the peaks not picked.
+    """
+    picked = np.empty(len(self.peaks), dtype=bool)
+    picked[self.peak_order] = covered
+    unpicked = []
+    for peak, is_picked in zip(self.peaks, picked.tolist()) :
+      peak.is_picked = is_picked
+      if (not is_picked) :
+        unpicked.append(peak)
+    return unpicked
+
   def get_peak_area (self, rt, rt_tolerance) :
-    n_peaks = area_sum = 0
-    for peak in self.peaks :
-      if ((rt - rt_tolerance) <= peak.retention_time <= (rt+rt_tolerance)) :
-        area_sum += peak.peak_area
-        peak.is_picked = True
-        n_peaks += 1
-    return area_sum, n_peaks
+    return self.get_peak_area_in_range(rt - rt_tolerance, rt + rt_tolerance)
 
   def get_peak_area_in_range (self, rt_min, rt_max) :
-    n_peaks = area_sum = 0
-    for peak in self.peaks :
-      if (rt_min <= peak.retention_time <= rt_max) :
-        area_sum += peak.peak_area
-        peak.is_picked = True
-        n_peaks += 1
-    return area_sum, n_peaks
+    start, end = self.find_peak_ranges(rt_min, rt_max)
+    for peak in self.peaks_between(start, end) :
+      peak.is_picked = True
+    return int(self._area_sums[end] - self._area_sums[start]), int(end - start)
 
   def get_peaks_around (self, rt, rt_tolerance) :
-    peaks = []
-    for peak in self.peaks :
-      if ((rt - rt_tolerance) <= peak.retention_time <= (rt+rt_tolerance)) :
-        peaks.append(peak.retention_time)
-        peak.is_picked = True
-    return peaks
+    return self.get_peaks_in_range(rt - rt_tolerance, rt + rt_tolerance)
 
   def get_peaks_in_range (self, rt_min, rt_max) :
-    peaks = []
-    for peak in self.peaks :
-      if (rt_min <= peak.retention_time <= rt_max) :
-        peaks.append(peak.retention_time)
-        peak.is_picked = True
-    return peaks
+    start, end = self.find_peak_ranges(rt_min, rt_max)
+    peaks = self.peaks_between(start, end)
+    for peak in peaks :
+      peak.is_picked = True
+    return [ peak.retention_time for peak in peaks ]
 
   def get_unrecognized_peaks (self, peak_times=None, rt_tolerance=None,
       rt_ranges=None) :
@@ -100,15 +179,23 @@ class Sample (object) :
       rt_ranges = []
       for rt in peak_times :
         rt_ranges.append((rt - rt_tolerance, rt + rt_tolerance))
-    peaks = []
-    for peak in self.peaks :
-      for (rt_min, rt_max) in rt_ranges :
-        if (rt_min <= peak.retention_time <= rt_max) :
-          break
-      else :
-        peak.is_picked = False
-        peaks.append(peak)
-    return peaks
+    rt_min, rt_max = np.array(rt_ranges, dtype=float).reshape(-1, 2).T
+    start, end = self.find_peak_ranges(rt_min, rt_max)
+    covered = ranges_coverage(start, end, len(self.peaks))
+    unrecognized = [ self.peaks[i] for i in np.sort(self.peak_order[~covered]) ]
+    for peak in unrecognized :
+      peak.is_picked = False
+    return unrecognized
+
+def ranges_coverage (start, end, size) :
+  """
+  Returns a boolean array of the positions up to size inside any of the
+  half-open ranges from arrays of start and end positions.
+  """
+  coverage = np.zeros(size + 1, dtype=int)
+  np.add.at(coverage, start, 1)
+  np.add.at(coverage, end, -1)
+  return (np.cumsum(coverage[:-1]) > 0)
 
 class SampleCollection (object) :
   """
@@ -132,49 +219,68 @@ class SampleCollection (object) :
     return retention_times
 
   def extract_peak_areas (self, peak_times, bandwidth, err=sys.stderr) :
-    table = []
-    errors = []
-    for i_sample, sample in enumerate(self.samples) :
-      row = [sample.sample_id]
-      for i_peak, rt in enumerate(peak_times) :
-        area, n_peaks = sample.get_peak_area(rt, bandwidth)
-        if (n_peaks == 0) :
-          row.append(None)
-        else :
-          if (n_peaks > 1) :
-            print >> err, "WARNING: %d peaks near %.3f for sample %s" %\
-              (n_peaks, rt, sample.sample_id)
-            all_peaks = sample.get_peaks_around(rt, bandwidth)
-            errors.append((i_sample, i_peak, "%d peaks found: %s" %
-              (n_peaks, ", ".join([ "%g" % x for x in all_peaks ]))))
-          row.append(area)
-      table.append(row)
-      unrecognized = sample.get_unrecognized_peaks(peak_times, bandwidth)
-      if unrecognized :
-        errors.append((i_sample, None, "Additional peaks: %s" %
-          "; ".join([ peak.format_short() for peak in unrecognized ])))
-    return table, errors
+    peak_times = [ float(rt) for rt in peak_times ]
+    rt_ranges = [ (rt - bandwidth, rt + bandwidth) for rt in peak_times ]
+    return self._extract_peak_areas(rt_ranges, err,
+      lambda i_peak : "near %.3f" % peak_times[i_peak])
 
   def extract_peak_areas_by_range (self, rt_ranges, err=sys.stderr) :
+    return self._extract_peak_areas(rt_ranges, err,
+      lambda i_peak : "between %.3f and %.3f" % tuple(rt_ranges[i_peak]))
+
+  def _extract_peak_areas (self, rt_ranges, err, describe) :
+    """
+    Builds the table of summed peak areas for each sample and retention time
+    range, locating the ranges in all samples at once.  Ranges with no peaks
+    have an area of None; ranges with several peaks, and peaks outside any
+    range, are noted in the errors.
+    """
+    n_samples = len(self.samples)
+    n_ranges = len(rt_ranges)
+    rt_min, rt_max = np.array(rt_ranges, dtype=float).reshape(-1, 2).T
+    # all peaks, sorted by sample and then by retention time
+    lengths = [ len(sample.peaks) for sample in self.samples ]
+    offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.intp)))
+    sample_of_peak = np.repeat(np.arange(n_samples), lengths)
+    times = np.concatenate([np.zeros(0)] +
+      [ sample.sorted_times for sample in self.samples ])
+    areas = np.concatenate([np.zeros(0, dtype=np.int64)] +
+      [ sample.sorted_areas for sample in self.samples ])
+    area_sums = np.concatenate(([0], np.cumsum(areas)))
+    # a query for each (sample, range) pair, searching only that sample
+    query_sample = np.repeat(np.arange(n_samples), n_ranges)
+    start = search_grouped(sample_of_peak, times, query_sample,
+      np.tile(rt_min, n_samples), side="left")
+    end = np.maximum(start, search_grouped(sample_of_peak, times, query_sample,
+      np.tile(rt_max, n_samples), side="right"))
+    covered = ranges_coverage(start, end, len(times))
+    area_table = area_sums[end] - area_sums[start]
+    area_table = area_table.reshape(n_samples, n_ranges)
+    count_table = (end - start).reshape(n_samples, n_ranges)
+    start = start.reshape(n_samples, n_ranges) - offsets[:-1, None]
+    end = end.reshape(n_samples, n_ranges) - offsets[:-1, None]
     table = []
     errors = []
     for i_sample, sample in enumerate(self.samples) :
       row = [sample.sample_id]
-      for i_peak, (rt_min, rt_max) in enumerate(rt_ranges) :
-        area, n_peaks = sample.get_peak_area_in_range(rt_min, rt_max)
+      counts = count_table[i_sample].tolist()
+      for i_peak, area in enumerate(area_table[i_sample].tolist()) :
+        n_peaks = counts[i_peak]
         if (n_peaks == 0) :
           row.append(None)
-        else :
-          if (n_peaks > 1) :
-            print >> err, \
-              "WARNING: %d peaks between %.3f and %.3f for sample %s" %\
-              (n_peaks, rt_min, rt_max, sample.sample_id)
-            all_peaks = sample.get_peaks_in_range(rt_min, rt_max)
-            errors.append((i_sample, i_peak, "%d peaks found: %s" %
-              (n_peaks, ", ".join([ "%g" % x for x in all_peaks ]))))
-          row.append(area)
+          continue
+        if (n_peaks > 1) :
+          print >> err, "WARNING: %d peaks %s for sample %s" % \
+            (n_peaks, describe(i_peak), sample.sample_id)
+          all_peaks = sample.peaks_between(start[i_sample, i_peak],
+            end[i_sample, i_peak])
+          errors.append((i_sample, i_peak, "%d peaks found: %s" %
+            (n_peaks, ", ".join([ "%g" % p.retention_time
+                                  for p in all_peaks ]))))
+        row.append(area)
       table.append(row)
-      unrecognized = sample.get_unrecognized_peaks(rt_ranges=rt_ranges)
+      unrecognized = sample.mark_picked_peaks(
+        covered[offsets[i_sample]:offsets[i_sample + 1]])
       if unrecognized :
         errors.append((i_sample, None, "Additional peaks: %s" %
           "; ".join([ peak.format_short() for peak in unrecognized ])))
@@ -213,10 +319,11 @@ class SampleCollection (object) :
 
   def find_peaks_automatically_and_export (self,
       n_expected=None,
-      include_headers=False) :
+      include_headers=False,
+      cross_validate=False) :
     err = StringIO()
     peak_times, bandwidth = self.find_consensus_peaks(
-      n_expected=n_expected, err=err)
+      n_expected=n_expected, cross_validate=cross_validate, err=err)
     table, errors = self.extract_peak_areas(peak_times, bandwidth, err=err)
     if include_headers :
       table.insert(0, ["Sample ID"] +
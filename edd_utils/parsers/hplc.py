@@ -7,18 +7,20 @@ from __future__ import unicode_literals
 import chardet
 import logging
 import re
+import threading
 
 from collections import defaultdict, OrderedDict, namedtuple
-from decimal import Decimal
-from itertools import imap
+from decimal import Decimal, InvalidOperation
+from operator import itemgetter
 
+from ..downsample import DEFAULT_METHOD, thin_points
 from .util import RawImportRecord
 
 
 logger = logging.getLogger(__name__)
 
 
-def getRawImportRecordsAsJSON(request):
+def getRawImportRecordsAsJSON(request, thin=0, thin_method=DEFAULT_METHOD):
     # We pass the request directly along, so it can be read as a stream by the parser
     parser = HPLC_Parser(request)
 
@@ -30,7 +32,7 @@ def getRawImportRecordsAsJSON(request):
             record.compound,
             record.line,
             record.assay,
-            record.timepoints,  # warning: shallow copy(s)
+            thin_points(record.timepoints, thin, thin_method),  # warning: shallow copy(s)
             metadata,
         )
         j = raw_record.to_json()
@@ -38,13 +40,6 @@ def getRawImportRecordsAsJSON(request):
     return records
 
 
-# Returns an iterator of the given stream.
-# There's probably a utility function in the python standard library for this...
-def iterate_as_lines(stream):
-    for line in stream.split("\n"):
-        yield line
-
-
 class HplcError(Exception):
     pass
 
@@ -60,52 +55,89 @@ class HplcAlignmentError(HplcError):
 CompoundRecord = namedtuple('CompoundRecord', ['compound', 'line', 'assay', 'timepoints', ])
 CompoundEntry = namedtuple('CompoundEntry', ['compound', 'amount'])
 
+END_OF_REPORT = "*** End of Report ***"
+
+
+class ReportLines(object):
+    """ Iterator over the lines of a decoded report, keeping the line number for messages. """
+
+    def __init__(self, text):
+        self.lines = text.splitlines()
+        self.line_number = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.line_number >= len(self.lines):
+            raise StopIteration()
+        line = self.lines[self.line_number]
+        self.line_number += 1
+        return line
+    next = __next__
+
+    def take_until(self, predicate):
+        """
+        Consumes lines up to and including the first line matching predicate.
+
+        :return: a tuple of the list of lines before the match, and the matching line or None
+            when the end of the report was reached
+        """
+        start = end = self.line_number
+        while end < len(self.lines) and not predicate(self.lines[end]):
+            end += 1
+        self.line_number = min(end + 1, len(self.lines))
+        match = self.lines[end] if end < len(self.lines) else None
+        return self.lines[start:end], match
+
+
+def column_slices(section_widths):
+    """ Finds the slice of each fixed-width column, with one divider character between columns. """
+    slices = []
+    begin = 0
+    for width in section_widths:
+        slices.append(slice(begin, begin + width))
+        begin += width + 1
+    return slices
+
 
 class HPLC_Parser(object):
+    """
+    Parses the text reports of HPLC machines. All state of a parse is local to the parse_hplc
+    call, so reports may be parsed concurrently from several threads.
+    """
 
     # The maximum number of lines to read before giving up on finding the header
     max_header_line_count = 20
 
+    # regex formulated with the nifty https://regex101.com/ tool
+    # reads a samples name and captures (line, Time, assay)
+    sample_name_regex = re.compile(r'(.*)_HPLC@([0-9]+(?:\.[0-9]*)?)(?:_([^@]+))?')
+
     def __init__(self, input_stream):
 
         if not input_stream:
             raise HplcInputError("No data stream provided")
 
         self.input_stream = input_stream   # The stream that is being parsed
-        self.decoded_stream = None
-
-        # samples format: { 'Sample Name': [CompoundEntry('compound', 'amount'), ...], ... }
-        self.samples = OrderedDict()       # The final data resulting from batch parsing
-
-        self.has_parsed = False
         self.formatted_results = None
-
-        # regex formulated with the nifty https://regex101.com/ tool
-        # reads a samples name and captures (line, Time, assay)
-        self.sample_name_regex = re.compile(r'(.*)_HPLC@([0-9]+(?:\.[0-9]*)?)(?:_([^@]+))?')
-
-        # Integer indices for standard format parsing
-        self.amount_begin = None
-        self.amount_end = None
-        self.compound_begin = None
-        self.compound_end = None
-
-        self.expected_row_count = None
-        self.current_line = 0
-        self.saved_line = 0
+        self._lock = threading.Lock()
 
     def parse_hplc(self):
         """Parses textual HPLC data from the input stream, returning data formatted for use.
 
-        THIS CLASS IS NOT THREAD SAFE.
+        The stream is only read once; later calls return the same records.
 
         returns records = [('compound', 'line', 'assay', timepoints[[time, amount], ...]), ...]
         ( assay may be None )
         """
-        if self.has_parsed:
-            return self.formatted_results
-        self.has_parsed = True
-        self.decoded_stream = self._decode_input_stream()
+        with self._lock:
+            if self.formatted_results is None:
+                self.formatted_results = self.parse_report(self._decode_input_stream())
+        return self.formatted_results
+
+    def parse_report(self, text):
+        """Parses the decoded text of an HPLC report, returning records as in parse_hplc."""
 
         # TODO: Verify that long sample names don't clip!
         #        ...This can't be test without interacting with the HPLC machine.
@@ -116,61 +148,20 @@ class HPLC_Parser(object):
 
         # TODO: Add warning if line is shorter then expected
 
-        firstline = next(self.decoded_stream)
+        lines = ReportLines(text)
+        firstline = next(lines, '')
 
         # This is what we use to detect a 96-well-format HPLC file.
         if firstline.startswith("Batch"):
             logger.info("Detected 96 well format in HPLC file")
-            self._parse_96_well_format_samples()
+            samples = self._parse_96_well_format_samples(lines)
         else:
             logger.info("Detected standard format in HPLC file")
-            header_block = self._parse_file_header()
-
-            logger.debug("collecting the table_header")
-            (header_block, table_header, table_divider) = self._get_table_header(header_block)
-
-            logger.debug("parsing column widths")
-            section_widths = self._get_section_widths(table_divider)
-
-            logger.debug("collecting the column_headers")
-            self._extract_column_headers_from_multiline_text(section_widths, table_header)
-
-            # Read in each line and contruct records
-            logger.debug("now reading in the data")
-
-            # Collect Sample Name
-            sample_name = None
-
-            # Loop - collect each line associated with the sample
-            for (line_number, line) in enumerate(self.decoded_stream, 2):
-                if line.strip() == '':  # Skip blank line
-                    continue
-                self.current_line = line_number
-                # get the name of the sample related to the row
-                new_sample_name = line[:section_widths[0]].strip()
-
-                if new_sample_name:
-                    sample_name = new_sample_name
-                    self.samples.setdefault(sample_name, list())
-                if not new_sample_name and not sample_name:
-                    logger.error(
-                        "Continuation entry specified before sample name entry.\n\t%d: %s",
-                        line_number, line.strip()
-                    )
-                    break
-
-                # collect the other data items - grab amounts & compounds
-                amount = line[self.amount_begin:self.amount_end].strip()
-                compound = line[self.compound_begin:self.compound_end].strip()
-
-                # Put the value into our data structure
-                if amount != '-' and compound != '-':
-                    self.samples[sample_name].append(CompoundEntry(compound, amount))
+            samples = self._parse_standard_format_samples(lines)
 
         logger.info("HPLC parsing finished.")
 
-        self.formatted_results = self._format_samples_for_raw_input_record()
-        return self.formatted_results
+        return self._format_samples_for_raw_input_record(samples)
 
     def _decode_input_stream(self):
         # Apparently the HPLC machine generates documents in UTF-16?
@@ -201,16 +192,16 @@ class HPLC_Parser(object):
         encoding = chardet_result['encoding']
         logger.info("detected encoding %s", encoding)
         try:
-            return iterate_as_lines(raw_string.decode(encoding))
+            return raw_string.decode(encoding)
         except Exception:
-            raise HplcInputError("unable to decode document using guessed encoding %s", encoding)
+            raise HplcInputError("unable to decode document using guessed encoding %s" % encoding)
 
-    def _format_samples_for_raw_input_record(self):
+    def _format_samples_for_raw_input_record(self, samples):
 
         # { compound: [ compound_record_for_assay1, ... ], ... }
         compound_record_dict = defaultdict(list)
 
-        for (name, sample) in self.samples.iteritems():
+        for (name, sample) in samples.items():
             # Collects the DB names from the name.
             line = time = assay = None
             match_result = self.sample_name_regex.match(name)
@@ -232,7 +223,7 @@ class HPLC_Parser(object):
                     value = Decimal(entry.amount)
                     record = CompoundRecord(entry.compound, line, assay, [[time or 0, value]])
                     compound_record_dict[entry.compound].append(record)
-                except ValueError:
+                except (InvalidOperation, ValueError):
                     logger.warning('Could not interpret value %s', entry.amount)
                     continue
 
@@ -242,28 +233,22 @@ class HPLC_Parser(object):
 
         return compound_records
 
-    def _parse_file_header(self):
+    def _parse_file_header(self, lines):
 
-        header_block = []
-        i = 0
-        while True:
-            line = next(self.decoded_stream)
-            self.current_line += 1
-            header_block.append(line)
-            i += 1
+        def is_header_end(line):
+            return line.startswith("-") or END_OF_REPORT in line
 
-            if line.startswith("-"):
-                break
-            if "*** End of Report ***" in line:
-                break
-            if line == '':
-                raise HplcInputError(
-                    "unable to find header: EOF encountered at line %d",
-                    self.current_line)
-            if i >= HPLC_Parser.max_header_line_count:
-                raise HplcInputError(
-                    "unable to find header: header not closed after %d lines",
-                    HPLC_Parser.max_header_line_count)
+        header_block, header_end = lines.take_until(is_header_end)
+        if len(header_block) >= HPLC_Parser.max_header_line_count:
+            raise HplcInputError(
+                "unable to find header: header not closed after %d lines" %
+                HPLC_Parser.max_header_line_count
+            )
+        if header_end is None:
+            raise HplcInputError(
+                "unable to find header: EOF encountered at line %d" % lines.line_number
+            )
+        header_block.append(header_end)
         return header_block
 
     def _get_table_header(self, header_block):
@@ -286,14 +271,7 @@ class HPLC_Parser(object):
         return header_block, table_header, table_divider
 
     def _get_section_widths(self, table_divider):
-        section_widths = [0]
-        section_index = 0
-        for c in table_divider.strip():
-            if c == '-':
-                section_widths[section_index] += 1
-            else:
-                section_widths.append(0)
-                section_index += 1
+        section_widths = [len(section) for section in table_divider.strip().split('|')]
 
         logger.debug("section widths: %s", section_widths)
 
@@ -328,91 +306,129 @@ class HPLC_Parser(object):
                 column_headers[section_index] += segment
 
         # each value is indexed by column header, clean up headers
-        for i, header_tokens in enumerate(imap(lambda h: h.split(), column_headers)):
-            header = ' '.join(header_tokens)
-            column_headers[i] = header
+        column_headers = [' '.join(header.split()) for header in column_headers]
+        logger.debug("headers: %s", column_headers)
 
-            logger.debug("header: %s", header)
+        return column_headers
 
-            if header.startswith('Amount'):
-                self.amount_begin = sum(section_widths[:i]) + len(section_widths[:i])
-                self.amount_end = section_widths[i] + self.amount_begin
-            elif header.startswith('Compound'):
-                self.compound_begin = sum(section_widths[:i]) + len(section_widths[:i])
-                self.compound_end = section_widths[i] + self.compound_begin
+    def _read_table(self, lines):
+        """Reads the header of a table, returning the column headers and slices of each column."""
 
-        return column_headers
+        logger.debug("collecting the header_block")
+        header_block = self._parse_file_header(lines)
 
-    def _parse_96_well_format_block(self, sample_names, compounds, column_headers, section_widths):
-        """Reads in a single block of data from file"""
+        if END_OF_REPORT in header_block[-1]:
+            return None, None
 
-        for line_number, line in enumerate(self.decoded_stream):
-            self.current_line = line_number
+        logger.debug("collecting the table_header")
+        (header_block, table_header, table_divider) = self._get_table_header(header_block)
 
-            if self.expected_row_count and line_number > self.expected_row_count:
-                raise HplcAlignmentError("More rows found then expected!")
+        logger.debug("parsing column widths")
+        section_widths = self._get_section_widths(table_divider)
 
-            if line.startswith('#'):
-                if self.expected_row_count and line_number < self.expected_row_count:
-                    raise HplcAlignmentError("Less rows found then expected!")
-                break
+        logger.debug("collecting the column_headers")
+        column_headers = self._extract_column_headers_from_multiline_text(
+            section_widths, table_header
+        )
+        return column_headers, column_slices(section_widths)
 
-            for index, header in enumerate(column_headers):
-                if "Sample" in header:
-                    begin_position = sum(section_widths[:index]) + len(section_widths[:index])
-                    end_position = section_widths[index] + begin_position
-                    name = line[begin_position:end_position].strip()
-                    # sample names is implicitly indexed by line_number
-                    sample_names.append(name)
-                elif "Amount" in header:
-                    begin_position = sum(section_widths[:index]) + len(section_widths[:index])
-                    end_position = section_widths[index] + begin_position
-                    amount = line[begin_position:end_position].strip()
-                    if Decimal(amount) == 0.0:
-                        continue
-                    compound = column_headers[index].replace("Amount", "").strip()
-                    compounds.append((line_number, CompoundEntry(compound, amount)))
+    def _parse_standard_format_samples(self, lines):
+        """Collects the samples from a standard format file, with one compound per row
 
-        return sample_names, compounds
+        Format: { 'Sample Name': [CompoundEntry('compound', 'amount'), ...], ... }"""
+
+        samples = OrderedDict()
+        column_headers, slices = self._read_table(lines)
+        try:
+            amount_index = next(
+                i for i, header in enumerate(column_headers) if header.startswith('Amount')
+            )
+            compound_index = next(
+                i for i, header in enumerate(column_headers) if header.startswith('Compound')
+            )
+        except (StopIteration, TypeError):
+            raise HplcInputError("unable to find the Amount and Compound columns")
+        extract = itemgetter(slices[0], slices[amount_index], slices[compound_index])
+
+        # Read in all lines and split the columns of each
+        logger.debug("now reading in the data")
+        first = lines.line_number
+        body, _ = lines.take_until(lambda line: False)
+        rows = [
+            (line_number, [column.strip() for column in extract(line)])
+            for line_number, line in enumerate(body, first + 1)
+            if line and not line.isspace()
+        ]
+
+        # Collect Sample Name; continuation rows belong to the last named sample
+        sample = None
+        for (line_number, (sample_name, amount, compound)) in rows:
+            if sample_name:
+                sample = samples.setdefault(sample_name, [])
+            elif sample is None:
+                logger.error(
+                    "Continuation entry specified before sample name entry.\n\t%d: %s",
+                    line_number, body[line_number - first - 1].strip()
+                )
+                break
 
-    def _parse_96_well_format_samples(self):
-        """Collects the samples from a 96 well plate format file
+            # Put the value into our data structure
+            if amount != '-' and compound != '-':
+                sample.append(CompoundEntry(compound, amount))
 
-        Format: [ (compound_string, amount_string), ...] """
+        return samples
 
-        sample_names = []
-        compounds = []
+    def _parse_96_well_format_block(self, lines, sample_names, compounds, column_headers, slices):
+        """Reads in a single block of data from file"""
 
-        # collect all the sample names
-        # ...
+        block, _ = lines.take_until(lambda line: line.startswith('#'))
+        if sample_names and len(block) > len(sample_names):
+            raise HplcAlignmentError("More rows found then expected!")
+        elif sample_names and len(block) < len(sample_names):
+            raise HplcAlignmentError("Less rows found then expected!")
 
-        while True:
-            logger.debug("collecting the header_block")
-            header_block = self._parse_file_header()
+        # the first column with a Sample header has names, columns with Amount headers have values
+        sample_slice = next(
+            (slices[i] for i, header in enumerate(column_headers) if "Sample" in header),
+            None,
+        )
+        if sample_slice is not None:
+            sample_names.extend(line[sample_slice].strip() for line in block)
+        amount_columns = [
+            (header.replace("Amount", "").strip(), slices[i])
+            for i, header in enumerate(column_headers)
+            if "Amount" in header
+        ]
+        for (row, line) in enumerate(block):
+            for (compound, column) in amount_columns:
+                amount = line[column].strip()
+                if Decimal(amount) != 0:
+                    # sample names are implicitly indexed by row
+                    compounds.append((row, CompoundEntry(compound, amount)))
 
-            if "*** End of Report ***" in header_block[-1]:
-                break
+        return sample_names, compounds
 
-            logger.debug("collecting the table_header")
-            (header_block, table_header, table_divider) = self._get_table_header(header_block)
+    def _parse_96_well_format_samples(self, lines):
+        """Collects the samples from a 96 well plate format file, with a column per compound
 
-            logger.debug("parsing column widths")
-            section_widths = self._get_section_widths(table_divider)
+        Format: { 'Sample Name': [CompoundEntry('compound', 'amount'), ...], ... }"""
 
-            logger.debug("collecting the column_headers")
-            column_headers = self._extract_column_headers_from_multiline_text(
-                section_widths, table_header
-            )
+        samples = OrderedDict()
+        sample_names = []
+        compounds = []
 
+        while True:
+            column_headers, slices = self._read_table(lines)
+            if column_headers is None:
+                break
             self._parse_96_well_format_block(
-                sample_names, compounds, column_headers, section_widths
+                lines, sample_names, compounds, column_headers, slices
             )
 
         # Line up the sample name with the amounts
-        for indexed_compound in compounds:
-            line_number, compound = indexed_compound
-            sample_name = sample_names[line_number]
-            if sample_name in self.samples:
-                self.samples[sample_name].append(compound)
-            else:
-                self.samples[sample_name] = [compound]
+        if compounds and not sample_names:
+            raise HplcAlignmentError("No sample names found for amounts!")
+        for (row, compound) in compounds:
+            samples.setdefault(sample_names[row], []).append(compound)
+
+        return samples
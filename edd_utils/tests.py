@@ -1,11 +1,17 @@
 # coding: utf-8
 from __future__ import division, unicode_literals
 
+import json
+import jsonpickle
 import logging
 import os.path
 
+from decimal import Decimal
+from multiprocessing.pool import ThreadPool
+
 from builtins import str
 from cStringIO import StringIO
+from edd_utils import downsample
 from edd_utils.parsers.excel import (
     export_to_xlsx, import_xlsx_table, import_xlsx_tables,
 )
@@ -15,6 +21,7 @@ from edd_utils.form_utils import (
 from edd_utils.parsers import gc_ms
 from edd_utils.parsers import skyline
 from edd_utils.parsers import biolector
+from edd_utils.parsers import hplc
 from django.test import TestCase
 
 test_dir = os.path.join(os.path.dirname(__file__), "fixtures", "misc_data")
@@ -71,6 +78,48 @@ class GCMSTests(TestCase):
         else:
             assert False
 
+    def test_cross_validate(self):
+        # the binned bandwidth selection agrees with the scikit-learn grid search
+        test_file = os.path.join(test_dir, "gc_ms_2.txt")
+        l = gc_ms.run([test_file], out=StringIO(), err=StringIO())
+        fast = l.find_consensus_peaks(err=StringIO())
+        slow = l.find_consensus_peaks(cross_validate=True, err=StringIO())
+        self.assertEqual(fast, slow)
+
+    def test_sample_peak_lookup(self):
+        lines = [
+            "%d %s BB 1 2 3 10 %d 4 5" % (i + 1, rt, area)
+            for i, (rt, area) in enumerate([(2.0, 200), (1.05, 50), (1.0, 100)])
+        ]
+        sample = gc_ms.Sample(lines, "test.D")
+        self.assertEqual(sample.get_peak_area(1.0, 0.05), (150, 2))
+        self.assertEqual(sample.get_peaks_around(1.0, 0.05), [1.05, 1.0])
+        self.assertEqual(sample.get_peak_area_in_range(3.0, 4.0), (0, 0))
+        unrecognized = sample.get_unrecognized_peaks(peak_times=[2.0], rt_tolerance=0.01)
+        self.assertEqual([p.retention_time for p in unrecognized], [1.05, 1.0])
+        collection = gc_ms.SampleCollection([sample, sample])
+        table, errors = collection.extract_peak_areas([1.0, 2.0, 3.0], 0.05, err=StringIO())
+        self.assertEqual(table, [["test.D", 150, 200, None]] * 2)
+
+    def test_export_samples(self):
+        # the GC-MS workbench reads the ID and peaks at the top level of each exported sample
+        test_file = os.path.join(test_dir, "gc_ms_1.txt")
+        collection = gc_ms.run([test_file], out=StringIO(), err=StringIO())
+        result = collection.find_peaks_by_range_and_export([(8.0, 9.0)])
+        samples = json.loads(result["samples"])
+        self.assertEqual(len(samples), len(collection.samples))
+        for exported, sample in zip(samples, collection.samples):
+            self.assertEqual(exported["sample_id"], sample.sample_id)
+            self.assertEqual(
+                [p["retention_time"] for p in exported["peaks"]],
+                sample.retention_times(),
+            )
+        decoded = jsonpickle.decode(result["samples"])
+        self.assertEqual(
+            decoded[0].get_peak_area_in_range(8.0, 9.0),
+            collection.samples[0].get_peak_area_in_range(8.0, 9.0),
+        )
+
     def test_xls_key(self):
         #
         # Import .xlsx workbook
@@ -113,10 +162,75 @@ class BiolectorTests(TestCase):
         results = biolector.getRawImportRecordsAsJSON(file, 0)
         self.assertEqual(len(results), 48)
         last_v = results[-1]['data'][-1][1]
-        self.assertEqual(last_v, '8.829')
+        self.assertEqual(last_v, 8.829)
         well_v = results[20]['metadata_by_name']['Bio:well']
         self.assertEqual(well_v, 'C05')
 
+    def test_decoded_text(self):
+        # text is already decoded, the declared encoding must not be applied a second time
+        document = (
+            '<?xml version="1.0" encoding="ISO-8859-1"?><Fermentation>'
+            '<Description>Çulture</Description><CalibratedData><Curve><Key>OD</Key>'
+            '<CurvePoint><RunTime>1</RunTime><NumericValue>0.5</NumericValue></CurvePoint>'
+            '</Curve></CalibratedData></Fermentation>'
+        )
+        results = biolector.getRawImportRecordsAsJSON(document)
+        self.assertEqual(results[0]['line_name'], 'Çulture')
+        self.assertEqual(results[0]['data'], [[1, 0.5]])
+
+
+########################################################################
+# DOWNSAMPLING
+class DownsampleTests(TestCase):
+    x = list(range(10))
+    y = [i % 3 for i in range(10)]
+
+    def test_keeps_all(self):
+        for max_points in (None, 0, -5, 10, 20):
+            self.assertEqual(downsample.downsample(self.x, self.y, max_points), self.x)
+
+    def test_keeps_ends(self):
+        for method in downsample.METHODS:
+            keep = downsample.downsample(self.x, self.y, 5, method)
+            self.assertLessEqual(len(keep), 5)
+            self.assertEqual((keep[0], keep[-1]), (0, 9))
+
+
+########################################################################
+# HPLC IMPORT
+class HPLCTests(TestCase):
+    def parse(self, name):
+        with open(os.path.join(test_dir, "hplc_parser", name), 'rb') as file:
+            return hplc.HPLC_Parser(file).parse_hplc()
+
+    def test_standard_format(self):
+        records = self.parse("2015.11.1_Sugars_HPLC_data.txt")
+        self.assertEqual(len(records), 145)
+        self.assertIn(
+            hplc.CompoundRecord('Xylose', '0.2', None, [[0, Decimal('0.244688')]]),
+            records,
+        )
+
+    def test_96_well_format(self):
+        records = self.parse("hgm.TXT")
+        self.assertEqual(
+            records,
+            [hplc.CompoundRecord('xyl', 'st 4', None, [[0, Decimal('0.0101524')]])],
+        )
+
+    def test_concurrent(self):
+        filename = os.path.join(test_dir, "hplc_parser", "GLPrprt111714.txt")
+        with open(filename, 'rb') as file:
+            text = file.read().decode('utf-16')
+        parser = hplc.HPLC_Parser(StringIO())
+        pool = ThreadPool(4)
+        try:
+            results = pool.map(parser.parse_report, [text] * 8)
+        finally:
+            pool.terminate()
+        self.assertEqual(len(set(len(records) for records in results)), 1)
+        self.assertEqual(results[0], results[-1])
+
 
 ########################################################################
 # EXCEL IMPORT
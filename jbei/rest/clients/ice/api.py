@@ -659,6 +659,9 @@ class IceApi(RestApiClient):
         session = PagedSession(RESULT_LIMIT_PARAMETER, result_limit, auth=auth,
                                verify_ssl_cert=verify_ssl_cert)
         super(IceApi, self).__init__('ICE', base_url, session, result_limit)
+        # optional cache of entry JSON consulted by get_entry(); an object with methods
+        #   load(entry_id) -> dict or None, save(entry_id, json_dict), and delete(entry_id)
+        self.entry_cache = None
 
     def _compute_result_offset(self, page_number):
         result_limit = self.result_limit
@@ -789,7 +792,7 @@ class IceApi(RestApiClient):
             # ability to distinguish between a non-existent entry and and entry with no samples
             response.raise_for_status()
 
-    def get_entry(self, entry_id, suppress_errors=False):
+    def get_entry(self, entry_id, suppress_errors=False, use_cache=True):
         """
         Retrieves an ICE entry using any of the unique identifiers: UUID (preferred), part
         number (often globally unique, though not enforceably), or locally-unique primary
@@ -802,15 +805,23 @@ class IceApi(RestApiClient):
             locally-unique integer primary  key)
         :param suppress_errors: true to catch and log exception messages and return None instead of
             raising Exceptions.
+        :param use_cache: false to skip looking in entry_cache, always requesting the entry from
+            ICE; the response still replaces any cached copy.
         :return: A Part object representing the response from ICE, or None if an an Exception
             occurred but suppress_errors was true.
         """
+        if use_cache and self.entry_cache is not None:
+            json_dict = self.entry_cache.load(entry_id)
+            if json_dict:
+                return Entry.of(json_dict, False)
         rest_url = '%s/rest/parts/%s' % (self.base_url, entry_id)
         try:
             response = self.session.get(url=rest_url)
             response.raise_for_status()
             json_dict = json.loads(response.content)
             if json_dict:
+                if self.entry_cache is not None:
+                    self.entry_cache.save(entry_id, json_dict)
                 return Entry.of(json_dict, False)
         except requests.exceptions.Timeout as e:
             if not suppress_errors:
@@ -818,6 +829,8 @@ class IceApi(RestApiClient):
             logger.exception("Timeout requesting part %s: %s", entry_id)
         except requests.exceptions.HTTPError as e:
             if response.status_code == requests.codes.not_found:
+                if self.entry_cache is not None:
+                    self.entry_cache.delete(entry_id)
                 return None
             elif not suppress_errors:
                 raise e
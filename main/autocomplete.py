@@ -6,7 +6,9 @@ import re
 
 from builtins import str
 from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
 from django.db.models import Q
+from django.db.models.functions import Greatest
 from django.http import JsonResponse
 from django.contrib.auth.models import Group
 from functools import reduce
@@ -19,6 +21,32 @@ from main.models import Line, Study, StudyPermission
 from . import models as edd_models, solr
 
 DEFAULT_RESULT_COUNT = 20
+# fields searched by search_generic; each has a pg_trgm index from migration 0010_trigram_search,
+#   other models fall back to searching every text field without an index
+TRIGRAM_SEARCH_FIELDS = {
+    'CarbonSource': ('name', 'description', 'labeling', ),
+    'GeneIdentifier': ('type_name', 'short_name', ),
+    'MeasurementType': ('type_name', 'short_name', ),
+    'MeasurementUnit': ('unit_name', 'alternate_names', ),
+    'Metabolite': ('type_name', 'short_name', ),
+    'Phosphor': ('type_name', 'short_name', ),
+    'ProteinIdentifier': ('type_name', 'short_name', ),
+    'Strain': ('name', 'description', ),
+}
+
+
+def trigram_search(queryset, fields, term):
+    """ Filters a queryset to items with any of fields containing term, ordered by the trigram
+        similarity of the closest field to term. The __icontains lookups compile to
+        UPPER(field::text) LIKE UPPER(term), served by pg_trgm indexes on that expression. """
+    term_filters = [Q(**{'%s__icontains' % f: term}) for f in fields]
+    similarity = [TrigramSimilarity(f, term) for f in fields]
+    rank = similarity[0] if len(similarity) == 1 else Greatest(*similarity)
+    return queryset.filter(
+        reduce(operator.or_, term_filters, Q())
+    ).annotate(
+        search_rank=rank,
+    ).order_by('-search_rank')
 
 
 def search_compartment(request):
@@ -38,17 +66,18 @@ def search_generic(request, model_name, module=edd_models):
         module kwarg to specify a different module. """
     try:
         Model = getattr(module, model_name)
-        ifields = [
-            f.get_attname()
-            for f in Model._meta.get_fields()
-            if hasattr(f, 'get_attname') and f.get_internal_type() in ['TextField', 'CharField']
-        ]
+        ifields = TRIGRAM_SEARCH_FIELDS.get(model_name, None) if module is edd_models else None
+        if ifields is None:
+            ifields = [
+                f.get_attname()
+                for f in Model._meta.get_fields()
+                if hasattr(f, 'get_attname') and
+                f.get_internal_type() in ['TextField', 'CharField']
+            ]
     except AttributeError as e:
         return JsonResponse({'error': 'Unknown search model %s' % model_name}, status=400)
     term = request.GET.get('term', '')
-    re_term = re.escape(term)
-    term_filters = [Q(**{'%s__iregex' % f: re_term}) for f in ifields]
-    found = Model.objects.filter(reduce(operator.or_, term_filters, Q()))[:DEFAULT_RESULT_COUNT]
+    found = trigram_search(Model.objects.all(), ifields, term)[:DEFAULT_RESULT_COUNT]
     return JsonResponse({
         'rows': [item.to_json() for item in found],
     })
@@ -57,8 +86,7 @@ def search_generic(request, model_name, module=edd_models):
 def search_group(request):
     """ Autocomplete for Groups of users. """
     term = request.GET.get('term', '')
-    re_term = re.escape(term)
-    found = Group.objects.filter(name__iregex=re_term).order_by('name').values('id', 'name')
+    found = trigram_search(Group.objects.all(), ('name', ), term).values('id', 'name')
     found = found[:DEFAULT_RESULT_COUNT]
     return JsonResponse({
         'rows': list(found),  # force QuerySet to list
@@ -88,14 +116,12 @@ def search_metadata(request, context):
         'Line', and 'Study'. If none of these contexts are provided, then all metadata types
         are searched. """
     term = request.GET.get('term', '')
-    re_term = re.escape(term)
-    term_filters = [
-        Q(type_name__iregex=re_term),
-        Q(group__group_name__iregex=re_term),
-    ]
     type_filter = AUTOCOMPLETE_METADATA_LOOKUP.get(context, Q())
-    q_filter = reduce(operator.or_, term_filters, Q()) & type_filter
-    found_qs = edd_models.MetadataType.objects.filter(q_filter).select_related('group')
+    found_qs = trigram_search(
+        edd_models.MetadataType.objects.filter(type_filter).select_related('group'),
+        ('type_name', 'group__group_name', ),
+        term,
+    )
     return JsonResponse({
         'rows': [item.to_json() for item in found_qs[:DEFAULT_RESULT_COUNT]],
     })
@@ -104,21 +130,19 @@ def search_metadata(request, context):
 def search_study_lines(request):
     """ Autocomplete search on lines in a study."""
     study_pk = request.GET.get('study', '')
-    name_regex = re.escape(request.GET.get('term', ''))
+    term = request.GET.get('term', '')
     user = request.user
 
     if (not study_pk) or (not study_pk.isdigit()):
         raise ValidationError('study parameter is required and must be a valid integer')
 
-    permission_check = Study.user_permission_q(user, StudyPermission.READ)
-    # if the user's admin / staff role gives read access to all Studies, don't bother querying
-    # the database for specific permissions defined on this study
-    if Study.user_role_can_read(user):
-        permission_check = Q()
+    # if the user's admin / staff role gives read access to all Studies, don't bother checking
+    # the specific permissions defined on this study
+    permission_check = Q()
+    if not Study.user_role_can_read(user):
+        permission_check = Q(pk__in=Study.user_permission_ids(user, StudyPermission.CAN_VIEW))
     try:
-        # Note: distinct() necessary in case the user has multiple permission paths to access
-        # the study (e.g. individual and group permissions)
-        study = Study.objects.filter(permission_check, pk=study_pk).distinct().get()
+        study = Study.objects.filter(permission_check, pk=study_pk).get()
         query = study.line_set.all()
 
     # if study doesn't exist or requesting user doesn't have read acccess, return an empty
@@ -126,8 +150,7 @@ def search_study_lines(request):
     except Study.DoesNotExist as e:
         query = Line.objects.none()
 
-    name_filters = [Q(name__iregex=name_regex), Q(strains__name__iregex=name_regex)]
-    query = query.filter(reduce(operator.or_, name_filters, Q()))[:DEFAULT_RESULT_COUNT]
+    query = trigram_search(query, ('name', 'strains__name', ), term)[:DEFAULT_RESULT_COUNT]
     return JsonResponse({
         'rows': [{'name': line.name,
                   'id': line.id,
@@ -185,11 +208,13 @@ def search_strain(request):
 def search_study_writable(request):
     """ Autocomplete searches for any Studies writable by the currently logged in user. """
     term = request.GET.get('term', '')
-    re_term = re.escape(term)
     perm = edd_models.StudyPermission.WRITE
-    found = edd_models.Study.objects.distinct().filter(
-        Q(name__iregex=re_term) | Q(description__iregex=re_term),
-        edd_models.Study.user_permission_q(request.user, perm),
+    found = trigram_search(
+        edd_models.Study.objects.filter(
+            pk__in=edd_models.Study.user_permission_ids(request.user, perm),
+        ),
+        ('name', 'description', ),
+        term,
     )[:DEFAULT_RESULT_COUNT]
     return JsonResponse({
         'rows': [item.to_json() for item in found],
@@ -17,7 +17,7 @@ from copy import copy
 from decimal import Decimal
 from django import forms
 from django.core.exceptions import ValidationError
-from django.db.models import Max, Min, Prefetch, Q
+from django.db.models import Max, Min, Q
 from django.http import QueryDict
 from django.template.defaulttags import register
 from django.utils.safestring import mark_safe
@@ -41,6 +41,42 @@ Range = namedtuple('Range', ['min', 'max'])
 Point = namedtuple('Point', ['x', 'y'])
 
 
+def _series_decimal(value):
+    """ Converts a float from a packed MeasurementSeries to the Decimal type used in
+        MeasurementValue, so that values from either storage can be combined. """
+    return Decimal(repr(value))
+
+
+def load_values(measurements, defined=False):
+    """ Loads the points of measurements with single X values, including points packed in a
+        MeasurementSeries, as MeasurementValue objects sorted by X.
+
+        :param measurements: a list or QuerySet of Measurement objects or IDs
+        :param defined: when True, only include points with a single defined Y value
+        :return: a dict of measurement ID to a list of MeasurementValue objects """
+    # TODO: change to .order_by('x__0') once Django supports ordering on transform
+    # https://code.djangoproject.com/ticket/24747
+    values_qs = models.MeasurementValue.objects.filter(
+        measurement__in=measurements, x__len=1,
+    ).order_by('x')
+    if defined:
+        values_qs = values_qs.filter(y__len=1)
+    values = defaultdict(list)
+    for v in values_qs:
+        values[v.measurement_id].append(v)
+    for series in models.MeasurementSeries.objects.filter(measurement__in=measurements):
+        values[series.measurement_id] = [
+            models.MeasurementValue(
+                measurement_id=series.measurement_id,
+                x=[_series_decimal(x) for x in xs],
+                y=[_series_decimal(y) for y in ys],
+            )
+            for xs, ys in series.to_points()
+            if ys or not defined
+        ]
+    return values
+
+
 class SbmlForm(forms.Form):
     def __init__(self, *args, **kwargs):
         kwargs.setdefault('label_suffix', '')
@@ -281,21 +317,20 @@ class SbmlExport(object):
         return self.update_view_context(context)
 
     def load_measurement_queryset(self, m_form):
-        """ Creates a queryset from the IDs in the measurements parameter, prefetching values to a
-            values attr on each measurement.
+        """ Loads the measurements referenced in the form, setting defined values to a values
+            attr on each measurement.
 
             :param m_form: an SbmlExportMeasurementsForm
-            :return: a QuerySet of measurements referenced in the form """
-        # TODO: change to .order_by('x__0') once Django supports ordering on transform
-        # https://code.djangoproject.com/ticket/24747
-        values_qs = models.MeasurementValue.objects.filter(x__len=1, y__len=1).order_by('x')
-        return m_form.measurement_qs.filter(
+            :return: a list of measurements referenced in the form """
+        measures = list(m_form.measurement_qs.filter(
                 measurement_format=models.Measurement.Format.SCALAR
             ).select_related(
                 'assay__line',
-            ).prefetch_related(
-                Prefetch('measurementvalue_set', queryset=values_qs, to_attr='values'),
-            )
+            ))
+        values = load_values(measures, defined=True)
+        for m in measures:
+            m.values = values[m.pk]
+        return measures
 
     def output(self, time, matches):
         """ Writes the output SBML as a string.
@@ -441,6 +476,7 @@ class SbmlExport(object):
         notes = defaultdict(list)
         for mlist in self._measures.itervalues():
             for m in mlist:
+                # carbon ratio measurements are vectors, and are never packed in a series
                 if m.is_carbon_ratio():
                     points = models.MeasurementValue.objects.filter(
                         measurement=m, x__0=time,
@@ -476,16 +512,17 @@ class SbmlExport(object):
             reaction_note_body = builder.create_note_body()
         notes = builder.parse_note_body(reaction_note_body)
         for name in builder.read_note_associations(notes):
-            values = models.MeasurementValue.objects.filter(
-                measurement__in=self._omics.get(name, []),
-                x__0=time,
-            ).select_related('measurement__measurement_type')
-            for v in values:
-                text = '%s=%d' % (name, v.y[0])
-                if v.measurement.measurement_type.is_gene():
-                    transcripts.append(text)
-                elif v.measurement.measurement_type.is_protein():
-                    p_copies.append(text)
+            measures = self._omics.get(name, [])
+            values = load_values(measures, defined=True)
+            for m in measures:
+                for v in values[m.pk]:
+                    if v.x[0] != time:
+                        continue
+                    text = '%s=%d' % (name, v.y[0])
+                    if m.measurement_type.is_gene():
+                        transcripts.append(text)
+                    elif m.measurement_type.is_protein():
+                        p_copies.append(text)
         reaction_note_body = builder.update_note_body(
             reaction_note_body,
             GENE_TRANSCRIPTION_VALUES=' '.join(transcripts),
@@ -495,21 +532,18 @@ class SbmlExport(object):
 
     def _update_range_bounds(self, measurements, interpolate):
         measurement_qs = models.Measurement.objects.filter(pk__in=measurements)
-        values_qs = models.MeasurementValue.objects.filter(x__len=1).order_by('x')
+        values = load_values(measurement_qs)
         # capture lower/upper bounds of t values for all measurements
-        trange = measurement_qs.aggregate(
-            max_t=Max('measurementvalue__x'), min_t=Min('measurementvalue__x'),
-        )
-        if trange['max_t']:
-            self._max = min(trange['max_t'][0], self._max or sys.maxint)
-        if trange['min_t']:
-            self._min = max(trange['min_t'][0], self._min or -sys.maxint)
+        times = [v.x[0] for mvalues in values.itervalues() for v in mvalues]
+        if times:
+            self._max = min(max(times), self._max or sys.maxint)
+            self._min = max(min(times), self._min or -sys.maxint)
         # iff no interpolation, capture intersection of t values bounded by max & min
-        m_inter = measurement_qs.exclude(assay__protocol__in=interpolate).prefetch_related(
-            Prefetch('measurementvalue_set', queryset=values_qs, to_attr='values'),
+        m_inter = measurement_qs.exclude(assay__protocol__in=interpolate).select_related(
+            'assay__protocol', 'measurement_type',
         )
         for m in m_inter:
-            points = {p.x[0] for p in m.values if self._min <= p.x[0] <= self._max}
+            points = {p.x[0] for p in values[m.pk] if self._min <= p.x[0] <= self._max}
             if self._points is None:
                 self._points = points
             elif self._points:
@@ -605,19 +639,19 @@ class SbmlExport(object):
             measurements = self._measures.get(type_key, [])
             current = minimum = maximum = ''
             try:
-                # TODO: change to .order_by('x__0') once Django supports ordering on transform
-                # https://code.djangoproject.com/ticket/24747
-                values = list(models.MeasurementValue.objects.filter(
-                    measurement__in=measurements
-                ).select_related('measurement__y_units').order_by('x'))
+                values = []
+                points = load_values(measurements)
                 # convert units
-                for v in values:
-                    units = v.measurement.y_units
+                for m in measurements:
+                    units = m.y_units
                     f = models.MeasurementUnit.conversion_dict.get(units.unit_name, None)
-                    if f is not None:
-                        v.y = [f(y, metabolite) for y in v.y]
-                    else:
+                    if f is None:
                         logger.warning('unrecognized unit %s', units)
+                    for v in points[m.pk]:
+                        if f is not None:
+                            v.y = [f(y, metabolite) for y in v.y]
+                        values.append(v)
+                values.sort(key=lambda v: v.x[0])
                 # save here so _update_reaction does not need to re-query
                 self._values_by_type[type_key] = values
                 minimum = float(min(values, key=lambda v: v.y[0]).y[0])
@@ -718,6 +752,7 @@ class SbmlExportMeasurementsForm(SbmlForm):
             'measurement_type',
         ).prefetch_related(
             'measurementvalue_set',
+            'series',
         )
         if qfilter is not None:
             f.queryset = f.queryset.filter(qfilter)
@@ -781,11 +816,15 @@ class SbmlExportMeasurementsForm(SbmlForm):
         x_range = f.queryset.aggregate(
             max=Max('measurementvalue__x'), min=Min('measurementvalue__x')
         )
-        # can potentially get None if there are no values; use __getitem__ default AND `or [0]`
-        x_max = x_range.get('max', [0]) or [0]
-        x_min = x_range.get('min', [0]) or [0]
-        # max and min are both still arrays, grab the first element
-        return (x_min[0], x_max[0])
+        # max and min are both arrays, or None if there are no values; grab the first element
+        x_max = [x_range['max'][0]] if x_range.get('max') else []
+        x_min = [x_range['min'][0]] if x_range.get('min') else []
+        # packed series are sorted by X, so bounds are the first and last elements
+        series_qs = models.MeasurementSeries.objects.filter(measurement__in=f.queryset)
+        for x in series_qs.exclude(x__len=0).values_list('x', flat=True):
+            x_min.append(_series_decimal(x[0]))
+            x_max.append(_series_decimal(x[-1]))
+        return (min(x_min or [0]), max(x_max or [0]))
 
     def update_bound_data_with_defaults(self):
         """ Forces data bound to the form to update to default values. """
@@ -880,7 +919,9 @@ class SbmlExportOdForm(SbmlExportMeasurementsForm):
         for line in self._clean_collect_data_lines(data).itervalues():
             count = 0
             for m in self._measures_by_line[line.pk]:
+                series = m.get_series()
                 count += len(m.measurementvalue_set.all())
+                count += len(series.x) if series is not None else 0
                 if count > 1:
                     break
             if count < 2:
@@ -4,8 +4,9 @@ from __future__ import unicode_literals
 import logging
 
 from builtins import str
-from collections import OrderedDict
-from django.db.models import Prefetch, Q
+from collections import defaultdict, OrderedDict
+from django.db.models import Prefetch, prefetch_related_objects, Q
+from itertools import groupby, islice
 from django.utils.translation import ugettext_lazy as _
 
 
@@ -97,12 +98,7 @@ class ExportSelection(object):
             (Q(line__assay__in=assayId) & Q_active(line__assay__active=True)) |
             (Q(line__assay__measurement__in=measureId) &
              Q_active(line__assay__measurement__active=True))
-        ).distinct(
-        ).prefetch_related(
-            'userpermission_set',
-            'grouppermission_set',
-            'everyonepermission_set',
-        )
+        ).distinct()
         self._allowed_study = [s for s in matched_study if s.user_can_read(user)]
         # load all matching measurements
         self._measures = models.Measurement.objects.filter(
@@ -276,6 +272,9 @@ class CellQuote(object):
 
 class TableExport(object):
     """ Outputs tables for export of EDD objects. """
+    # number of measurements loaded with their values per query when generating output
+    MEASURE_BATCH_SIZE = 500
+
     def __init__(self, selection, options, worklist=None):
         self.selection = selection
         self.options = options
@@ -284,17 +283,25 @@ class TableExport(object):
 
     def output(self):
         """ Builds the CSV of the table export output. """
-        # store tables; protocol PK keys table for measurements under a protocol, 'line' keys table
-        #   for line-only section (if enabled), 'all' keys table including everything.
-        tables = OrderedDict()
-        if self.options.line_section:
-            tables['line'] = OrderedDict()
-            tables['line']['header'] = self._output_line_header()
-        if not self.options.protocol_section:
-            tables['all'] = OrderedDict()
-            tables['all']['header'] = self._output_header()
-        self._do_export(tables)
-        return self._build_output(tables)
+        return ''.join(self.iter_output())
+
+    def iter_output(self):
+        """
+        Generates the CSV of the table export output one row at a time, e.g. for use in a
+        StreamingHttpResponse. Measurements are read with a server-side cursor, and values are
+        loaded for MEASURE_BATCH_SIZE measurements at a time. The DATA_COLUMN_BY_POINT layout is
+        written in a single pass; DATA_COLUMN_BY_LINE makes a first pass to find the X values for
+        the header row. LINE_COLUMN_BY_DATA must transpose each table, so it holds a table of
+        rows in memory at a time.
+        """
+        cell_separator = self.options.separator
+        cell_format = CellQuote(separator_string=cell_separator)
+        prefix = ''
+        for rows in self._iter_tables():
+            for row in rows:
+                yield prefix + cell_separator.join(map(cell_format.quote, map(str, row)))
+                prefix = '\n'
+            prefix = '\n\n'
 
     def _build_output(self, tables):
         layout = self.options.layout
@@ -331,64 +338,132 @@ class TableExport(object):
             out.append(row_separator.join(rows))
         return table_separator.join(out)
 
-    def _do_export(self, tables):
-        from main.models import Assay, Line, Measurement, MeasurementValue, Protocol, Study
-        # add data from each exported measurement; already sorted by protocol
+    def _iter_tables(self):
+        """ Yields an iterable of rows for each table in the export. """
+        if self.options.line_section:
+            yield self._iter_line_table()
+        if self.options.layout == ExportOption.DATA_COLUMN_BY_POINT:
+            build_table = self._iter_point_table
+        else:
+            # first pass over the selection finds the X values used as columns in each table
+            self._x_values = self._load_x_values()
+            build_table = self._iter_pivot_table
+            if self.options.layout == ExportOption.LINE_COLUMN_BY_DATA:
+                build_table = self._transpose_table(build_table)
+        # measurements are sorted by protocol, so each table is a contiguous run of measurements
+        empty = True
+        for table_key, measures in groupby(self._iter_measures(), key=self._table_key):
+            empty = False
+            yield build_table(table_key, measures)
+        # without protocol sections, there is always a table, even when nothing is selected
+        if empty and not self.options.protocol_section:
+            yield build_table('all', [])
+
+    def _iter_line_table(self):
+        from main.models import Line, Study
+        line_only = [Line, Study, ]
+        yield self._output_line_header()
+        lines = Line.objects.filter(
+            assay__measurement__in=self.selection.measurements.values('pk'),
+        ).distinct().order_by('pk').select_related(
+            'contact',
+            'experimenter',
+            'study__contact',
+        ).prefetch_related(
+            'carbon_source',
+            'strains',
+        )
+        for line in lines:
+            yield self._output_row_with_line(line, None, models=line_only)
+
+    def _iter_measures(self):
+        """ Yields the selected measurements, with values prefetched in batches. """
+        from main.models import MeasurementValue
         value_qs = MeasurementValue.objects.select_related('updated').order_by('x')
-        measures = self.selection.measurements.prefetch_related(
+        lookups = [
             Prefetch('measurementvalue_set', queryset=value_qs, to_attr='pf_values'),
-            Prefetch('assay__line__strains'),
-            Prefetch('assay__line__carbon_source'),
-        )
-        print("-----|||||----- Queried Measurement 2")
+            'series',
+            'assay__line__strains',
+            'assay__line__carbon_source',
+        ]
+        # QuerySet.iterator() streams results from a server-side cursor
+        measures = self.selection.measurements.iterator()
+        while True:
+            batch = list(islice(measures, self.MEASURE_BATCH_SIZE))
+            if not batch:
+                break
+            prefetch_related_objects(batch, *lookups)
+            for measurement in batch:
+                yield measurement
+
+    def _iter_pivot_table(self, table_key, measures):
+        all_x = self._x_values.get(table_key, [])
+        yield self._table_header() + [x[0] for x in all_x]
         for measurement in measures:
-            assay = measurement.assay
-            protocol = assay.protocol
-            line = assay.line
-            if self.options.line_section:
-                line_only = [Line, Study, ]
-                other_only = [Assay, Measurement, Protocol, ]
-                # add row to line table w/ Study, Line columns only
-                if line.id not in tables['line']:
-                    row = self._output_row_with_measure(measurement, models=line_only)
-                    tables['line'][line.id] = row
-                # create row for protocol/all table w/ Protocol, Assay, Measurement columns only
-                row = self._output_row_with_measure(measurement, models=other_only)
-            else:
-                # create row for protocol/all table
-                row = self._output_row_with_measure(measurement)
-            table, table_key = self._init_tables_for_protocol(tables, protocol)
-            values = measurement.pf_values  # prefetched above
-            if self.options.layout == ExportOption.DATA_COLUMN_BY_POINT:
-                for value in values:
-                    arow = row[:]
-                    arow.append(value_str(value.x))
-                    arow.append(value_str(value.y))
-                    table[value.id] = arow
-            else:
-                # keep track of all x values encountered in the table
-                xx = self._x_values[table_key] = self._x_values.get(table_key, {})
-                # do value_str to the float-casted version of x to eliminate 0-padding
-                xx.update({value_str(v.x): v.x for v in values})
-                squashed = {value_str(v.x): value_str(v.y) for v in values}
-                row.append(squashed)
-                table[measurement.id] = row
-
-    def _init_tables_for_protocol(self, tables, protocol):
-        if self.options.protocol_section:
-            if protocol.id not in tables:
-                tables[protocol.id] = OrderedDict()
-                header = []
-                if self.options.line_section:
-                    header += self._output_measure_header()
-                else:
-                    header += self._output_header()
-                tables[protocol.id]['header'] = header
-            table_key = protocol.id
-        else:
-            table_key = 'all'
-        table = tables[table_key]
-        return (table, table_key)
+            squashed = {value_str(v.x): value_str(v.y) for v in self._measure_values(measurement)}
+            yield self._measure_row(measurement) + [squashed.get(x[0], '') for x in all_x]
+
+    def _iter_point_table(self, table_key, measures):
+        yield self._table_header()
+        for measurement in measures:
+            row = self._measure_row(measurement)
+            for value in self._measure_values(measurement):
+                yield row + [value_str(value.x), value_str(value.y)]
+
+    def _load_x_values(self):
+        """
+        Loads the distinct X values in each table, as a list of (label, value) tuples sorted by
+        numeric value, without loading any measurements.
+        """
+        from main.models import MeasurementSeries, MeasurementValue
+        measures = self.selection.measurements.values('pk')
+        protocol_key = 'measurement__assay__protocol_id'
+        x_values = defaultdict(dict)
+        points = MeasurementValue.objects.filter(
+            measurement__in=measures,
+        ).values_list(protocol_key, 'x').distinct()
+        for protocol_id, x in points:
+            x_values[self._protocol_table_key(protocol_id)][value_str(x)] = x
+        series = MeasurementSeries.objects.filter(
+            measurement__in=measures,
+        ).values_list(protocol_key, 'x')
+        for protocol_id, xs in series:
+            table = x_values[self._protocol_table_key(protocol_id)]
+            table.update((value_str([x]), [x]) for x in xs)
+        # sort x values by original numeric values
+        return {
+            table_key: sorted(xx.items(), key=lambda a: list(map(float, a[1])))
+            for table_key, xx in x_values.items()
+        }
+
+    def _measure_row(self, measurement):
+        if self.options.line_section:
+            from main.models import Assay, Measurement, Protocol
+            other_only = [Assay, Measurement, Protocol, ]
+            return self._output_row_with_measure(measurement, models=other_only)
+        return self._output_row_with_measure(measurement)
+
+    def _measure_values(self, measurement):
+        series = measurement.get_series()
+        if series is not None:
+            return series.to_values()
+        return measurement.pf_values  # prefetched in _iter_measures
+
+    def _protocol_table_key(self, protocol_id):
+        return protocol_id if self.options.protocol_section else 'all'
+
+    def _table_header(self):
+        if self.options.line_section:
+            return self._output_measure_header()
+        return self._output_header()
+
+    def _table_key(self, measurement):
+        return self._protocol_table_key(measurement.assay.protocol_id)
+
+    def _transpose_table(self, build_table):
+        def _transposed(table_key, measures):
+            return zip(*list(build_table(table_key, measures)))
+        return _transposed
 
     def _output_header(self, models=None):
         row = []
@@ -449,6 +524,10 @@ class WorklistExport(TableExport):
             self._do_worklist(tables)
         return self._build_output(tables)
 
+    def iter_output(self):
+        # worklists are built from lines, and are small enough to output in one chunk
+        yield self.output()
+
     def _do_worklist(self, tables):
         # if export is a worklist, go off of lines instead of measurements
         lines = self.selection.lines
@@ -20,8 +20,6 @@ from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
 from functools import partial
 
-from jbei.rest.auth import HmacAuth
-from jbei.rest.clients.ice import IceApi
 from .models import (
     Assay, Attachment, CarbonSource, Comment, Line, Measurement, MeasurementType,
     MeasurementValue, MetaboliteExchange, MetaboliteSpecies, MetadataType, Protocol, Strain,
@@ -137,12 +135,11 @@ class RegistryValidator(object):
         self.entry = None
 
     def load_part_from_ice(self, registry_id):
+        from main.tasks import create_ice_connection
         update = Update.load_update()
         user_email = update.mod_by.email
         try:
-            ice = IceApi(auth=HmacAuth(key_id=settings.ICE_KEY_ID, username=user_email),
-                         verify_ssl_cert=settings.VERIFY_ICE_CERT)
-            ice.timeout = settings.ICE_REQUEST_TIMEOUT
+            ice = create_ice_connection(user_email)
             self.entry = ice.get_entry(registry_id)
             self.entry.url = ''.join((ice.base_url, '/entry/', str(self.entry.id),))
         except Exception:
@@ -376,15 +373,12 @@ class CreateStudyForm(forms.ModelForm):
         # self.fields exists after super.__init__()
         if self._user:
             # make sure lines are in a readable study
-            q = Study.user_permission_q(
-                self._user,
-                StudyPermission.READ,
-                keyword_prefix='study__',
-            )
             if self._user.is_superuser:
                 queryset = Line.objects.filter()
             else:
-                queryset = Line.objects.filter(q)
+                queryset = Line.objects.filter(study_id__in=Study.user_permission_ids(
+                    self._user, StudyPermission.CAN_VIEW,
+                ))
             self.fields['lineId'].queryset = queryset
 
     def save(self, commit=True, force_insert=False, force_update=False, *args, **kwargs):
@@ -15,6 +15,7 @@ from django.core.urlresolvers import reverse
 from django.db import transaction
 from django.utils.translation import ugettext as _
 from io import BytesIO
+from multiprocessing.pool import ThreadPool
 from openpyxl import load_workbook
 from pprint import pformat
 
@@ -712,72 +713,83 @@ class CombinatorialCreationImporter(object):
             )
             return
 
-        list_position = 0
-
         # treat inability to locate an individual part as an error unless specifically
         # requested to ignore on this attempt
         treat_as_error = not ignore_ice_related_errors
 
-        for local_ice_part_number in part_numbers:
-            # query ICE for this part
-            found_entry = None
+        def fetch_entry(local_ice_part_number):
+            # query ICE for this part. Returns a (part number, entry, forbidden) tuple; catch only
+            # permission errors, which are useful to detect on multiple parts in one attempt.
+            # Other HTTPErrors, ConnectionErrors, and similar that are more likely to be systemic
+            # propagate out of the pool and abort the remaining ICE queries.
             try:
-                found_entry = ice.get_entry(local_ice_part_number)
-
-            # catch only HTTPErrors, which are likely to apply only to a single request/ICE entry.
-            # Note that ConnectionErrors and similar that are more likely to be systemic aren't
-            # caught here and will immediately abort the remaining ICE queries.
+                return local_ice_part_number, ice.get_entry(local_ice_part_number), False
             except requests.exceptions.HTTPError as http_err:
-                # Track errors, while providing special-case error handling/labeling for ICE
-                # permissions errors that are useful to detect on multiple parts in one attempt.
-                # Note that depending on the error type, there may not be a response
-
-                # if error reflects a condition likely to repeat for each entry,
-                # or that isn't useful to know individually per entry, abort the remaining queries.
-                # Note this test only covers the error conditions known to be produced by
-                # ICE, not all the possible HTTP error codes we could handle more explicitly. Also
-                # note that 404 is handled above in get_entry().
-                if http_err.response.status_code == FORBIDDEN:
+                # Note that depending on the error type, there may not be a response. Also note
+                # that 404 is handled in get_entry().
+                if http_err.response is not None and http_err.response.status_code == FORBIDDEN:
+                    return local_ice_part_number, None, True
+                raise
+
+        # issue the lookups concurrently; each is a separate HTTPS round trip to ICE. Results
+        #   come back in the order of part_numbers, so errors are reported in a stable order
+        pool = ThreadPool(max(1, min(settings.EDD_ICE_LOOKUP_WORKERS, len(part_numbers))))
+        try:
+            results = pool.imap(fetch_entry, part_numbers)
+            for local_ice_part_number, found_entry, forbidden in results:
+                if forbidden:
                     # aggregate errors that are helpful to detect on a per-part basis
                     if not ignore_ice_related_errors:
                         self.add_error(SINGLE_PART_ACCESS_ERROR_CATEGORY,
                                        FORBIDDEN_PART_KEY, local_ice_part_number)
                     continue
-                else:
-                    self._handle_systemic_ice_error(ignore_ice_related_errors,
-                                                    part_numbers, part_number_to_part)
-                    return
-
-            if found_entry:
-                part_number_to_part[local_ice_part_number] = found_entry
-
-                # for now, only allow strain creation in EDD -- non-strains are not currently
-                # supported. see EDD-239.
-                if not isinstance(found_entry, IceStrain):
-                    self.add_error(SINGLE_PART_ACCESS_ERROR_CATEGORY, NON_STRAIN_ICE_ENTRY,
-                                   found_entry.part_id)
-
-                # double-check for a coding error that occurred during testing. initial test parts
-                # had "JBX_*" part numbers that matched their numeric ID, but this isn't always the
-                # case!
-                if found_entry.part_id != local_ice_part_number:
-                    logger.error(
-                        "Couldn't locate ICE entry \"%(csv_part_number)s\" "
-                        "(#%(list_position)d in the file) by part number. An ICE entry was "
-                        "found with numeric ID %(numeric_id)s, but its part number "
-                        "(%(part_number)s) didn't match the search part number" % {
-                            'csv_part_number': local_ice_part_number,
-                            'list_position': list_position, 'numeric_id': found_entry.id,
-                            'part_number': found_entry.part_id
-                        })
-                    self.add_error(INTERNAL_EDD_ERROR_CATEGORY,
-                                   FOUND_PART_NUMBER_DOESNT_MATCH_QUERY,
-                                   found_entry.part_id)
-
-            elif treat_as_error:
-                # collect the full set of missing strains rather than failing after the first
-                self.add_error(SINGLE_PART_ACCESS_ERROR_CATEGORY, PART_NUMBER_NOT_FOUND,
-                               local_ice_part_number)
+                self._check_ice_entry(local_ice_part_number, found_entry, part_number_to_part,
+                                      treat_as_error)
+        # if error reflects a condition likely to repeat for each entry, or that isn't useful to
+        # know individually per entry, abort the remaining queries. Note this test only covers
+        # the error conditions known to be produced by ICE, not all the possible HTTP error codes
+        # we could handle more explicitly.
+        except requests.exceptions.HTTPError:
+            self._handle_systemic_ice_error(ignore_ice_related_errors,
+                                            part_numbers, part_number_to_part)
+        finally:
+            pool.terminate()
+
+    def _check_ice_entry(self, local_ice_part_number, found_entry, part_number_to_part,
+                         treat_as_error):
+        """
+        Records an entry found in ICE for a part number, or errors for missing or unexpected
+        entries.
+        """
+        if found_entry:
+            part_number_to_part[local_ice_part_number] = found_entry
+
+            # for now, only allow strain creation in EDD -- non-strains are not currently
+            # supported. see EDD-239.
+            if not isinstance(found_entry, IceStrain):
+                self.add_error(SINGLE_PART_ACCESS_ERROR_CATEGORY, NON_STRAIN_ICE_ENTRY,
+                               found_entry.part_id)
+
+            # double-check for a coding error that occurred during testing. initial test parts
+            # had "JBX_*" part numbers that matched their numeric ID, but this isn't always the
+            # case!
+            if found_entry.part_id != local_ice_part_number:
+                logger.error(
+                    "Couldn't locate ICE entry \"%(csv_part_number)s\" by part number. An ICE "
+                    "entry was found with numeric ID %(numeric_id)s, but its part number "
+                    "(%(part_number)s) didn't match the search part number" % {
+                        'csv_part_number': local_ice_part_number,
+                        'numeric_id': found_entry.id,
+                        'part_number': found_entry.part_id
+                    })
+                self.add_error(INTERNAL_EDD_ERROR_CATEGORY,
+                               FOUND_PART_NUMBER_DOESNT_MATCH_QUERY,
+                               found_entry.part_id)
+
+        elif treat_as_error:
+            # collect the full set of missing strains rather than failing after the first
+            self.add_error(SINGLE_PART_ACCESS_ERROR_CATEGORY, PART_NUMBER_NOT_FOUND,
+                           local_ice_part_number)
 
     def _handle_systemic_ice_error(self, ignore_ice_related_errors, part_numbers, ice_entries):
         """
@@ -27,14 +27,15 @@ class IceTestStub(IceApi):
         self._query_num = 0
         self._fail_on_query_num = 2  # set to nonzero to test failure/partial success!
 
-    def get_entry(self, entry_id, suppress_errors=False):
+    def get_entry(self, entry_id, suppress_errors=False, use_cache=True):
         self._query_num += 1
 
         # if configured, work normally, deferring failure until the requested query #
         if self._query_num != self._fail_on_query_num:
             logger.debug('On query %d ...waiting to fail on #%d..' % (
                 self._query_num, self._fail_on_query_num))
-            return super(IceTestStub, self).get_entry(entry_id, suppress_errors=suppress_errors)
+            return super(IceTestStub, self).get_entry(entry_id, suppress_errors=suppress_errors,
+                                                      use_cache=use_cache)
 
         # NOTE: all tests below assume the first-run case where ignore_ice_related_errors=False.
         # All the expected results still hold if it's False, except the response should always be
@@ -7,10 +7,14 @@ from collections import defaultdict, OrderedDict, Sequence
 
 from arrow import utcnow
 from builtins import str
-from django.db.models import Q
+from django.db import router, transaction
+from django.db.models import CharField, Q
+from django.db.models.expressions import RawSQL
 from six import string_types
+from uuid import uuid4
 
-from main.models import Strain, MetadataType, Line, Assay
+from main.models import Assay, EDDObject, Line, MetadataType, Strain, Update
+from main.signals import study_lines_created
 from .constants import (INVALID_ASSAY_META_PK, INVALID_AUTO_NAMING_INPUT, INVALID_LINE_META_PK,
                         INVALID_PROTOCOL_META_PK, NON_UNIQUE_STRAIN_UUIDS, SUSPECTED_MATCH_STRAINS,
                         UNMATCHED_PART_NUMBER, INTERNAL_EDD_ERROR_CATEGORY, ZERO_REPLICATES,
@@ -19,6 +23,45 @@ from .constants import (INVALID_ASSAY_META_PK, INVALID_AUTO_NAMING_INPUT, INVALI
 
 logger = logging.getLogger(__name__)
 
+# SQL for the part ID or UUID at the end of a strain registry URL, e.g. https://ice/entry/parts/42/
+#   this expression is indexed in migration main.0011_strain_registry_index
+REGISTRY_PART_SQL = "substring(lower(registry_url) from '/parts/([^/]+)/?$')"
+# maximum rows in a single INSERT when creating lines and assays
+BULK_BATCH_SIZE = 500
+
+
+def _bulk_create_edd_objects(model, items, update, using):
+    """
+    Inserts unsaved instances of an EDDObject subclass. Django's bulk_create refuses multi-table
+    inheritance, so the edd_object rows are bulk created first, then the child rows are inserted
+    with the new parent keys. No save signals are sent, so the fields normally set in those
+    signals (uuid, created/updated, and the updates log) are filled in here.
+    """
+    if not items:
+        return
+    parent_fields = [f for f in EDDObject._meta.concrete_fields if not f.primary_key]
+    for item in items:
+        item.uuid = uuid4()
+        item.created = update
+        item.updated = update
+    parents = EDDObject.objects.using(using).bulk_create([
+        EDDObject(**{f.attname: getattr(item, f.attname) for f in parent_fields})
+        for item in items
+    ], batch_size=BULK_BATCH_SIZE)
+    for item, parent in zip(items, parents):
+        item.id = item.object_ref_id = parent.pk
+        item._state.adding = False
+        item._state.db = using
+    fields = model._meta.local_concrete_fields
+    for start in range(0, len(items), BULK_BATCH_SIZE):
+        batch = items[start:start + BULK_BATCH_SIZE]
+        model._base_manager.using(using)._insert(batch, fields=fields, using=using)
+    EDDObjectUpdate = EDDObject.updates.through
+    EDDObjectUpdate.objects.using(using).bulk_create([
+        EDDObjectUpdate(eddobject_id=parent.pk, update_id=update.pk)
+        for parent in parents
+    ], batch_size=BULK_BATCH_SIZE)
+
 
 class NamingStrategy(object):
     """
@@ -110,7 +153,9 @@ class NewLineAndAssayVisitor(object):
 class LineAndAssayCreationVisitor(NewLineAndAssayVisitor):
     """
     A NewLineAndAssayVisitor that's responsible for creating new Lines and Assays during the
-    combinatorial line/assay creation or template file upload process.
+    combinatorial line/assay creation or template file upload process. Visited lines and assays
+    are only collected in memory; call flush() once the visit is complete to insert them all into
+    the database in a handful of statements.
     """
     def __init__(self, study_pk, strains_by_pk, replicate_count):
         super(LineAndAssayCreationVisitor, self).__init__(study_pk, replicate_count)
@@ -118,6 +163,10 @@ class LineAndAssayCreationVisitor(NewLineAndAssayVisitor):
         self.require_strains = True
         self.strains_by_pk = strains_by_pk
         self._first_replicate = None
+        # list of (Line, [strain_pk]) pending insert
+        self._line_strains = []
+        # list of (Line, Assay) pending insert
+        self._line_assays = []
 
     def visit_line(self, line_name, description, is_control, strain_ids, line_metadata_dict,
                    replicate_num):
@@ -131,7 +180,7 @@ class LineAndAssayCreationVisitor(NewLineAndAssayVisitor):
         else:
             strains = [strain_ids]
 
-        line = Line.objects.create(
+        line = Line(
             name=line_name,
             description=description,
             control=is_control,
@@ -139,8 +188,7 @@ class LineAndAssayCreationVisitor(NewLineAndAssayVisitor):
             meta_store=hstore_compliant_dict,
             replicate=self._first_replicate
         )
-        line.save()
-        line.strains.add(*strains)
+        self._line_strains.append((line, [getattr(s, 'pk', s) for s in strains]))
         self.lines_created.append(line)
 
         if (replicate_num == 1) and (self.replicate_count > 1):
@@ -158,14 +206,41 @@ class LineAndAssayCreationVisitor(NewLineAndAssayVisitor):
             for pk, value in assay_metadata_dict.items() if value
         }
 
-        assay = Assay.objects.create(
+        assay = Assay(
             name=assay_name,
-            line_id=line.pk,
             protocol_id=protocol_pk,
             meta_store=hstore_compliant_dict
         )
+        self._line_assays.append((line, assay))
         assays_list.append(assay)
 
+    def flush(self, study):
+        """
+        Inserts all lines, assays, and line/strain links collected by this visitor, then sends a
+        single study_lines_created signal in place of the per-object save signals.
+        :param study: the Study the visited lines belong to
+        """
+        if not self._line_strains:
+            return
+        using = router.db_for_write(Line)
+        with transaction.atomic(using=using, savepoint=False):
+            update = Update.load_update()
+            _bulk_create_edd_objects(Line, self.lines_created, update, using)
+            for line, assay in self._line_assays:
+                assay.line = line
+            _bulk_create_edd_objects(Assay, [assay for _, assay in self._line_assays], update,
+                                     using)
+            LineStrain = Line.strains.through
+            LineStrain.objects.using(using).bulk_create([
+                LineStrain(line_id=line.pk, strain_id=strain_pk)
+                for line, strain_pks in self._line_strains
+                for strain_pk in strain_pks
+            ], batch_size=BULK_BATCH_SIZE)
+        strains = {pk for _, strain_pks in self._line_strains for pk in strain_pks}
+        self._line_strains = []
+        self._line_assays = []
+        study_lines_created.send(sender=Line, study=study, strains=strains, using=using)
+
 
 class LineAndAssayNamingVisitor(NewLineAndAssayVisitor):
     """
@@ -619,6 +694,7 @@ class CombinatorialDescriptionInput(object):
         """
         visitor = LineAndAssayCreationVisitor(study.pk, strains_by_pk, self.replicate_count)
         self._visit_study(study, visitor, line_metadata_types, assay_metadata_types, strains_by_pk)
+        visitor.flush(study)
         return visitor
 
     def _visit_study(self, study, visitor, line_metadata_types=None,
@@ -899,28 +975,26 @@ def find_existing_strains(ice_parts_by_number, importer):
     :return: two collections; the first is a dict mapping Part ID to EDD Strain, the second is a
         list of ICE strains not found to have EDD Strain entries
     """
-    # TODO: following EDD-158, consider doing a bulk query here instead of tiptoeing around strain
-    # curation issues
-
     # maps part number -> existing EDD strain (with part number temporarily cached)
     existing = OrderedDict()
     not_found = []
-
-    for ice_entry in ice_parts_by_number.itervalues():
-        # search for the strain by registry ID. Note we use search instead of .get() until the
-        # database consistently contains/requires ICE UUID's and enforces uniqueness
-        # constraints for them (EDD-158).
-        found_strains_qs = Strain.objects.filter(registry_id=ice_entry.uuid)
-        # if one or more strains are found with this UUID
-        if found_strains_qs:
-            if len(found_strains_qs) == 1:
-                edd_strain = found_strains_qs.get()
-                existing[ice_entry.part_id] = edd_strain
-            else:
-                importer.add_error(INTERNAL_EDD_ERROR_CATEGORY, NON_UNIQUE_STRAIN_UUIDS,
-                                   ice_entry.uuid, '')
-        # if no EDD strains were found with this UUID, look for candidate strains by URL.
-        # Code from here forward is attempted workarounds for EDD-158
+    ice_entries = list(ice_parts_by_number.values())
+
+    # search for all strains by registry ID in one query. Note we don't assume a single match
+    # until the database consistently contains/requires ICE UUID's and enforces uniqueness
+    # constraints for them (EDD-158).
+    strains_by_uuid = defaultdict(list)
+    uuids = [ice_entry.uuid for ice_entry in ice_entries]
+    for strain in Strain.objects.filter(registry_id__in=uuids):
+        strains_by_uuid[str(strain.registry_id)].append(strain)
+
+    for ice_entry in ice_entries:
+        found_strains = strains_by_uuid.get(str(ice_entry.uuid), [])
+        if len(found_strains) == 1:
+            existing[ice_entry.part_id] = found_strains[0]
+        elif found_strains:
+            importer.add_error(INTERNAL_EDD_ERROR_CATEGORY, NON_UNIQUE_STRAIN_UUIDS,
+                               ice_entry.uuid, '')
         else:
             logger.debug(
                 "ICE entry %(part_id)s (pk=%(pk)d) couldn't be located in EDD's database by "
@@ -930,44 +1004,53 @@ def find_existing_strains(ice_parts_by_number, importer):
                 }
             )
             not_found.append(ice_entry)
-            url_regex = r'.*/parts/%(id)s(?:/?)'
-            # look for candidate strains by pk-based URL (if present: more static / reliable
-            # than name)
-            found_strains_qs = Strain.objects.filter(
-                registry_url__iregex=url_regex % {'id': str(ice_entry.id)},
-            )
-            if found_strains_qs:
-                importer.add_warning(INTERNAL_EDD_ERROR_CATEGORY, SUSPECTED_MATCH_STRAINS,
-                                     _build_suspected_match_msg(ice_entry, found_strains_qs))
-                continue
-            # look for candidate strains by UUID-based URL
-            found_strains_qs = Strain.objects.filter(
-                registry_url__iregex=(url_regex % {'id': str(ice_entry.uuid)})
-            )
-            if found_strains_qs:
-                importer.add_warning(
-                        INTERNAL_EDD_ERROR_CATEGORY, SUSPECTED_MATCH_STRAINS,
-                        _build_suspected_match_msg(ice_entry, found_strains_qs))
-                continue
-            # if no strains were found by URL, search by name
-            empty_or_whitespace_regex = r'$\s*^'
-            no_registry_id = (
-                Q(registry_id__isnull=True) |
-                Q(registry_id__regex=empty_or_whitespace_regex)
-            )
-            found_strains_qs = Strain.objects.filter(
-                no_registry_id,
-                name__icontains=ice_entry.name,
-            )
-            if found_strains_qs:
-                importer.add_warning(INTERNAL_EDD_ERROR_CATEGORY, SUSPECTED_MATCH_STRAINS,
-                                     _build_suspected_match_msg(ice_entry, found_strains_qs))
-                continue
+
+    # if no EDD strains were found with a UUID, look for candidate strains by URL, then by name.
+    # Code from here forward is attempted workarounds for EDD-158
+    if not_found:
+        _warn_suspected_matches(not_found, importer)
     return existing, not_found
 
 
-def _build_suspected_match_msg(ice_entry, found_strains_qs):
+def _warn_suspected_matches(ice_entries, importer):
+    """
+    Searches for strains that may match ICE entries missing from EDD, first by the part ID or
+    UUID at the end of the registry URL (more static / reliable than name), then by name for
+    strains lacking a registry ID; adding a warning for each entry with candidate matches. Runs
+    one query for all entries by URL, using the expression index on the normalized registry URL;
+    and one query for all entries by name, using the trigram index on UPPER(name::text) that
+    serves the __icontains lookups. The queries are separate, as the URL and name are in
+    different tables, and an OR spanning both tables cannot use either index.
+    """
+    part_keys = set()
+    name_filter = Q()
+    for ice_entry in ice_entries:
+        part_keys.update((str(ice_entry.id), str(ice_entry.uuid).lower()))
+        if ice_entry.name:
+            name_filter |= Q(name__icontains=ice_entry.name)
+    by_part = defaultdict(list)
+    by_name = []
+    candidates = Strain.objects.annotate(
+        registry_part=RawSQL(REGISTRY_PART_SQL, [], output_field=CharField()),
+    ).filter(registry_part__in=part_keys)
+    for strain in candidates:
+        by_part[strain.registry_part].append(strain)
+    if name_filter:
+        by_name = list(Strain.objects.filter(name_filter, registry_id__isnull=True))
+    for ice_entry in ice_entries:
+        entry_name = (ice_entry.name or '').lower()
+        found_strains = (
+            by_part.get(str(ice_entry.id)) or
+            by_part.get(str(ice_entry.uuid).lower()) or
+            [strain for strain in by_name if entry_name and entry_name in strain.name.lower()]
+        )
+        if found_strains:
+            importer.add_warning(INTERNAL_EDD_ERROR_CATEGORY, SUSPECTED_MATCH_STRAINS,
+                                 _build_suspected_match_msg(ice_entry, found_strains))
+
+
+def _build_suspected_match_msg(ice_entry, found_strains):
     return '{%(ice_entry)s, suspected matches = (%(suspected_matches)s)}' % {
         'ice_entry': ice_entry,
-        'suspected_matches': ', '.join(strain.pk for strain in found_strains_qs),
+        'suspected_matches': ', '.join(str(strain.pk) for strain in found_strains),
     }
@@ -6,6 +6,7 @@ from builtins import str
 from collections import namedtuple
 from io import StringIO
 
+from edd_utils.downsample import DEFAULT_METHOD
 from edd_utils.parsers import biolector, excel, hplc, skyline
 
 
@@ -28,6 +29,9 @@ class ImportFileTypeFlags(object):
     XML = 'xml'
 
 
+# maps (import mode, file type) to functions taking an uploaded file, a thin value for the
+#   maximum points per record in parsed time-series, and the edd_utils.downsample method name
+#   used to thin them; the thin options are ignored by parsers of tables
 parser_registry = {}
 
 
@@ -35,16 +39,16 @@ def find_parser(import_mode, file_type):
     return parser_registry.get((import_mode, file_type), None)
 
 
-def biolector_parser(request):
+def biolector_parser(request, thin=0, thin_method=DEFAULT_METHOD):
     # We pass the request directly along, so it can be read as a stream by the parser
     return ParsedInput(
         ImportFileTypeFlags.XML,
-        biolector.getRawImportRecordsAsJSON(request, 0),
+        biolector.getRawImportRecordsAsJSON(request, thin, thin_method),
     )
 parser_registry[(ImportModeFlags.BIOLECTOR, ImportFileTypeFlags.XML)] = biolector_parser
 
 
-def csv_parser(request):
+def csv_parser(request, thin=0, thin_method=DEFAULT_METHOD):
     return ParsedInput(
         ImportFileTypeFlags.CSV,
         request.read()
@@ -54,7 +58,7 @@ parser_registry[(ImportModeFlags.TRANSCRIPTOMICS, ImportFileTypeFlags.CSV)] = cs
 parser_registry[(ImportModeFlags.MASS_DISTRIBUTION, ImportFileTypeFlags.CSV)] = csv_parser
 
 
-def excel_parser(request):
+def excel_parser(request, thin=0, thin_method=DEFAULT_METHOD):
     return ParsedInput(
         ImportFileTypeFlags.EXCEL,
         excel.import_xlsx_tables(file=request)
@@ -64,7 +68,7 @@ parser_registry[(ImportModeFlags.TRANSCRIPTOMICS, ImportFileTypeFlags.EXCEL)] =
 parser_registry[(ImportModeFlags.MASS_DISTRIBUTION, ImportFileTypeFlags.EXCEL)] = excel_parser
 
 
-def skyline_csv_parser(request):
+def skyline_csv_parser(request, thin=0, thin_method=DEFAULT_METHOD):
     # we could get Mac-style \r line endings, need to use StringIO to handle
     parser = skyline.SkylineParser()
     spreadsheet = [row.split(',') for row in StringIO(str(request.read()), newline=None)]
@@ -75,7 +79,7 @@ def skyline_csv_parser(request):
 parser_registry[(ImportModeFlags.SKYLINE, ImportFileTypeFlags.CSV)] = skyline_csv_parser
 
 
-def skyline_excel_parser(request):
+def skyline_excel_parser(request, thin=0, thin_method=DEFAULT_METHOD):
     parser = skyline.SkylineParser()
     spreadsheet = excel.import_xlsx_tables(file=request)
     return ParsedInput(
@@ -85,9 +89,9 @@ def skyline_excel_parser(request):
 parser_registry[(ImportModeFlags.SKYLINE, ImportFileTypeFlags.EXCEL)] = skyline_excel_parser
 
 
-def hplc_parser(request):
+def hplc_parser(request, thin=0, thin_method=DEFAULT_METHOD):
     return ParsedInput(
         ImportFileTypeFlags.PLAINTEXT,
-        hplc.getRawImportRecordsAsJSON(request)
+        hplc.getRawImportRecordsAsJSON(request, thin, thin_method)
     )
 parser_registry[(ImportModeFlags.HPLC, ImportFileTypeFlags.PLAINTEXT)] = hplc_parser
@@ -7,10 +7,10 @@ import re
 import warnings
 
 from celery import shared_task
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from django.contrib.auth import get_user_model
 from django.core.exceptions import PermissionDenied
-from django.db import transaction
+from django.db import connection, transaction
 from django.utils.translation import ugettext as _
 from six import string_types
 
@@ -20,12 +20,17 @@ from .. import models
 logger = logging.getLogger(__name__)
 MType = namedtuple('MType', ['compartment', 'type', 'unit', ])
 NO_TYPE = MType(models.Measurement.Compartment.UNKNOWN, None, None)
+# the DecimalField definition for individual values in MeasurementValue.x and .y
+_VALUE_FIELD = models.MeasurementValue._meta.get_field('x').base_field
 
 
 MODE_PROTEOMICS = 'pr'
 MODE_SKYLINE = 'skyline'
 MODE_TRANSCRIPTOMICS = 'tr'
 
+# number of points written in each INSERT or UPDATE statement during an import
+POINT_BATCH_SIZE = 1000
+
 
 @shared_task
 def import_task(study_id, user_id, data):
@@ -85,11 +90,64 @@ class TableImport(object):
         :return:
         :raises: ValidationError if no data are provided to import
         """
+        series = self.prepare_series(data)
+        return self.create_measurements(series)
+
+    def prepare_series(self, data):
+        """
+        Parses the series in the import data, and resolves the Line and Assay for each series,
+        creating any new Line and Assay records requested.
+        :param data: the import data
+        :return: the list of series, with a loaded Assay in the assay_obj key of each valid series
+        """
         self._data = data
         series = json.loads(data.get('jsonoutput', '[]'))
         self.check_series_points(series)
         self.init_lines_and_assays(series)
-        return self.create_measurements(series)
+        return series
+
+    def dump_series(self, series):
+        """
+        Converts series from prepare_series to a JSON-serializable list, replacing loaded Assay
+        objects with their IDs, and flagging series in Lines created by the import;
+        load_series reverses the conversion.
+        """
+        created_lines = {line.pk for line in self._line_lookup.values()}
+        dumped = []
+        for item in series:
+            item = dict(item)
+            assay = item.pop('assay_obj', None)
+            if assay is not None:
+                item['assay_id'] = assay.pk
+                item['created_line'] = assay.line_id in created_lines
+            dumped.append(item)
+        return dumped
+
+    def load_series(self, data, series):
+        """
+        Restores series saved from dump_series, loading all referenced Assay records in a single
+        query, and the Lines created by the import so finish_import refreshes them. Does not
+        create any new Line or Assay records.
+        :param data: the import data
+        :param series: a list of series returned from dump_series
+        :return: the list of series, with a loaded Assay in the assay_obj key of each valid series
+        :raises: ValueError if any Assay in the series does not exist, e.g. when the transaction
+            of prepare_series did not commit
+        """
+        self._data = data
+        self.check_series_points(series)
+        valid = [item for item in series if 'assay_id' in item]
+        assays = models.Assay.objects.filter(
+            line__study_id=self._study.pk,
+        ).select_related('line').in_bulk([item['assay_id'] for item in valid])
+        for item in valid:
+            assay = assays.get(int(item['assay_id']), None)
+            if assay is None:
+                raise ValueError('Prepared import references missing Assay %s' % item['assay_id'])
+            item['assay_obj'] = assay
+            if item.get('created_line', False):
+                self._line_lookup[assay.line.name] = assay.line
+        return series
 
     def check_series_points(self, series):
         """
@@ -214,13 +272,20 @@ class TableImport(object):
         return result
 
     def create_measurements(self, series):
+        (added, updated) = self.import_series(series)
+        self.finish_import()
+        return (added, updated)
+
+    def import_series(self, series, offset=0):
+        """
+        Creates or updates measurements for a list of prepared series.
+        :param series: list of series, as returned by prepare_series or load_series
+        :param offset: index of the first item of series in the full import, used in logging
+        :return: a tuple of (added, updated) counts of values
+        """
         added = 0
         updated = 0
-        # TODO: During a standard-size biolector import (~50000 measurement values) this loop runs
-        # very slowly on my test machine, consistently taking an entire second per set (approx 300
-        # values each). To an end user, this makes the submission appear to hang for over a
-        # minute, which might make them behave erratically...
-        for (index, item) in enumerate(series):
+        for (index, item) in enumerate(series, offset):
             points = item.get('data', [])
             meta = item.get('metadata_by_id', {})
             if item.get('nothing_to_import', False):
@@ -238,11 +303,14 @@ class TableImport(object):
                 self._process_metadata(assay, meta)
                 # force refresh of Assay's Update (also saves any changed metadata)
                 assay.save()
+        return (added, updated)
+
+    def finish_import(self):
+        """ Refreshes the Update on the study and any lines created by the import. """
         for line in self._line_lookup.values():
             # force refresh of Update (also saves any changed metadata)
             line.save()
         self._study.save()
-        return (added, updated)
 
     def _load_measurement_record(self, item):
         record = None
@@ -274,15 +342,78 @@ class TableImport(object):
         return record
 
     def _process_measurement_points(self, record, points):
-        added = 0
-        updated = 0
+        """
+        Merges the points of a series into a Measurement with set-based queries: a single query
+        loads the X values already stored, points at existing X values are changed with batched
+        UPDATE statements, and all other points are inserted with bulk_create.
+        :param record: the Measurement receiving the points
+        :param points: sequence of (x, y) pairs from the import data
+        :return: a tuple of (added, updated) counts of MeasurementValue records
+        """
+        # packed measurements are merged as individual points, then packed again
+        packed = record.get_series() is not None
+        if packed:
+            record.unpack_values()
+        # key on the value as stored in the database, so e.g. 1 and "1.000000" are the same point;
+        #   if the series repeats an X value, the last Y value wins
+        incoming = OrderedDict()
         for x, y in points:
             (xvalue, yvalue) = (self._extract_value(x), self._extract_value(y))
-            updated += record.measurementvalue_set.filter(x=xvalue).update(y=yvalue)
-            if updated == 0:
-                record.measurementvalue_set.create(x=xvalue, y=yvalue)
-                added += 1
-        return (added, updated)
+            incoming[self._point_key(xvalue)] = (xvalue, yvalue)
+        existing = {}
+        for pk, x in record.measurementvalue_set.values_list('pk', 'x'):
+            existing.setdefault(self._point_key(x), []).append(pk)
+        to_create = []
+        to_update = []
+        for key, (xvalue, yvalue) in incoming.items():
+            if key in existing:
+                to_update.extend((pk, yvalue) for pk in existing[key])
+            else:
+                # bulk_create skips the pre_save signal, so the Update must be set directly
+                to_create.append(models.MeasurementValue(
+                    measurement=record,
+                    updated_id=record.update_ref_id,
+                    x=xvalue,
+                    y=yvalue,
+                ))
+        models.MeasurementValue.objects.bulk_create(to_create, batch_size=POINT_BATCH_SIZE)
+        updated = self._update_measurement_points(record, to_update)
+        if packed:
+            record.pack_values()
+        return (len(to_create), updated)
+
+    def _update_measurement_points(self, record, values):
+        """
+        Sets new Y values on existing MeasurementValue records, using one UPDATE statement per
+        batch of POINT_BATCH_SIZE points.
+        :param record: the Measurement containing the points
+        :param values: list of (MeasurementValue ID, Y value) pairs
+        :return: count of updated MeasurementValue records
+        """
+        updated = 0
+        table = models.MeasurementValue._meta.db_table
+        with connection.cursor() as cursor:
+            for start in range(0, len(values), POINT_BATCH_SIZE):
+                batch = values[start:start + POINT_BATCH_SIZE]
+                rows = ', '.join(['(%s, %s::numeric(16, 5)[])'] * len(batch))
+                params = [record.update_ref_id]
+                for pk, yvalue in batch:
+                    params.extend([pk, yvalue])
+                cursor.execute(
+                    'UPDATE %(table)s AS mv SET y = v.y, updated_id = %%s '
+                    'FROM (VALUES %(rows)s) AS v(id, y) '
+                    'WHERE mv.id = v.id' % {'rows': rows, 'table': table},
+                    params
+                )
+                updated += cursor.rowcount
+        return updated
+
+    def _point_key(self, values):
+        """ Converts a list of point values to the hashable form saved to the database. """
+        return tuple(
+            _VALUE_FIELD.get_db_prep_save(value, connection)
+            for value in values
+        )
 
     def _process_metadata(self, assay, meta):
         if len(meta) > 0:
@@ -305,7 +436,7 @@ class TableImport(object):
     def _extract_value(self, value):
         # make sure input is string first, split on slash or colon, and give back array of numbers
         try:
-            return map(float, re.split('/|:', ('%s' % value).replace(',', '')))
+            return list(map(float, re.split('/|:', ('%s' % value).replace(',', ''))))
         except ValueError:
             warnings.warn('Value %s could not be interpreted as a number' % value)
         return []
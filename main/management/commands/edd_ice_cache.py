@@ -0,0 +1,52 @@
+"""
+Prewarm the cache of ICE entries used by EDD.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from multiprocessing.pool import ThreadPool
+
+from main.models import Strain
+from main.tasks import create_ice_connection
+
+
+class Command(BaseCommand):
+    help = 'Loads the ICE entry for every strain in EDD into the ICE entry cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            default=settings.ICE_ADMIN_ACCOUNT,
+            dest='user',
+            help='The ICE user whose view of entries is cached (default ICE_ADMIN_ACCOUNT). '
+                 'Cached entries are only used by connections for the same user.',
+        )
+        parser.add_argument(
+            '--workers',
+            default=getattr(settings, 'EDD_ICE_LOOKUP_WORKERS', 8),
+            dest='workers',
+            help='Number of concurrent requests to ICE.',
+            type=int,
+        )
+
+    def handle(self, *args, **options):
+        ice = create_ice_connection(options['user'])
+        if ice is None:
+            raise CommandError('ICE is not configured')
+        if ice.entry_cache is None:
+            raise CommandError('ICE entry cache is disabled by EDD_ICE_ENTRY_CACHE_TTL')
+        registry_ids = Strain.objects.filter(
+            registry_id__isnull=False,
+        ).values_list('registry_id', flat=True).distinct()
+        registry_ids = [str(registry_id) for registry_id in registry_ids]
+        print("Caching %s ICE entries" % len(registry_ids))
+
+        def fetch(registry_id):
+            return ice.get_entry(registry_id, suppress_errors=True, use_cache=False)
+
+        pool = ThreadPool(max(options['workers'], 1))
+        try:
+            found = sum(1 for entry in pool.imap_unordered(fetch, registry_ids) if entry)
+        finally:
+            pool.terminate()
+        print("Cached %s entries, %s not found" % (found, len(registry_ids) - found))
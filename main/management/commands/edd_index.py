@@ -1,42 +1,129 @@
-
 """
 Populate the Solr indexes used by EDD.
 """
 
-from django.core.management.base import BaseCommand
+import arrow
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max, Min, Q
 from django_auth_ldap.backend import LDAPBackend, _LDAPUser
+from multiprocessing.pool import ThreadPool
 
 from main import solr
 
 
 class Command(BaseCommand):
+    help = 'Rebuilds the Solr indices used by EDD, or updates them with recent changes.'
     backend = LDAPBackend()
-    study_core = solr.StudySearch()
-    user_core = solr.UserSearch()
-    measurement_core = solr.MeasurementTypeSearch()
-
-    def handle(self, *args, **kwargs):
-        print("Clearing user index")
-        self.user_core.swap().clear()
-        users_qs = self.user_core.get_queryset()
-        user_updates = map(self._copy_groups, users_qs)
-        print("Indexing %s users" % users_qs.count())
-        self.user_core.update(user_updates)
-        self.user_core.swap_execute()
-
-        print("Clearing studies index")
-        self.study_core.swap().clear()
-        study_qs = self.study_core.get_queryset()
-        print("Indexing %s studies" % study_qs.count())
-        self.study_core.update(study_qs)
-        self.study_core.swap_execute()
-
-        print("Clearing metabolite index")
-        self.measurement_core.swap().clear()
+    # number of objects loaded from the database and sent to Solr at once
+    batch_size = 500
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            default=False,
+            dest='incremental',
+            help='Update the live indices with objects changed after --since, instead of '
+                 'rebuilding the indices. Measurement types are not included.',
+        )
+        parser.add_argument(
+            '--since',
+            default=None,
+            dest='since',
+            help='With --incremental, an ISO 8601 timestamp of the earliest change to index.',
+        )
+        parser.add_argument(
+            '--workers',
+            default=1,
+            dest='workers',
+            help='Split each index by primary key range into this many shards, indexed '
+                 'concurrently (default 1).',
+            type=int,
+        )
+
+    def handle(self, *args, **options):
+        self.workers = max(options['workers'], 1)
+        self.commit_within = getattr(settings, 'EDD_SOLR_COMMIT_WITHIN', 10000)
+        if options['incremental']:
+            if options['since'] is None:
+                raise CommandError('--incremental requires a --since timestamp')
+            try:
+                since = arrow.get(options['since']).datetime
+            except Exception:
+                raise CommandError('Could not parse --since timestamp %s' % options['since'])
+            self._update_changes(since)
+        else:
+            self._rebuild()
+
+    def _rebuild(self):
+        users_qs = solr.UserSearch.get_queryset()
+        self._rebuild_core(solr.UserSearch(), users_qs, 'users', self._copy_groups)
+        study_qs = solr.StudySearch.get_queryset()
+        self._rebuild_core(solr.StudySearch(), study_qs, 'studies')
         metabolite_qs = solr.MeasurementTypeSearch.get_queryset()
-        print("Indexing %s metabolites" % metabolite_qs.count())
-        self.measurement_core.update(metabolite_qs)
-        self.measurement_core.swap_execute()
+        self._rebuild_core(solr.MeasurementTypeSearch(), metabolite_qs, 'metabolites')
+
+    def _rebuild_core(self, core, queryset, label, prepare=None):
+        print("Clearing %s index" % label)
+        core.swap().clear()
+        print("Indexing %s %s" % (queryset.count(), label))
+        self._index(core, queryset, prepare)
+        core.commit()
+        core.swap_execute()
+
+    def _update_changes(self, since):
+        users_qs = solr.UserSearch.get_queryset().filter(
+            Q(date_joined__gte=since) | Q(last_login__gte=since)
+        )
+        print("Indexing %s users changed since %s" % (users_qs.count(), since))
+        self._index(solr.UserSearch(), users_qs, self._copy_groups)
+        study_qs = solr.StudySearch.get_queryset().filter(updated__mod_time__gte=since)
+        print("Indexing %s studies changed since %s" % (study_qs.count(), since))
+        self._index(solr.StudySearch(), study_qs)
+
+    def _index(self, core, queryset, prepare=None):
+        """ Sends all objects in queryset to the core, in self.workers concurrent shards. """
+        bounds = queryset.order_by().aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            return
+        low, high = bounds['low'], bounds['high'] + 1
+        step = -(-(high - low) // self.workers)  # ceiling division
+        shards = [
+            (core, queryset, prepare, start, min(start + step, high))
+            for start in range(low, high, step)
+        ]
+        if len(shards) == 1:
+            self._index_shard(*shards[0])
+            return
+        pool = ThreadPool(len(shards))
+        try:
+            pool.map(self._index_pooled_shard, shards)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _index_pooled_shard(self, args):
+        try:
+            self._index_shard(*args)
+        finally:
+            # each thread has its own database connection, close it before the thread exits
+            connection.close()
+
+    def _index_shard(self, core, queryset, prepare, low, high):
+        """ Sends objects with primary key in [low, high) to the core, in batches. """
+        shard_qs = queryset.filter(pk__lt=high).order_by('pk')
+        while low < high:
+            # load a batch at a time, instead of materializing the whole queryset
+            batch = list(shard_qs.filter(pk__gte=low)[:self.batch_size])
+            if not batch:
+                break
+            low = batch[-1].pk + 1
+            if prepare is not None:
+                batch = [prepare(item) for item in batch]
+            core.update(batch, batch_size=self.batch_size, commit_within=self.commit_within)
 
     def _copy_groups(self, user):
         # Normally should use the following line:
@@ -0,0 +1,63 @@
+"""
+Converts measurement values between individual MeasurementValue rows and packed MeasurementSeries
+rows.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from main import models
+
+
+class Command(BaseCommand):
+    help = 'Packs values of scalar measurements into a single row per measurement.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--study',
+            action='append',
+            default=[],
+            dest='study',
+            help='Limit to measurements in the study with this ID; may be repeated.',
+            type=int,
+        )
+        parser.add_argument(
+            '--min-points',
+            default=100,
+            dest='min_points',
+            help='Only pack measurements with at least this many points (default 100).',
+            type=int,
+        )
+        parser.add_argument(
+            '--unpack',
+            action='store_true',
+            default=False,
+            dest='unpack',
+            help='Move packed values back to individual MeasurementValue rows.',
+        )
+
+    def handle(self, *args, **options):
+        qs = models.Measurement.objects.all()
+        if options['study']:
+            qs = qs.filter(assay__line__study_id__in=options['study'])
+        if options['unpack']:
+            qs = qs.filter(series__isnull=False)
+            action = models.Measurement.unpack_values
+        else:
+            qs = qs.filter(
+                measurement_format=models.Measurement.Format.SCALAR,
+                series__isnull=True,
+            ).annotate(
+                num_points=Count('measurementvalue'),
+            ).filter(num_points__gte=max(options['min_points'], 1))
+            action = models.Measurement.pack_values
+        count = 0
+        for measurement in qs.order_by('pk').iterator():
+            try:
+                with transaction.atomic():
+                    action(measurement)
+                count += 1
+            except ValueError as e:
+                self.stderr.write('Skipped: %s' % e)
+        self.stdout.write('Converted %d measurements' % count)
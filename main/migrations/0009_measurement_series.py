@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_unique_shortname'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeasurementSeries',
+            fields=[
+                ('measurement', models.OneToOneField(help_text='The Measurement containing this series of data.', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='series', serialize=False, to='main.Measurement', verbose_name='Measurement')),
+                ('x', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), help_text='X-axis values for the series.', size=None, verbose_name='X')),
+                ('y', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), help_text='Y-axis values for the series; NaN for undefined values.', size=None, verbose_name='Y')),
+                ('updated', models.ForeignKey(help_text='The Update triggering the setting of this series.', on_delete=django.db.models.deletion.PROTECT, to='main.Update', verbose_name='Updated')),
+            ],
+            options={
+                'db_table': 'measurement_series',
+                'verbose_name_plural': 'measurement series',
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+# (table, column) pairs searched by autocomplete; see main.autocomplete.TRIGRAM_SEARCH_FIELDS
+#   indexes are on the same UPPER(column::text) expression used by Django __icontains lookups
+TRIGRAM_INDEXED = (
+    ('auth_group', 'name'),
+    ('carbon_source', 'labeling'),
+    ('edd_object', 'description'),
+    ('edd_object', 'name'),
+    ('measurement_type', 'short_name'),
+    ('measurement_type', 'type_name'),
+    ('measurement_unit', 'alternate_names'),
+    ('measurement_unit', 'unit_name'),
+    ('metadata_group', 'group_name'),
+    ('metadata_type', 'type_name'),
+)
+
+
+def create_index(table, column):
+    return migrations.RunSQL(
+        sql='CREATE INDEX %(table)s_%(column)s_trgm ON %(table)s '
+            'USING gin ((UPPER(%(column)s::text)) gin_trgm_ops);' % {
+                'table': table,
+                'column': column,
+            },
+        reverse_sql='DROP INDEX %(table)s_%(column)s_trgm;' % {'table': table, 'column': column},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0007_alter_validators_add_error_messages'),
+        ('main', '0009_measurement_series'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+    ] + [
+        create_index(table, column) for (table, column) in TRIGRAM_INDEXED
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_trigram_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='strain',
+            name='registry_id',
+            field=models.UUIDField(blank=True, db_index=True, help_text='The unique ID of this strain in the ICE Registry.', null=True, verbose_name='Registry UUID'),
+        ),
+        # expression must match main.importer.experiment_desc.utilities.REGISTRY_PART_SQL
+        migrations.RunSQL(
+            sql="CREATE INDEX strain_registry_part ON strain "
+                "((substring(lower(registry_url) from '/parts/([^/]+)/?$')));",
+            reverse_sql='DROP INDEX strain_registry_part;',
+        ),
+    ]
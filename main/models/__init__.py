@@ -17,6 +17,7 @@ from .core import (  # noqa: F401
     EDDObject,
     Line,
     Measurement,
+    MeasurementSeries,
     MeasurementValue,
     Protocol,
     Strain,
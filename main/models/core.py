@@ -2,11 +2,12 @@
 from __future__ import absolute_import, unicode_literals
 
 """
-The core models: Study, Line, Assay, Measurement, MeasurementValue.
+The core models: Study, Line, Assay, Measurement, MeasurementValue, MeasurementSeries.
 """
 
 import arrow
 import json
+import math
 import os
 
 from builtins import str
@@ -26,6 +27,7 @@ from .measurement_type import MeasurementType, MeasurementUnit, Metabolite
 from .metadata import EDDMetadata, MetadataType
 from .update import Update
 from main.export import table  # TODO remove
+from main.redis import PermissionCache
 
 
 @python_2_unicode_compatible
@@ -446,21 +448,78 @@ class Study(EDDObject):
         """
         return user.is_superuser
 
+    @staticmethod
+    def user_permission_map(user):
+        """
+        Finds the effective permission types of a user, from permissions set on studies for the
+        user, for groups of the user, or for everyone. The map is cached in Redis, and memoized
+        on the user object for the rest of the request. Note that this does not include access
+        granted by the user's role. See:
+            @ user_role_can_read(user)
+        :param user: the user
+        :return: a dict of study ID to the strongest permission type granted on the study
+        """
+        permissions = getattr(user, '_study_permission_map', None)
+        if permissions is None:
+            cache = PermissionCache(user.pk)
+            version = cache.version()
+            content = cache.load(version)
+            if content is None:
+                permissions = Study._load_permission_map(user)
+                cache.save(version, json.dumps(permissions))
+            else:
+                permissions = {int(k): v for k, v in json.loads(content).items()}
+            user._study_permission_map = permissions
+        return permissions
+
+    @staticmethod
+    def user_permission_ids(user, permission):
+        """
+        Finds IDs of studies where the user has the permission, from user_permission_map(user).
+        :param user: the user
+        :param permission: the study permission type to test (e.g. StudyPermission.READ); can be
+            any iterable of permissions or a single permission
+        :return: a list of study IDs
+        """
+        perm = permission
+        if isinstance(permission, string_types):
+            perm = (permission, )
+        permissions = Study.user_permission_map(user)
+        return [study_id for (study_id, p) in permissions.items() if p in perm]
+
+    @staticmethod
+    def _load_permission_map(user):
+        from .permission import EveryonePermission, GroupPermission, StudyPermission
+        from .permission import UserPermission
+        fields = ('study_id', 'permission_type', )
+        # a single query for all three kinds of permission
+        rows = UserPermission.objects.filter(user=user).values_list(*fields).union(
+            GroupPermission.objects.filter(group__user=user).values_list(*fields),
+            EveryonePermission.objects.values_list(*fields),
+            all=True,
+        )
+        strength = {StudyPermission.READ: 1, StudyPermission.WRITE: 2}
+        permissions = {}
+        for (study_id, permission_type) in rows:
+            if strength.get(permission_type, 0) > strength.get(permissions.get(study_id), 0):
+                permissions[study_id] = permission_type
+        return permissions
+
     def user_can_read(self, user):
         """ Utility method testing if a user has read access to a Study. """
-        return user and (self.user_role_can_read(user) or any(p.is_read() for p in chain(
-            self.userpermission_set.filter(user=user),
-            self.grouppermission_set.filter(group__user=user),
-            self.everyonepermission_set.all(),
-        )))
+        from .permission import StudyPermission
+        return user and (
+            self.user_role_can_read(user) or
+            self.user_permission_map(user).get(self.pk) in StudyPermission.CAN_VIEW
+        )
 
     def user_can_write(self, user):
         """ Utility method testing if a user has write access to a Study. """
-        return super(Study, self).user_can_write(user) or any(p.is_write() for p in chain(
-            self.userpermission_set.filter(user=user),
-            self.grouppermission_set.filter(group__user=user),
-            self.everyonepermission_set.all(),
-        ))
+        from .permission import StudyPermission
+        return user and (
+            super(Study, self).user_can_write(user) or
+            self.user_permission_map(user).get(self.pk) in StudyPermission.CAN_EDIT
+        )
 
     @staticmethod
     def user_can_create(user):
@@ -661,6 +720,7 @@ class Strain(EDDObject, LineProperty):
     object_ref = models.OneToOneField(EDDObject, parent_link=True)
     registry_id = models.UUIDField(
         blank=True,
+        db_index=True,
         help_text=_('The unique ID of this strain in the ICE Registry.'),
         null=True,
         verbose_name=_('Registry UUID'),
@@ -1085,8 +1145,47 @@ class Measurement(EDDMetadata, EDDSerialize):
 
     def data(self):
         """ Return the data associated with this measurement. """
+        series = self.get_series()
+        if series is not None:
+            return series.to_values()
         return self.measurementvalue_set.all()
 
+    def get_series(self):
+        """ Return the packed MeasurementSeries of this measurement, or None if not packed. """
+        try:
+            return self.series
+        except MeasurementSeries.DoesNotExist:
+            return None
+
+    def pack_values(self):
+        """
+        Moves all MeasurementValue records of a scalar measurement into a single
+        MeasurementSeries record.
+        :raises ValueError: if the measurement is not scalar, or has a non-scalar point
+        """
+        if self.measurement_format != Measurement.Format.SCALAR:
+            raise ValueError('Only scalar measurements can be packed, %s is not' % self)
+        (xs, ys) = ([], [])
+        for x, y in self.measurementvalue_set.order_by('x').values_list('x', 'y'):
+            if len(x) != 1 or len(y) > 1:
+                raise ValueError('Cannot pack point (%s, %s) in %s' % (x, y, self))
+            xs.append(float(x[0]))
+            # undefined Y values are stored as NaN
+            ys.append(float(y[0]) if y else float('nan'))
+        (self.series, created) = MeasurementSeries.objects.update_or_create(
+            measurement=self,
+            defaults={'x': xs, 'y': ys},
+        )
+        self.measurementvalue_set.all().delete()
+
+    def unpack_values(self):
+        """ Moves values in a MeasurementSeries back to individual MeasurementValue records. """
+        series = self.get_series()
+        if series is not None:
+            MeasurementValue.objects.bulk_create(series.to_values())
+            series.delete()
+            self.series = None
+
     @property
     def name(self):
         """ alias for self.measurement_type.type_name """
@@ -1109,6 +1208,12 @@ class Measurement(EDDMetadata, EDDSerialize):
 
     # TODO also handle vectors
     def extract_data_xvalues(self, defined_only=False):
+        series = self.get_series()
+        if series is not None:
+            return [
+                x for x, y in zip(series.x, series.y)
+                if not (defined_only and math.isnan(y))
+            ]
         qs = self.measurementvalue_set.all()
         if defined_only:
             qs = qs.exclude(Q(y=None) | Q(y__len=0))
@@ -1179,3 +1284,55 @@ class MeasurementValue(models.Model):
 
     def is_defined(self):
         return (self.y is not None and len(self.y) > 0)
+
+
+@python_2_unicode_compatible
+class MeasurementSeries(models.Model):
+    """ Packed storage for all values in a scalar Measurement, as parallel arrays of X and Y
+        values sorted by X; replaces the MeasurementValue records of the Measurement. """
+    class Meta:
+        db_table = 'measurement_series'
+        verbose_name_plural = 'measurement series'
+    measurement = models.OneToOneField(
+        Measurement,
+        help_text=_('The Measurement containing this series of data.'),
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='series',
+        verbose_name=_('Measurement'),
+    )
+    x = ArrayField(
+        models.FloatField(),
+        help_text=_('X-axis values for the series.'),
+        verbose_name=_('X'),
+    )
+    y = ArrayField(
+        models.FloatField(),
+        help_text=_('Y-axis values for the series; NaN for undefined values.'),
+        verbose_name=_('Y'),
+    )
+    updated = models.ForeignKey(
+        Update,
+        help_text=_('The Update triggering the setting of this series.'),
+        on_delete=models.PROTECT,
+        verbose_name=_('Updated'),
+    )
+
+    def __str__(self):
+        return 'Series{%s}[%d]' % (self.measurement_id, len(self.x))
+
+    def to_points(self):
+        """ Returns a list of (x, y) pairs in the same array format as MeasurementValue. """
+        return [([x], [] if math.isnan(y) else [y]) for x, y in zip(self.x, self.y)]
+
+    def to_values(self):
+        """ Returns unsaved MeasurementValue objects for each point in the series. """
+        return [
+            MeasurementValue(
+                measurement_id=self.measurement_id,
+                updated_id=self.updated_id,
+                x=x,
+                y=y,
+            )
+            for x, y in self.to_points()
+        ]
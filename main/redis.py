@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import hashlib
+import json
 import logging
+import time
 
 from django.conf import settings
 from django_redis import get_redis_connection
@@ -71,3 +74,355 @@ class ScratchStorage(object):
         expires = 60 * 60 * 24 if expires is None else expires
         self._redis.set(key, data, nx=True, ex=expires)
         return key
+
+
+class ImportProgress(object):
+    """ Interfaces with Redis to track progress of a table import running in chunks """
+
+    def __init__(self, name, *args, **kwargs):
+        super(ImportProgress, self).__init__(*args, **kwargs)
+        self._name = name
+        self._redis = get_redis_connection(settings.EDD_LATEST_CACHE)
+
+    def _key(self):
+        return '%(module)s.%(klass)s:%(name)s' % {
+            'module': __name__,
+            'klass': self.__class__.__name__,
+            'name': self._name,
+        }
+
+    def chunk_done(self, done, added, updated):
+        """ Records that all series before index done are committed to the database. """
+        pipe = self._redis.pipeline()
+        pipe.hset(self._key(), 'done', done)
+        pipe.hincrby(self._key(), 'added', added)
+        pipe.hincrby(self._key(), 'updated', updated)
+        pipe.execute()
+
+    def delete(self):
+        self._redis.delete(self._key())
+
+    def load(self):
+        """
+        Loads the state of an import started with start().
+        :return: a dict with the prepared series, the total count of series, the count of series
+            done, and counts of added and updated values; or None if the import is not started
+        """
+        fields = ('series', 'done', 'added', 'updated', )
+        (series, done, added, updated) = self._redis.hmget(self._key(), fields)
+        if series is None:
+            return None
+        series = json.loads(series)
+        return {
+            'added': int(added or 0),
+            'done': int(done or 0),
+            'series': series,
+            'total': len(series),
+            'updated': int(updated or 0),
+        }
+
+    def start(self, series, expires=None):
+        """ Saves the prepared series of an import, before any chunks are committed. """
+        key = self._key()
+        expires = 60 * 60 * 24 if expires is None else expires
+        pipe = self._redis.pipeline()
+        pipe.hmset(key, {'series': json.dumps(series), 'done': 0, 'added': 0, 'updated': 0})
+        pipe.expire(key, expires)
+        pipe.execute()
+
+
+class VersionedCache(object):
+    """
+    Interfaces with Redis to cache serialized data under a version number. Cached data is stored
+    under the current version; calling bump() moves to a new version, so data cached under
+    earlier versions is never loaded again. Versions start from the clock, so a version number is
+    not reused after Redis loses its data, and is safe to use as an ETag.
+    """
+
+    def __init__(self, name, *args, **kwargs):
+        super(VersionedCache, self).__init__(*args, **kwargs)
+        self._name = name
+        self._redis = get_redis_connection(settings.EDD_LATEST_CACHE)
+
+    def _key(self, version=None):
+        return '%(module)s.%(klass)s:%(name)s:%(version)s' % {
+            'module': __name__,
+            'klass': self.__class__.__name__,
+            'name': self._name,
+            'version': 'version' if version is None else version,
+        }
+
+    def _start(self, pipe):
+        pipe.setnx(self._key(), int(time.time()))
+
+    def bump(self):
+        """ Moves to a new version, returning the new version. """
+        pipe = self._redis.pipeline()
+        self._start(pipe)
+        pipe.incr(self._key())
+        return pipe.execute()[-1]
+
+    def load(self, version):
+        """ Loads the serialized data cached under a version, or None if there is no data. """
+        return self._redis.get(self._key(version))
+
+    def save(self, version, data, expires=None):
+        key = self._key(version)
+        expires = 60 * 60 * 24 if expires is None else expires
+        self._redis.set(key, data, ex=expires)
+
+    def version(self):
+        """ Finds the current version. """
+        pipe = self._redis.pipeline()
+        self._start(pipe)
+        pipe.get(self._key())
+        return int(pipe.execute()[-1])
+
+
+class StudyDataCache(VersionedCache):
+    """ Caches the serialized data of a study used on the study pages. """
+
+    def __init__(self, study_id, *args, **kwargs):
+        super(StudyDataCache, self).__init__(study_id, *args, **kwargs)
+
+
+class MiscDataCache(VersionedCache):
+    """ Caches the serialized lookup tables shared by all studies; e.g. units, users. """
+
+    def __init__(self, *args, **kwargs):
+        super(MiscDataCache, self).__init__('misc', *args, **kwargs)
+
+
+class PermissionCache(VersionedCache):
+    """
+    Caches the map of study ID to effective permission type for a user. Each user has a version,
+    and all users share another version; the cached map of a user is stored under both. Calling
+    bump() on an instance for a user invalidates the map of only that user, and calling bump() on
+    an instance without a user invalidates the maps of every user.
+    """
+
+    def __init__(self, user_id=None, *args, **kwargs):
+        name = 'permission' if user_id is None else 'permission:%s' % user_id
+        super(PermissionCache, self).__init__(name, *args, **kwargs)
+        self._shared = None if user_id is None else PermissionCache()
+
+    def version(self):
+        """ Finds the current version, combined with the shared version for a user. """
+        if self._shared is None:
+            return super(PermissionCache, self).version()
+        pipe = self._redis.pipeline()
+        self._shared._start(pipe)
+        self._start(pipe)
+        pipe.get(self._shared._key())
+        pipe.get(self._key())
+        (shared, version) = pipe.execute()[-2:]
+        return '%s.%s' % (int(shared), int(version))
+
+
+class SolrIndexQueue(object):
+    """
+    Interfaces with Redis to queue IDs of documents to update or remove in a Solr core. Queued
+    IDs are kept in sets, so an ID queued many times is only sent to Solr once; queueing an ID
+    for update drops it from removal, and vice versa.
+    """
+
+    def __init__(self, core, *args, **kwargs):
+        super(SolrIndexQueue, self).__init__(*args, **kwargs)
+        self._core = core
+        self._redis = get_redis_connection(settings.EDD_LATEST_CACHE)
+
+    def _key(self, action):
+        return '%(module)s.%(klass)s:%(core)s:%(action)s' % {
+            'module': __name__,
+            'klass': self.__class__.__name__,
+            'core': self._core,
+            'action': action,
+        }
+
+    # adds each ID in ARGV to the set at KEYS[1], unless it is in the set at KEYS[2]
+    _REQUEUE_SCRIPT = """
+for _, id in ipairs(ARGV) do
+    if redis.call('SISMEMBER', KEYS[2], id) == 0 then
+        redis.call('SADD', KEYS[1], id)
+    end
+end
+"""
+
+    def _push(self, add_action, drop_action, ids):
+        ids = list(ids)
+        if ids:
+            pipe = self._redis.pipeline()
+            pipe.sadd(self._key(add_action), *ids)
+            pipe.srem(self._key(drop_action), *ids)
+            pipe.execute()
+
+    def _pop(self, action, count):
+        # the redis client only wraps SPOP without the count argument
+        ids = self._redis.execute_command('SPOP', self._key(action), count)
+        return [int(i) for i in ids or []]
+
+    def pop_remove(self, count):
+        """ Takes up to count IDs queued for removal. """
+        return self._pop('remove', count)
+
+    def pop_update(self, count):
+        """ Takes up to count IDs queued for update. """
+        return self._pop('update', count)
+
+    def remove(self, ids):
+        """ Queues IDs for removal from the index. """
+        self._push('remove', 'update', ids)
+
+    def update(self, ids):
+        """ Queues IDs for update in the index. """
+        self._push('update', 'remove', ids)
+
+    def requeue(self, action, ids):
+        """
+        Queues again IDs taken with pop_remove or pop_update for an action that failed. Unlike
+        remove and update, this keeps any opposite action queued since the IDs were taken; an
+        ID queued for the opposite action is not queued again.
+
+        :param action: either 'remove' or 'update'
+        :param ids: the IDs to queue again
+        """
+        drop_action = {'remove': 'update', 'update': 'remove'}[action]
+        ids = list(ids)
+        if ids:
+            script = self._redis.register_script(self._REQUEUE_SCRIPT)
+            script(keys=[self._key(action), self._key(drop_action)], args=ids)
+
+
+class SearchCache(object):
+    """
+    Interfaces with Redis to briefly cache the results of search queries. Only one process runs a
+    query missing from the cache; other processes making the same query wait for that result.
+    """
+
+    def __init__(self, name, expires=None, *args, **kwargs):
+        super(SearchCache, self).__init__(*args, **kwargs)
+        if expires is None:
+            expires = getattr(settings, 'EDD_SEARCH_CACHE_TTL', 10)
+        self._expires = expires
+        self._name = name
+        self._redis = get_redis_connection(settings.EDD_LATEST_CACHE)
+
+    def _key(self, query=None):
+        if query is None:
+            digest = 'generation'
+        else:
+            # cached results are dropped by moving to a new generation in reset()
+            generation = int(self._redis.get(self._key()) or 0)
+            query = [generation, query]
+            digest = hashlib.sha1(json.dumps(query, sort_keys=True).encode('utf-8')).hexdigest()
+        return '%(module)s.%(klass)s:%(name)s:%(digest)s' % {
+            'module': __name__,
+            'klass': self.__class__.__name__,
+            'name': self._name,
+            'digest': digest,
+        }
+
+    def load(self, query, search, wait=5):
+        """
+        Loads results of a query from the cache, or from calling search when not cached.
+
+        :param query: a JSON-serializable query, used to build the cache key
+        :param search: a callable returning JSON-serializable results of the query
+        :param wait: seconds to wait for results from another process running the same query,
+            before calling search without waiting any longer; waiting also stops once the other
+            process releases its lock without saving results, e.g. when its search failed
+        :return: the results of the query
+        """
+        key = self._key(query)
+        cached = self._redis.get(key)
+        if cached is not None:
+            return json.loads(cached)
+        lock = '%s:lock' % key
+        if self._redis.set(lock, 1, nx=True, ex=wait):
+            try:
+                return self._save(key, search())
+            finally:
+                self._redis.delete(lock)
+        # another process is running the query, poll for the result
+        deadline = time.time() + wait
+        while time.time() < deadline:
+            time.sleep(0.05)
+            pipe = self._redis.pipeline()
+            pipe.get(key)
+            pipe.exists(lock)
+            (cached, locked) = pipe.execute()
+            if cached is not None:
+                return json.loads(cached)
+            if not locked:
+                break
+        return search()
+
+    def reset(self):
+        """ Drops all cached results, e.g. after changes to the searched index. """
+        self._redis.incr(self._key())
+
+    def _save(self, key, results):
+        self._redis.set(key, json.dumps(results), ex=self._expires)
+        return results
+
+
+class IceEntryCache(object):
+    """
+    Interfaces with Redis to cache the JSON of ICE entries, as seen by a single ICE user. Entries
+    are saved under each of their identifiers (UUID, part number, and numeric ID), so a lookup by
+    any identifier finds the cached copy. Entries older than the refresh age are still returned,
+    and trigger the on_stale callback to fetch a fresh copy in the background.
+    """
+
+    def __init__(self, user_token, expires=None, refresh=None, on_stale=None, *args, **kwargs):
+        super(IceEntryCache, self).__init__(*args, **kwargs)
+        if expires is None:
+            expires = getattr(settings, 'EDD_ICE_ENTRY_CACHE_TTL', 86400)
+        if refresh is None:
+            refresh = getattr(settings, 'EDD_ICE_ENTRY_REFRESH', None)
+        self._expires = expires
+        self._on_stale = on_stale
+        self._redis = get_redis_connection(settings.EDD_LATEST_CACHE)
+        self._refresh = refresh
+        self._user = user_token
+
+    def _key(self, entry_id):
+        return '%(module)s.%(klass)s:%(user)s:%(entry)s' % {
+            'module': __name__,
+            'klass': self.__class__.__name__,
+            'user': self._user,
+            'entry': entry_id,
+        }
+
+    def delete(self, entry_id):
+        self._redis.delete(self._key(entry_id))
+
+    def load(self, entry_id):
+        """
+        Loads the cached JSON for an ICE entry, or None if the entry is not cached.
+        """
+        key = self._key(entry_id)
+        cached = self._redis.get(key)
+        if cached is None:
+            return None
+        record = json.loads(cached)
+        stale = self._refresh and time.time() - record['fetched'] > self._refresh
+        # only one refresh per entry in each refresh period
+        if stale and self._on_stale and self._redis.set('%s:refresh' % key, 1, nx=True,
+                                                        ex=self._refresh):
+            self._on_stale(entry_id)
+        return record['entry']
+
+    def save(self, entry_id, entry):
+        """
+        Saves the JSON for an ICE entry, under the identifier used to look up the entry as well
+        as the identifiers contained in the entry.
+        """
+        record = json.dumps({'entry': entry, 'fetched': time.time()})
+        aliases = {entry_id, entry.get('id'), entry.get('partId'), entry.get('recordId')}
+        pipe = self._redis.pipeline()
+        for alias in aliases:
+            if alias is not None:
+                pipe.set(self._key(alias), record, ex=self._expires)
+                pipe.delete('%s:refresh' % self._key(alias))
+        pipe.execute()
@@ -4,6 +4,7 @@ from __future__ import absolute_import, unicode_literals
 import django.dispatch
 
 study_modified = django.dispatch.Signal(providing_args=['study', 'using'])
+study_lines_created = django.dispatch.Signal(providing_args=['study', 'strains', 'using'])
 study_removed = django.dispatch.Signal(providing_args=['doc', 'using'])
 type_modified = django.dispatch.Signal(providing_args=['measurement_type', 'using'])
 type_removed = django.dispatch.Signal(providing_args=['doc', 'using'])
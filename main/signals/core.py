@@ -3,17 +3,21 @@ from __future__ import absolute_import, unicode_literals
 
 import functools
 import logging
+import threading
 
+from collections import defaultdict
 from django.conf import settings
-from django.db import connection, transaction
+from django.db import connection, DEFAULT_DB_ALIAS, transaction
 from django.db.models import Q
 from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save, pre_delete
+from edd.profile.models import InstitutionID, UserProfile
 from uuid import uuid4
 
-from . import study_modified
+from . import study_lines_created, study_modified, user_modified, user_removed
 from .dispatcher import receiver
 from .. import models as edd_models
-from ..tasks import link_ice_entry_to_study, unlink_ice_entry_from_study
+from ..redis import MiscDataCache, StudyDataCache
+from ..tasks import sync_study_ice_links
 
 
 logger = logging.getLogger(__name__)
@@ -44,6 +48,7 @@ has_update = has_uuid + [
     edd_models.Attachment,
     edd_models.Comment,
     edd_models.Measurement,
+    edd_models.MeasurementSeries,
     edd_models.MeasurementValue,
 ]
 
@@ -119,8 +124,7 @@ def study_update_ice(sender, instance, created, raw, using, **kwargs):
         strains = edd_models.Strain.objects.filter(eligible).distinct()
         strains_to_link = set(strains.values_list('id', flat=True))
     if strains_to_link:
-        partial = functools.partial(submit_ice_link, instance, strains_to_link)
-        connection.on_commit(partial)
+        queue_ice_sync(instance, strains_to_link, using=using)
         logger.info(
             "Save to study %d updating %d strains in ICE",
             instance.pk, len(strains_to_link)
@@ -137,8 +141,30 @@ def study_saved(sender, instance, created, raw, using, **kwargs):
         study_modified.send(sender=sender, study=instance, using=using)
 
 
+@receiver(study_modified)
+def study_data_modified(sender, study, using, **kwargs):
+    """
+    Moves to a new cached data version for a study after the transaction modifying it commits.
+    """
+    study_data_queue.add('study', [study.pk], using=using)
+
+
 # ----- Line signal handlers -----
 
+@receiver(study_lines_created)
+def study_lines_added(sender, study, strains, using, **kwargs):
+    """
+    Handles lines created in bulk, which skip the per-line save and m2m_changed signals. Forwards
+    a single study_modified signal, and schedules ICE links for all the strains at once.
+    """
+    study_modified.send(sender=sender, study=study, using=using)
+    if not strains or check_ice_cannot_proceed():
+        return
+    # only execute these signals if using a non-testing database
+    if using in settings.DATABASES:
+        queue_ice_sync(study, strains, using=using)
+
+
 @receiver(pre_delete, sender=edd_models.Line)
 def line_removing(sender, instance, **kwargs):
     """
@@ -158,8 +184,8 @@ def line_removing(sender, instance, **kwargs):
 @receiver(post_delete, sender=edd_models.Line)
 def line_removed(sender, instance, **kwargs):
     """
-    Checks study <-> strain associations following line deletion and removes study links from ICE
-    for any strains that are no longer associated with the study. Note that the m2m_changed
+    Queues the strains of a deleted line to have their ICE links to the study checked, removing
+    links for any strains that are no longer associated with the study. Note that the m2m_changed
     signal isn't broadcast when lines or studies are deleted. This signal is broadcast is in both
     cases, so we'll use it to fill the gap.
     """
@@ -167,20 +193,10 @@ def line_removed(sender, instance, **kwargs):
         return
     if not (hasattr(instance, 'pre_delete_study') and hasattr(instance, 'pre_delete_strain_ids')):
         return
-    study_strains = Q(line__study_id=instance.pre_delete_study.pk)
-    with transaction.atomic(savepoint=False):
-        # find the set of strains on the Study after the delete
-        post_delete_strain_ids = set(
-            edd_models.Strain.objects.filter(study_strains).distinct().values_list('id', flat=True)
-        )
-    # calculate which strains were removed as the set difference
-    removed_strains = instance.pre_delete_strain_ids - post_delete_strain_ids
     logger.debug('Pre-deletion strains: %s', instance.pre_delete_strain_ids)
-    logger.debug('Post-deletion strains: %s', post_delete_strain_ids)
-    logger.debug('Removed strains: %s', removed_strains)
-    # after transaction commits, schedule Celery task to unlink in ICE.
-    partial = functools.partial(submit_ice_unlink, instance.pre_delete_study, removed_strains)
-    connection.on_commit(partial)
+    queue_ice_sync(
+        instance.pre_delete_study, instance.pre_delete_strain_ids, using=kwargs.get('using'),
+    )
 
 
 @receiver(m2m_changed, sender=edd_models.Line.strains.through)
@@ -195,79 +211,211 @@ def line_strain_changed(sender, instance, action, reverse, model, pk_set, using,
         return
     # only execute these signals if using a non-testing database
     if using in settings.DATABASES:
-        action_function = {
-            'post_add': strain_added,
-            'pre_remove': strain_removing,
-            'post_remove': strain_removed,
-        }.get(action, None)
-        if action_function:
-            action_function(instance, pk_set)
+        if action in ('post_add', 'post_remove'):
+            queue_ice_sync(instance.study, pk_set, using=using)
+
+
+# ----- Study data signal handlers -----
+
+@receiver((post_save, post_delete), sender=(edd_models.Line, edd_models.Assay))
+def study_item_changed(sender, instance, using, raw=False, **kwargs):
+    """
+    Moves to a new cached data version for the study of a changed line or assay.
+    """
+    # raw save == database may be inconsistent; do not touch the cache
+    if raw:
+        return
+    if isinstance(instance, edd_models.Line):
+        study_data_queue.add('study', [instance.study_id], using=using)
+    else:
+        # line may already be deleted in a cascade; then the line signal handles the study
+        study_data_queue.add('pk__in', [instance.line_id], using=using)
+
+
+@receiver((post_save, post_delete), sender=edd_models.Measurement)
+def study_measurement_changed(sender, instance, using, raw=False, **kwargs):
+    """
+    Moves to a new cached data version for the study of a changed measurement.
+    """
+    # raw save == database may be inconsistent; do not touch the cache
+    if raw:
+        return
+    study_data_queue.add('assay__in', [instance.assay_id], using=using)
+
+
+# items shared between studies and included in the study data, with the Line lookup to each
+type_lookup = 'assay__measurement__measurement_type__in'
+shared_study_items = {
+    edd_models.CarbonSource: 'carbon_source__in',
+    edd_models.GeneIdentifier: type_lookup,
+    edd_models.MeasurementType: type_lookup,
+    edd_models.Metabolite: type_lookup,
+    edd_models.Phosphor: type_lookup,
+    edd_models.ProteinIdentifier: type_lookup,
+    edd_models.Protocol: 'assay__protocol__in',
+    edd_models.Strain: 'strains__in',
+}
+
+
+@receiver(post_save, sender=list(shared_study_items))
+def study_shared_item_saved(sender, instance, using, raw=False, **kwargs):
+    """
+    Moves to a new cached data version for every study using a changed strain, carbon source,
+    protocol, or measurement type.
+    """
+    # raw save == database may be inconsistent; do not touch the cache
+    if not raw:
+        study_data_queue.add(shared_study_items[sender], [instance.pk], using=using)
+
+
+@receiver(pre_delete, sender=list(shared_study_items))
+def study_shared_item_removing(sender, instance, using, **kwargs):
+    """
+    Moves to a new cached data version for every study using a deleted strain, carbon source,
+    protocol, or measurement type. The studies are found before the links to lines are deleted.
+    """
+    study_ids = find_line_studies(shared_study_items[sender], [instance.pk])
+    study_data_queue.add('study', study_ids, using=using)
+
+
+line_relations = (edd_models.Line.strains.through, edd_models.Line.carbon_source.through)
+
+
+@receiver(m2m_changed, sender=line_relations)
+def study_line_relation_changed(sender, instance, action, reverse, model, pk_set, using,
+                                **kwargs):
+    """
+    Moves to a new cached data version for the study of a line with changed strains or carbon
+    sources.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        study_data_queue.add('study', [instance.study_id], using=using)
+    elif pk_set:
+        # reverse changes come from the strain or carbon source side, touching the given lines
+        study_data_queue.add('pk__in', pk_set, using=using)
+
+
+# ----- Lookup data signal handlers -----
+
+lookup_models = (
+    edd_models.MeasurementUnit,
+    edd_models.MetadataGroup,
+    edd_models.MetadataType,
+    InstitutionID,
+    UserProfile,
+)
+
+
+@receiver((user_modified, user_removed))
+def lookup_user_changed(sender, using, **kwargs):
+    """
+    Moves to a new cached version of the shared lookup tables after a user changes.
+    """
+    connection.on_commit(bump_misc_data)
+
+
+@receiver((post_save, post_delete), sender=lookup_models)
+def lookup_item_changed(sender, instance, using, raw=False, **kwargs):
+    """
+    Moves to a new cached version of the shared lookup tables after an item in them changes.
+    """
+    # raw save == database may be inconsistent; do not touch the cache
+    if not raw:
+        connection.on_commit(bump_misc_data)
 
 
 # ----- helper functions -----
 
-def check_ice_cannot_proceed(raw=False):
-    if not settings.ICE_URL:
-        logger.warning('ICE URL is not configured. Skipping ICE experiment link updates.')
-        return True
-    return raw
+def bump_misc_data():
+    MiscDataCache().bump()
+
+
+def bump_queued_study_data(queued):
+    """
+    Moves to a new cached data version once for each study queued in study_data_queue during a
+    transaction. Items are queued under the key 'study' with study IDs, or under a Line lookup
+    with IDs of objects related to the lines of the studies.
+    """
+    study_ids = queued.pop('study', set())
+    for lookup, ids in queued.items():
+        study_ids.update(find_line_studies(lookup, ids))
+    for study_id in study_ids:
+        StudyDataCache(study_id).bump()
 
 
-def strain_added(line, pk_set):
-    connection.on_commit(functools.partial(submit_ice_link, line.study, pk_set))
+def find_line_studies(lookup, ids):
+    lines = edd_models.Line.objects.filter(**{lookup: ids})
+    return lines.values_list('study_id', flat=True).distinct()
 
 
-def strain_removing(line, pk_set):
-    # cache data associated with this strain so we have enough info to remove some or all of
-    # ICE's link(s) to this study if appropriate after line -> strain relationship change is
-    # completed in EDD
-    with transaction.atomic(savepoint=False):
-        line.removed_strains = set(
-            edd_models.Strain.objects.filter(pk__in=pk_set).values_list('pk', flat=True)
-        )
+class CommitQueue(object):
+    """
+    Collects items during a transaction, to process them together once the transaction commits.
+    Items are collected in sets under a key, and process is called with the dict of key to set of
+    items. Every call to add registers an on_commit callback, because a callback registered in a
+    savepoint is dropped when the savepoint rolls back; the first callback run after the commit
+    processes the whole queue, and any others find it empty. Items added in a rolled back
+    transaction or savepoint are still processed with the next commit.
+    """
 
+    def __init__(self, process):
+        self._local = threading.local()
+        self._process = process
 
-def strain_removed(line, pk_set):
-    # narrow down the list of lines that are no longer associated with this strain to
-    # just those we want to take action on in ICE.
-    with transaction.atomic(savepoint=False):
-        remove_on_commit = {
-            pk
-            for pk in line.removed_strains
-            if edd_models.Line.objects.filter(strains=pk, study=line.study.pk).count() == 0
-        }
-    connection.on_commit(functools.partial(submit_ice_unlink, line.study, remove_on_commit))
+    def add(self, key, items, using=None):
+        using = DEFAULT_DB_ALIAS if using is None else using
+        queues = self._local.__dict__.setdefault('queues', {})
+        queues.setdefault(using, defaultdict(set))[key].update(items)
+        transaction.on_commit(functools.partial(self._flush, using), using=using)
+
+    def _flush(self, using):
+        queued = getattr(self._local, 'queues', {}).pop(using, None)
+        if queued:
+            self._process(queued)
+
+
+study_data_queue = CommitQueue(bump_queued_study_data)
 
 
-def submit_ice_unlink(study, removed_strains):
+def check_ice_cannot_proceed(raw=False):
+    if not settings.ICE_URL:
+        logger.warning('ICE URL is not configured. Skipping ICE experiment link updates.')
+        return True
+    return raw
+
+
+def queue_ice_sync(study, strains, using=None):
     """
-    Helper method to schedule removal of a link from ICE. This method is only strictly necessary
-    to help us work around the django-commit-hooks limitation that a no-arg method be passed to
-    the post-commit hook.
+    Collects strains whose ICE links to a study may have changed. All strains collected for a
+    study in a transaction are submitted in a single sync_study_ice_links task after the commit,
+    rather than one task per line or strain change.
 
-    :param study: the Django model for Study to be unlinked
-    :param removed_strains: iterable of IDs for Strains to be unlinked
+    :param study: the Django model for the Study
+    :param strains: iterable of IDs for Strains to check
+    :param using: the alias of the database making the changes
     """
-    for strain in removed_strains:
-        try:
-            unlink_ice_entry_from_study.delay(settings.ICE_ADMIN_ACCOUNT, strain, study.pk)
-        except unlink_ice_entry_from_study.OperationalError:
-            logger.error('Failed to submit task unlink_ice_entry_from_study(%d, %d)',
-                         strain.pk, study.pk)
+    strains = set(strains or [])
+    if strains:
+        # the slug is saved now, to find links to a study that is deleted before the commit
+        ice_sync_queue.add((study.pk, study.slug), strains, using=using)
 
 
-def submit_ice_link(study, linked_strains):
+def submit_ice_sync(queued):
     """
-    Helper method to schedule addition of a link to ICE. This method is only strictly necessary to
-    help us work around the django-commit-hooks limitation that a no-arg method be passed to the
-    post-commit hook.
+    Schedules reconciling the links from ICE to each study collected by queue_ice_sync.
 
-    :param study: the Django model for Study to be unlinked
-    :param linked_strains: iterable of IDs for Strains to be linked
+    :param queued: dict of (study ID, study slug) to a set of IDs for Strains to be linked or
+        unlinked
     """
-    for strain in linked_strains:
+    for (study_id, slug), strains in queued.items():
         try:
-            link_ice_entry_to_study.delay(settings.ICE_ADMIN_ACCOUNT, strain, study.pk)
-        except link_ice_entry_to_study.OperationalError:
-            logger.error('Failed to submit task link_ice_entry_to_study(%d, %d)',
-                         strain.pk, study.pk)
+            sync_study_ice_links.delay(
+                settings.ICE_ADMIN_ACCOUNT, study_id, slug, sorted(strains),
+            )
+        except sync_study_ice_links.OperationalError:
+            logger.error('Failed to submit task sync_study_ice_links(%d)', study_id)
+
+
+ice_sync_queue = CommitQueue(submit_ice_sync)
@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
 
-from django.db.models.signals import post_delete, post_save
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import connection
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 
 from . import study_modified
 from .dispatcher import receiver
 from .. import models as edd_models
+from ..redis import PermissionCache
 
 
 permissions = (
@@ -17,6 +21,49 @@ permissions = (
 
 @receiver((post_save, post_delete), sender=permissions)
 def permission_change(sender, instance, using, raw=False, **kwargs):
+    # cached permissions are stale even with a raw save
+    if isinstance(instance, edd_models.UserPermission):
+        reset_permission_cache([instance.user_id])
+    elif isinstance(instance, edd_models.GroupPermission):
+        reset_permission_cache(group_user_ids(instance.group_id))
+    else:
+        reset_permission_cache()
     # raw save == database may be inconsistent; do not forward next signal
     if not raw and using == 'default':
         study_modified.send(sender=sender, study=instance.study, using=using)
+
+
+@receiver(pre_delete, sender=Group)
+def group_removing(sender, instance, using, **kwargs):
+    # deleting a group drops memberships without sending m2m_changed, find members beforehand
+    reset_permission_cache(group_user_ids(instance.pk))
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+def group_membership_change(sender, instance, action, reverse, pk_set, using, **kwargs):
+    # forward changes are from the user side, reverse changes are from the group side
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        reset_permission_cache([instance.pk])
+    elif reverse and action in ('post_add', 'post_remove'):
+        reset_permission_cache(pk_set)
+    elif reverse and action == 'pre_clear':
+        reset_permission_cache(group_user_ids(instance.pk))
+
+
+def group_user_ids(group_id):
+    return list(get_user_model().objects.filter(groups=group_id).values_list('pk', flat=True))
+
+
+def reset_permission_cache(user_ids=None):
+    """
+    Moves to new versions of cached permission maps for the users with user_ids, or for every
+    user when user_ids is None.
+    """
+    if user_ids is None:
+        caches = [PermissionCache()]
+    else:
+        caches = [PermissionCache(user_id) for user_id in set(user_ids)]
+    for cache in caches:
+        cache.bump()
+        # permission maps loaded by other requests before the change commits are also stale
+        connection.on_commit(cache.bump)
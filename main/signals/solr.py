@@ -9,6 +9,7 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import connection
 from django.db.models.signals import post_delete, post_save, pre_delete
+from redis.exceptions import RedisError
 
 from . import (
     study_modified,
@@ -20,6 +21,7 @@ from . import (
 )
 from .dispatcher import receiver
 from .. import models as edd_models
+from ..redis import SolrIndexQueue
 from ..solr import MeasurementTypeSearch, StudySearch, UserSearch
 
 
@@ -38,17 +40,19 @@ class PrimaryKeyCache(namedtuple('PrimaryKeyCache', ['id'])):
 
 
 def index_remove(index, items):
+    # queued for the drain_solr_queue task, which sends batches of changes to Solr
     try:
-        index.remove(items)
-    except IOError:
-        logger.error("Failed to remove from solr with %s", items)
+        SolrIndexQueue(index.core).remove(item.id for item in items)
+    except RedisError:
+        logger.error("Failed to queue removal from solr with %s", items)
 
 
 def index_update(index, items):
+    # queued for the drain_solr_queue task, which sends batches of changes to Solr
     try:
-        index.update(items)
-    except IOError:
-        logger.error("Failed to update solr with %s", items)
+        SolrIndexQueue(index.core).update(item.pk for item in items)
+    except RedisError:
+        logger.error("Failed to queue update to solr with %s", items)
 
 
 @receiver(pre_delete, sender=(edd_models.MeasurementType, edd_models.Study, get_user_model()))
@@ -12,6 +12,7 @@ from itertools import ifilter, islice
 from six import string_types
 
 from . import models
+from .redis import SearchCache
 from edd import utilities
 
 
@@ -22,6 +23,9 @@ timeout = (10, 10)  # tuple for request connection and read timeouts, respective
 class SolrSearch(object):
     """ Base class for interfacing with Solr indices. """
 
+    # shared by all instances, so connections to Solr are pooled and kept alive
+    session = requests.Session()
+
     def __init__(self, core=None, settings=None, settings_key='default', url=None,
                  *args, **kwargs):
         self.core = core
@@ -55,7 +59,19 @@ class SolrSearch(object):
         command = '{"delete":{"query":"*:*"},"commit":{}}'
         headers = {'content-type': 'application/json'}
         # issue the request (raises IOError)
-        response = requests.post(url, data=command, headers=headers, timeout=timeout)
+        response = self.session.post(url, data=command, headers=headers, timeout=timeout)
+        response.raise_for_status()  # raises HttpError (extends IOError)
+        SearchCache(self.core).reset()
+        return self
+
+    def commit(self):
+        """
+        Sends a hard commit of pending changes to the index.
+        :raises IOError if an error occurs during the attempt
+        """
+        url = self.url + '/update/json'
+        headers = {'content-type': 'application/json'}
+        response = self.session.post(url, data='{"commit":{}}', headers=headers, timeout=timeout)
         response.raise_for_status()  # raises HttpError (extends IOError)
         return self
 
@@ -86,40 +102,47 @@ class SolrSearch(object):
         }
         return queryopt
 
-    def remove(self, docs=[]):
+    def remove(self, docs=[], batch_size=1000, commit_within=None):
         """
         Updates Solr with a list of objects to remove from the index.
 
         :param docs: an iterable of objects with an id property
-
+        :param batch_size: number of documents removed in each request to Solr (default: 1000)
+        :param commit_within: if set, the number of milliseconds Solr may wait before committing
+            the removal; otherwise, each request commits the removal
         :raises IOError: if an error occurs during the removal attempt. Note that removals are
-            performed iteratively, so it's possible that some succeeded before the error occurred.
+            performed in batches, so it's possible that some succeeded before the error occurred.
         """
         # Does no permissions checking; permissions already valid if called from Study pre_delete
         # signal, but other clients must do their own permission checks.
         url = self.url + '/update/json'
-        # proactively log input to help diagnose integration errors, if they occur
-        logger.info('%(cls)s deleting from solr index with: %(ids)s' % {
-            'cls': self.__class__.__name__,
-            'ids': [doc.id for doc in docs],
-        })
-        command = '{"delete":{"query":"id:%s"},"commit":{}}'
+        ids = iter([doc.id for doc in docs])
+        params = {'commit': 'true'}
+        if commit_within is not None:
+            params = {'commitWithin': commit_within}
         headers = {'content-type': 'application/json'}
-        for doc in docs:
+        for group in iter(lambda: list(islice(ids, batch_size)), []):
+            # proactively log input to help diagnose integration errors, if they occur
+            logger.info('%(cls)s deleting from solr index with: %(ids)s' % {
+                'cls': self.__class__.__name__,
+                'ids': group,
+            })
             try:
-                response = requests.post(
+                response = self.session.post(
                     url,
-                    data=command % (doc.id,),
+                    data=json.dumps({'delete': group}, cls=utilities.JSONEncoder),
                     headers=headers,
+                    params=params,
                     timeout=timeout,
                 )
                 response.raise_for_status()
             # catch / re-raise communication errors after logging some helpful context re: where
             # the error occurred
             except IOError as err:
-                # log the doc id on which the error occurred, then re-raise the error
-                logger.error('Error removing data from Solr index. Failed on doc id %s', doc.id)
+                # log the doc ids on which the error occurred, then re-raise the error
+                logger.error('Error removing data from Solr index. Failed on doc ids %s', group)
                 raise err
+        SearchCache(self.core).reset()
 
     def search(self, queryopt={'q': '*:*', 'wt': 'json', }):
         """
@@ -127,21 +150,26 @@ class SolrSearch(object):
             :return: a dictionary containing the Solr json response
             :raises IOError: if an error occurs during the query attempt
          """
+        # normalize whitespace, so typing extra spaces does not change the query
+        queryopt['q'] = ' '.join(queryopt['q'].split())
         # single character queries will never return results as smallest ngram is 2 characters
         if len(queryopt['q']) == 1:
             queryopt['q'] = queryopt['q'] + '*'
 
-        # proactively log input to help diagnose integration errors, if they occur
-        logger.info('%(cls)s searching solr index with: %(queryopt)s' % {
-            'cls': self.__class__.__name__,
-            'queryopt': queryopt,
-        })
-
-        # contact Solr / raise any IOErrors that arise
-        response = requests.get(self.url + '/select', params=queryopt, timeout=timeout)
-        response.raise_for_status()
+        def run_search():
+            # proactively log input to help diagnose integration errors, if they occur
+            logger.info('%(cls)s searching solr index with: %(queryopt)s' % {
+                'cls': self.__class__.__name__,
+                'queryopt': queryopt,
+            })
+            # contact Solr / raise any IOErrors that arise
+            response = self.session.get(self.url + '/select', params=queryopt, timeout=timeout)
+            response.raise_for_status()
+            return response.json()
 
-        return response.json()
+        # the options include any ACL filter query, so cached results are only shared by users
+        #   with the same access
+        return SearchCache(self.core).load([self.url, queryopt], run_search)
 
     def query(self, query, **kwargs):
         """ Runs a query against the Solr core, translating options to the Solr syntax.
@@ -167,7 +195,7 @@ class SolrSearch(object):
         queryopt = self.get_queryopt(query, **kwargs)
         return self.search(queryopt=queryopt)
 
-    def update(self, docs=[]):
+    def update(self, docs=[], batch_size=50, commit_within=None):
         """
         Update Solr index from the given list of objects. Does no permissions checking; permissions
         already valid if called from Study post_save signal, but other clients must do own checks
@@ -175,34 +203,44 @@ class SolrSearch(object):
 
         :param docs: an iterable of objects with a to_solr_json method to update in Solr. Must
             have an id attribute.
+        :param batch_size: number of documents sent in each request to Solr (default: 50)
+        :param commit_within: if set, the number of milliseconds Solr may wait before committing
+            the documents; otherwise, a hard commit is sent after each batch of documents
         :return: list of Solr's JSON response(s), if the update was successfully performed.
         :raises IOError: if an error occurs during the update attempt
         """
         url = self.url + '/update/json'
         payload = ifilter(lambda d: d is not None, map(self.get_solr_payload, docs))
         response_list = []
+        params = {}
+        if commit_within is not None:
+            params['commitWithin'] = commit_within
 
         headers = {'content-type': 'application/json'}
-        # Send updates in groups of 50
-        for group in iter(lambda: list(islice(payload, 50)), []):
+        for group in iter(lambda: list(islice(payload, batch_size)), []):
             ids = map(lambda item: item.get('id'), group)
             logger.info('%(cls)s updating solr index with IDs: %(ids)s' % {
                 'cls': self.__class__.__name__,
                 'ids': ids,
             })
             # make an initial request to do the add / raise IOError if it occurs
-            response = requests.post(
+            response = self.session.post(
                 url,
                 data=json.dumps(group, cls=utilities.JSONEncoder),
                 headers=headers,
+                params=params,
                 timeout=timeout,
             )
             # if we received a valid response with an HTTP error code, raise HttpException
             response.raise_for_status()
+            add_json = response.json()
+            response_list.append(add_json)
+            # Solr will commit on its own when given commitWithin
+            if commit_within is not None:
+                continue
 
             # if the add worked, send commit command
-            add_json = response.json()
-            response = requests.post(
+            response = self.session.post(
                 url,
                 data='{"commit":{}}',
                 headers=headers,
@@ -213,7 +251,7 @@ class SolrSearch(object):
                 'cls': self.__class__.__name__,
                 'ids': ids,
             })
-            response_list.append(add_json)
+        SearchCache(self.core).reset()
         return response_list
 
     def swap(self):
@@ -239,8 +277,11 @@ class SolrSearch(object):
             'other': self.swap().core,
             'core': self.swap().core,
         }
-        response = requests.get(url, params=params, timeout=timeout)
+        response = self.session.get(url, params=params, timeout=timeout)
         response.raise_for_status()
+        # the live core now has the documents indexed in swap, drop results cached from before
+        live = self.core[:self.core.rfind('_swap')] if self.core.endswith('_swap') else self.core
+        SearchCache(live).reset()
         return self
 
     @property
@@ -276,13 +317,18 @@ class StudySearch(SolrSearch):
         # Admins get no filter on read, and a query that will always eval true for write
         if ident.is_superuser:
             return ('', 'id:*')
-        acl = ['"g:__Everyone__"', '"u:'+ident.username+'"', ] + map(
-            lambda g: '"g:'+g.name+'"', ident.groups.all()
-        )
-        return (
-            ' OR '.join(map(lambda r: 'aclr:'+r, acl)),
-            ' OR '.join(map(lambda w: 'aclw:'+w, acl)),
-        )
+        # memoized on the user object, so group names are only loaded once per request
+        acl_filter = getattr(ident, '_solr_acl_filter', None)
+        if acl_filter is None:
+            acl = ['"g:__Everyone__"', '"u:'+ident.username+'"', ] + map(
+                lambda g: '"g:'+g.name+'"', ident.groups.all()
+            )
+            acl_filter = (
+                ' OR '.join(map(lambda r: 'aclr:'+r, acl)),
+                ' OR '.join(map(lambda w: 'aclw:'+w, acl)),
+            )
+            ident._solr_acl_filter = acl_filter
+        return acl_filter
 
     @staticmethod
     def get_queryset():
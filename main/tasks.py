@@ -5,19 +5,29 @@ from __future__ import absolute_import, unicode_literals
 Module contains tasks to be executed asynchronously by Celery worker nodes.
 """
 
+import functools
+import os
+import tempfile
+
+from collections import namedtuple
+from datetime import timedelta
+
 from celery import shared_task
 from celery.utils.log import get_task_logger
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.storage import default_storage
 from django.core.urlresolvers import reverse
-from django.db.models import F
+from django.db import transaction
 from django.http import QueryDict
+from django.utils import timezone
 from django.utils.translation import ugettext as _
 from requests.exceptions import RequestException
 
-from . import models
+from . import models, solr
 from .importer.table import TableImport
-from .redis import ScratchStorage
+from .redis import IceEntryCache, ImportProgress, ScratchStorage, SolrIndexQueue
 from .utilities import get_absolute_url
 from jbei.rest.auth import HmacAuth
 from jbei.rest.clients.ice import IceApi
@@ -25,6 +35,10 @@ from jbei.rest.clients.ice import IceApi
 
 logger = get_task_logger(__name__)
 User = get_user_model()
+# stand-in for removed objects, SolrSearch.remove only needs the id
+SolrDoc = namedtuple('SolrDoc', ['id'])
+# directory in default storage holding the output of background exports
+EXPORT_ROOT = 'exports'
 
 
 def build_study_url(slug):
@@ -35,6 +49,17 @@ def build_study_url(slug):
     return get_absolute_url(path)
 
 
+def build_export_path(task_id, name):
+    """
+    Constructs the path in default storage for the output of a background export.
+    """
+    return '%(root)s/%(task)s/%(name)s.csv' % {
+        'name': name,
+        'root': EXPORT_ROOT,
+        'task': task_id,
+    }
+
+
 def create_ice_connection(user_token):
     """
     Creates an instance of the ICE API using common settings.
@@ -51,12 +76,25 @@ def create_ice_connection(user_token):
             if timeout:
                 ice.timeout = timeout
             ice.write_enabled = True
+            if getattr(settings, 'EDD_ICE_ENTRY_CACHE_TTL', None):
+                on_stale = functools.partial(submit_ice_refresh, user_token)
+                ice.entry_cache = IceEntryCache(user_token, on_stale=on_stale)
             return ice
         except Exception as e:
             logger.error('Failed to create connection: %s', e)
     return None
 
 
+def submit_ice_refresh(user_token, entry_id):
+    """
+    Schedules a background refresh of a stale ICE entry in main.redis.IceEntryCache.
+    """
+    try:
+        refresh_ice_entry.delay(user_token, entry_id)
+    except refresh_ice_entry.OperationalError:
+        logger.error('Failed to submit task refresh_ice_entry(%s)', entry_id)
+
+
 def delay_calculation(task):
     """
     Calculates a delay for a task using exponential backoff.
@@ -65,10 +103,14 @@ def delay_calculation(task):
     return task.default_retry_delay + (2 ** (task.request.retries + 1))
 
 
-@shared_task
+@shared_task(acks_late=True, reject_on_worker_lost=True)
 def import_table_task(study_id, user_id, data_path):
     """
-    Task runs the code for importing a table of data.
+    Task runs the code for importing a table of data. Lines and Assays are resolved in a first
+    transaction, then measurements are written in chunks of EDD_IMPORT_CHUNK_SIZE series, each
+    committed in its own transaction. Progress is tracked in main.redis.ImportProgress, saved
+    just before the first transaction commits and updated after each chunk; if a worker dies
+    mid-import, the re-delivered task resumes after the last committed chunk.
 
     :param study_id: the primary key of the target study
     :param user_id: the primary key of the user running the import
@@ -79,12 +121,39 @@ def import_table_task(study_id, user_id, data_path):
     """
     try:
         storage = ScratchStorage()
+        progress = ImportProgress(data_path)
         study = models.Study.objects.get(pk=study_id)
         user = User.objects.get(pk=user_id)
-        data = storage.load(data_path)
-        importer = TableImport(study, user)
         # data stored as urlencoded string, convert back to QueryDict
-        (added, updated) = importer.import_data(QueryDict(data))
+        data = QueryDict(storage.load(data_path))
+        importer = TableImport(study, user)
+        state = progress.load()
+        series = None
+        if state is not None:
+            try:
+                series = importer.load_series(data, state['series'])
+                logger.info('Resuming import %s after %d series', data_path, state['done'])
+            except ValueError:
+                # progress was saved, but the prepare transaction never committed
+                logger.warning('Restarting import %s, prepared series are missing', data_path)
+                importer = TableImport(study, user)
+        if series is None:
+            with transaction.atomic():
+                series = importer.prepare_series(data)
+                # save progress before commit, so a redelivered task never prepares twice
+                progress.start(importer.dump_series(series))
+            state = progress.load()
+        chunk_size = getattr(settings, 'EDD_IMPORT_CHUNK_SIZE', 50)
+        for start in range(state['done'], state['total'], chunk_size):
+            chunk = series[start:start + chunk_size]
+            with transaction.atomic():
+                (added, updated) = importer.import_series(chunk, offset=start)
+            progress.chunk_done(start + len(chunk), added, updated)
+        with transaction.atomic():
+            importer.finish_import()
+        state = progress.load()
+        (added, updated) = (state['added'], state['updated'])
+        progress.delete()
         storage.delete(data_path)
     except Exception as e:
         logger.exception('Failure in import_table_task: %s', e)
@@ -104,56 +173,145 @@ def import_table_task(study_id, user_id, data_path):
 
 
 @shared_task(bind=True)
-def link_ice_entry_to_study(self, user_token, strain, study):
+def export_table_task(self, user_id, data_path):
     """
-    Task runs the code to register a link between an ICE entry and an EDD study.
+    Task runs the code for a table export, writing the output to a file in default storage.
 
-    :param user_token: the token used to identify a user to ICE
-    :param strain: the primary key of the EDD main.models.Strain in the link
-    :param study: the primary key of the EDD main.models.Study in the link
-    :throws Exception: for any errors other than communication errors to ICE instance
+    :param user_id: the primary key of the user running the export
+    :param data_path: the key returned from main.redis.ScratchStorage.save() used to access the
+        export form data
+    :returns: a message to display via the TaskNotification middleware, with a download link
+    :throws RuntimeError: on any errors occuring while running the export
     """
-    # check that strain and study are still linked
-    query = models.Strain.objects.filter(pk=strain, line__study__pk=study)
-    if query.exists():
-        try:
-            ice = create_ice_connection(user_token)
-            record = query.annotate(
-                study_slug=F('line__study__slug'),
-                study_name=F('line__study__name'),
-            ).distinct().get()
-            url = build_study_url(record.study_slug)
-            ice.link_entry_to_study(record.registry_id, study, url, record.study_name)
-        except RequestException as e:
-            # Retry when there are errors communicating with ICE
-            raise self.retry(exc=e, countdown=delay_calculation(self), max_retries=10)
-        except Exception as e:
-            raise e
+    # avoid loading export forms before the app registry is ready
+    from .export.forms import ExportOptionForm, ExportSelectionForm
+    from .export.table import TableExport
+    try:
+        storage = ScratchStorage()
+        user = User.objects.get(pk=user_id)
+        # data stored as urlencoded string, convert back to QueryDict
+        data = QueryDict(storage.load(data_path))
+        selection = ExportSelectionForm(data=data, user=user).get_selection()
+        initial = ExportOptionForm.initial_from_user_settings(user)
+        option_form = ExportOptionForm(data=data, initial=initial, selection=selection)
+        export = TableExport(selection, option_form.options, None)
+        study = selection.studies[0]
+        with tempfile.TemporaryFile() as output:
+            for chunk in export.iter_output():
+                output.write(chunk.encode('utf-8'))
+            path = default_storage.save(
+                build_export_path(self.request.id, study.slug),
+                File(output),
+            )
+        storage.delete(data_path)
+    except Exception as e:
+        logger.exception('Failure in export_table_task: %s', e)
+        raise RuntimeError(
+            _('Failed export, EDD encountered this problem: %(problem)s') % {'problem': e}
+        )
+    logger.info('Saved export for %s to %s', user.username, path)
+    url = get_absolute_url(reverse('main:export_download', kwargs={'task': self.request.id}))
+    return _('Finished export of %(study)s, download it from %(url)s') % {
+        'study': study.name,
+        'url': url,
+    }
+
+
+@shared_task(ignore_result=True)
+def expire_exports():
+    """
+    Task removes background export files older than EDD_EXPORT_TTL seconds from default storage.
+    Runs periodically from Celery beat; downloads of removed exports return Not Found.
+    """
+    ttl = getattr(settings, 'EDD_EXPORT_TTL', 86400)
+    cutoff = timezone.now() - timedelta(seconds=ttl)
+    if not default_storage.exists(EXPORT_ROOT):
+        return
+    for task in default_storage.listdir(EXPORT_ROOT)[0]:
+        directory = os.path.dirname(build_export_path(task, ''))
+        for filename in default_storage.listdir(directory)[1]:
+            path = os.path.join(directory, filename)
+            if default_storage.get_modified_time(path) < cutoff:
+                default_storage.delete(path)
+                logger.info('Removed expired export %s', path)
+
+
+@shared_task(ignore_result=True)
+def drain_solr_queue():
+    """
+    Task sends the changes queued by main.signals.solr to the Solr indices, in batches of
+    EDD_SOLR_BATCH_SIZE documents. Changes are committed by Solr within EDD_SOLR_COMMIT_WITHIN
+    milliseconds instead of each batch sending a hard commit. Runs periodically from Celery beat;
+    any batch failing to send is queued again for the next run.
+    """
+    batch_size = getattr(settings, 'EDD_SOLR_BATCH_SIZE', 1000)
+    commit_within = getattr(settings, 'EDD_SOLR_COMMIT_WITHIN', 10000)
+    for index in (solr.StudySearch(), solr.UserSearch(), solr.MeasurementTypeSearch()):
+        queue = SolrIndexQueue(index.core)
+        for ids in iter(lambda: queue.pop_remove(batch_size), []):
+            try:
+                docs = [SolrDoc(i) for i in ids]
+                index.remove(docs, batch_size=batch_size, commit_within=commit_within)
+            except IOError:
+                logger.exception('Failed to remove from %s, re-queued %s', index, ids)
+                queue.requeue('remove', ids)
+                break
+        for ids in iter(lambda: queue.pop_update(batch_size), []):
+            try:
+                docs = index.get_queryset().filter(pk__in=ids)
+                index.update(docs, batch_size=batch_size, commit_within=commit_within)
+            except IOError:
+                logger.exception('Failed to update %s, re-queued %s', index, ids)
+                queue.requeue('update', ids)
+                break
 
 
 @shared_task(bind=True)
-def unlink_ice_entry_from_study(self, user_token, strain, study):
+def sync_study_ice_links(self, user_token, study, slug, strains):
     """
-    Task runs the code to de-register a link between an ICE entry and an EDD study.
+    Task reconciles the links between ICE entries and an EDD study. Each strain still used in a
+    line of the study is linked to the study in ICE; any other strain has its link removed.
 
     :param user_token: the token used to identify a user to ICE
-    :param strain: the primary key of the EDD main.models.Strain in the former link
-    :param study: the primary key of the EDD main.models.Study in the former link
+    :param study: the primary key of the EDD main.models.Study in the links
+    :param slug: the slug of the study when the task was submitted, used to find links to a
+        study that has since been deleted
+    :param strains: the primary keys of the EDD main.models.Strain to check
     :throws Exception: for any errors other than communication errors to ICE instance
     """
-    query = models.Strain.objects.filter(pk=strain, line__study__pk=study)
-    if not query.exists():
-        try:
-            ice = create_ice_connection(user_token)
-            record = models.Strain.objects.get(pk=strain)
-            study_obj = models.Study.objects.get(pk=study)
-            url = build_study_url(study_obj.slug)
-            ice.unlink_entry_from_study(record.registry_id, study, url)
-        except RequestException as e:
-            # Retry when there are errors communicating with ICE
-            raise self.retry(exc=e, countdown=delay_calculation(self), max_retries=10)
-        except Exception as e:
-            raise e
+    study_obj = models.Study.objects.filter(pk=study).first()
+    linked = set()
+    if study_obj is not None:
+        slug = study_obj.slug
+        linked = set(models.Strain.objects.filter(
+            pk__in=strains,
+            line__study__pk=study,
+        ).values_list('pk', flat=True))
+    url = build_study_url(slug)
+    records = models.Strain.objects.filter(pk__in=strains, registry_id__isnull=False)
+    try:
+        ice = create_ice_connection(user_token)
+        for record in records:
+            if record.pk in linked:
+                ice.link_entry_to_study(record.registry_id, study, url, study_obj.name)
+            else:
+                ice.unlink_entry_from_study(record.registry_id, study, url)
+    except RequestException as e:
+        # Retry when there are errors communicating with ICE; the retry checks every strain again
+        raise self.retry(exc=e, countdown=delay_calculation(self), max_retries=10)
+
+
+@shared_task(ignore_result=True)
+def refresh_ice_entry(user_token, entry_id):
+    """
+    Task fetches an ICE entry to replace a stale copy in main.redis.IceEntryCache.
+
+    :param user_token: the token used to identify a user to ICE
+    :param entry_id: the ICE identifier used to look up the entry
+    """
+    ice = create_ice_connection(user_token)
+    if ice is not None:
+        ice.get_entry(entry_id, suppress_errors=True, use_cache=False)
 
 
 @shared_task
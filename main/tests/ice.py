@@ -5,16 +5,22 @@ from __future__ import absolute_import, unicode_literals
 Integration tests for ICE.
 """
 
+import json
+import time
+
 from django.core.urlresolvers import reverse
 from django.test import tag
 from io import BytesIO
+from mock import MagicMock, patch
 from openpyxl.workbook import Workbook
 from requests import codes
+from requests.exceptions import HTTPError
 
 from jbei.rest.auth import HmacAuth
 from jbei.rest.clients.ice import IceApi
 
 from .. import models
+from ..redis import IceEntryCache
 from . import factory, TestCase
 
 
@@ -37,6 +43,78 @@ def ice_url(path):
     return 'http://ice:8080/rest/%s' % path
 
 
+class IceEntryCacheTests(TestCase):
+    """
+    Tests caching of ICE entries fetched with IceApi.get_entry(), without contacting ICE.
+    """
+    entry = {
+        'id': 42,
+        'name': 'Test part',
+        'partId': 'TEST_000042',
+        'recordId': '8ffd6c45-5f5b-4a65-ae5d-4a2c8f1b5b1e',
+        'type': 'PART',
+    }
+
+    def setUp(self):
+        super(IceEntryCacheTests, self).setUp()
+        self.on_stale = MagicMock()
+        self.cache = IceEntryCache('test-entry-cache', refresh=60, on_stale=self.on_stale)
+        self.ice = IceApi(auth=MagicMock())
+        self.ice.session = MagicMock()
+        self.ice.entry_cache = self.cache
+
+    def tearDown(self):
+        redis = self.cache._redis
+        for key in redis.scan_iter(match=self.cache._key('*')):
+            redis.delete(key)
+        super(IceEntryCacheTests, self).tearDown()
+
+    def _respond(self, status_code, entry=None):
+        response = self.ice.session.get.return_value
+        response.status_code = status_code
+        if status_code == codes.ok:
+            response.content = json.dumps(entry)
+            response.raise_for_status.side_effect = None
+        else:
+            response.raise_for_status.side_effect = HTTPError(response=response)
+        return response
+
+    def test_save_aliases(self):
+        self.cache.save(self.entry['partId'], self.entry)
+        for alias in (42, '42', self.entry['partId'], self.entry['recordId']):
+            self.assertEqual(self.cache.load(alias)['name'], 'Test part')
+
+    def test_cache_hit(self):
+        self.cache.save(self.entry['partId'], self.entry)
+        part = self.ice.get_entry(self.entry['recordId'])
+        self.assertEqual(part.part_id, 'TEST_000042')
+        self.ice.session.get.assert_not_called()
+
+    def test_skip_cache(self):
+        self.cache.save(self.entry['partId'], self.entry)
+        self._respond(codes.ok, dict(self.entry, name='Renamed part'))
+        part = self.ice.get_entry(self.entry['recordId'], use_cache=False)
+        self.assertEqual(part.name, 'Renamed part')
+        self.ice.session.get.assert_called_once()
+        self.assertEqual(self.cache.load(self.entry['partId'])['name'], 'Renamed part')
+
+    def test_not_found_deletes(self):
+        self.cache.save(self.entry['partId'], self.entry)
+        self._respond(codes.not_found)
+        self.assertIsNone(self.ice.get_entry(self.entry['partId'], use_cache=False))
+        self.assertIsNone(self.cache.load(self.entry['partId']))
+
+    def test_stale_refresh_once(self):
+        self.cache.save(self.entry['partId'], self.entry)
+        later = time.time() + 120
+        with patch('main.redis.time') as mock_time:
+            mock_time.time.return_value = later
+            self.assertEqual(self.cache.load(self.entry['partId'])['name'], 'Test part')
+            self.assertEqual(self.cache.load(self.entry['partId'])['name'], 'Test part')
+        self.on_stale.assert_called_once_with(self.entry['partId'])
+        self.ice.session.get.assert_not_called()
+
+
 @tag('integration')
 class IceIntegrationTests(TestCase):
     """
@@ -8,17 +8,20 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from django.core.exceptions import PermissionDenied
 from django.test import RequestFactory
+from mock import ANY, call, patch
 from threadlocals.threadlocals import set_thread_variable
 
 from ..export import sbml as sbml_export
+from ..export.table import ExportOption, ExportSelection, TableExport
 from ..forms import LineForm
 from ..importer import (
     TableImport, import_rna_seq, import_rnaseq_edgepro, interpret_raw_rna_seq_data,
 )
 from ..models import (
-    Assay, CarbonSource, GeneIdentifier, GroupPermission, Line, MeasurementType,
+    Assay, CarbonSource, GeneIdentifier, GroupPermission, Line, Measurement, MeasurementType,
     MeasurementUnit, Metabolite, MetadataGroup, MetadataType, Protocol, Strain, Study, Update,
     UserPermission)
+from ..redis import PermissionCache
 from ..solr import StudySearch
 from . import factory, TestCase
 
@@ -178,6 +181,29 @@ class StudyTests(TestCase):
         self.assertFalse(study.user_can_read(user4))
         self.assertFalse(study.user_can_write(user4))
 
+    def test_permission_map(self):
+        """ Ensure the permission map combines permissions, and is reset by changes. """
+        # Load objects
+        study = Study.objects.get(name='Test Study 1')
+        fuels = Group.objects.get(name='Fuels Synthesis')
+        user1 = User.objects.get(username='test1')  # fuels
+        # Create permissions
+        UserPermission.objects.create(study=study, permission_type='R', user=user1)
+        GroupPermission.objects.create(study=study,
+                                       permission_type=GroupPermission.WRITE,
+                                       group=fuels)
+        # Asserts
+        self.assertEqual(Study.user_permission_map(user1), {study.pk: 'W'})
+        user2 = User.objects.get(username='test2')  # decon
+        user2_version = PermissionCache(user2.pk).version()
+        # removing user from the group drops the group permission on a new load
+        user1.groups.remove(fuels)
+        user1 = User.objects.get(username='test1')
+        self.assertEqual(Study.user_permission_map(user1), {study.pk: 'R'})
+        self.assertEqual(Study.user_permission_ids(user1, 'W'), [])
+        # cached permissions of other users are unchanged
+        self.assertEqual(PermissionCache(user2.pk).version(), user2_version)
+
     def test_study_metadata(self):
         study = Study.objects.get(name='Test Study 1')
         md = MetadataType.objects.get(type_name='Some key')
@@ -192,6 +218,21 @@ class StudyTests(TestCase):
         else:
             raise Exception("Should have caught a ValueError here...")
 
+    def test_study_data_coalesced(self):
+        study = Study.objects.get(name='Test Study 1')
+        strain = Strain.objects.create(name='Test strain')
+        callbacks = []
+        with patch('main.signals.core.transaction.on_commit') as on_commit, \
+                patch('main.signals.core.StudyDataCache') as MockCache:
+            on_commit.side_effect = lambda func, using=None: callbacks.append(func)
+            line = study.line_set.create(name='Line 1')
+            line.strains.add(strain)
+            strain.save()
+            for func in callbacks:
+                func()
+        # changes in one transaction should move the study data to a new version once
+        self.assertEqual(MockCache.call_args_list.count(call(study.pk)), 1)
+
 
 class SolrTests(TestCase):
 
@@ -464,6 +505,23 @@ class AssayDataTests(TestCase):
         else:
             raise Exception("Should have caught an exception here")
 
+    def test_measurement_packed(self):
+        assay = Assay.objects.get(description="GC-MS assay 1")
+        meas1 = assay.measurement_set.get(measurement_type__short_name="ac")
+        meas1.pack_values()
+        meas1 = Measurement.objects.get(pk=meas1.pk)
+        self.assertEqual(meas1.measurementvalue_set.count(), 0)
+        self.assertEqual(meas1.get_series().x, [0.0, 4.0, 8.0, 12.0, 18.0, 24.0, 32.0])
+        self.assertEqual(len(meas1.data()), 7)
+        self.assertEqual(
+            meas1.extract_data_xvalues(defined_only=True),
+            [0.0, 4.0, 8.0, 12.0, 18.0, 24.0]
+        )
+        self.assertEqual('%s' % meas1.interpolate_at(21), "1.2")
+        meas1.unpack_values()
+        self.assertIsNone(meas1.get_series())
+        self.assertEqual(meas1.measurementvalue_set.count(), 7)
+
 
 class ImportTests(TestCase):
     """ Test import of assay measurement data. """
@@ -585,6 +643,47 @@ class ImportTests(TestCase):
             data.append([(float(d.x[0]), float(d.y[0])) for d in m.measurementvalue_set.all()])
         self.assertEqual(str(data), data_literal)
 
+    def test_import_merges_existing_points(self):
+        table = TableImport(self.study1, self.user1)
+        table.import_data(self.get_form())
+        assay = self.line1.assay_set.get()
+        # re-submit the same sets, pointing at the assay created by the first import
+        form = self.get_form()
+        form['jsonoutput'] = form['jsonoutput'].replace(
+            '"assay_id":"named_or_new"', '"assay_id":"%s"' % assay.pk,
+        ).replace('[8,"5.9"]', '[8,"6.1"],[16,"9.9"]')
+        table = TableImport(self.study1, self.user1)
+        (added, updated) = table.import_data(form)
+        self.assertEqual(added, 1)
+        self.assertEqual(updated, 10)
+        meas = assay.measurement_set.get(measurement_type__short_name='ac')
+        data = [(float(d.x[0]), float(d.y[0])) for d in meas.measurementvalue_set.order_by('x')]
+        self.assertEqual(data[-2:], [(8.0, 6.1), (16.0, 9.9)])
+        self.assertEqual(assay.measurement_set.count(), 2)
+
+    def test_import_resumed_series(self):
+        form = self.get_form()
+        table = TableImport(self.study1, self.user1)
+        dumped = table.dump_series(table.prepare_series(form))
+        # a fresh importer picks up the prepared series without creating new assays
+        table = TableImport(self.study1, self.user1)
+        series = table.load_series(form, dumped)
+        (added, updated) = table.import_series(series[1:], offset=1)
+        table.finish_import()
+        self.assertEqual(added, 5)
+        self.assertEqual(updated, 0)
+        self.assertEqual(self.line1.assay_set.count(), 1)
+
+    def test_import_resumed_missing_assay(self):
+        form = self.get_form()
+        table = TableImport(self.study1, self.user1)
+        dumped = table.dump_series(table.prepare_series(form))
+        # prepared assays rolled back, as when the prepare transaction did not commit
+        self.line1.assay_set.all().delete()
+        table = TableImport(self.study1, self.user1)
+        with self.assertRaises(ValueError):
+            table.load_series(form, dumped)
+
     def test_error(self):
         # failed user permissions check
         with self.assertRaises(PermissionDenied):
@@ -855,6 +954,44 @@ class ExportTests(TestCase):
         #   main.views.ExportView
         pass
 
+    def test_table_export_layouts(self):
+        user = factory.UserFactory(is_superuser=True)
+        study = factory.StudyFactory(name='Export Study')
+        line = study.line_set.create(name='L1', experimenter=user, contact=user)
+        protocol = Protocol.objects.get(name='OD600')
+        assay = line.assay_set.create(name='A1', protocol=protocol, experimenter=user)
+        measurement = assay.measurement_set.create(
+            experimenter=user,
+            measurement_type=Metabolite.objects.get(short_name='ac'),
+            x_units=MeasurementUnit.objects.get(unit_name='hours'),
+            y_units=MeasurementUnit.objects.get(unit_name='mM'),
+        )
+        for x, y in [(0, 0.1), (4, 0.5), (8, 1.5)]:
+            measurement.measurementvalue_set.create(x=[x], y=[y])
+        selection = ExportSelection(user, studyId=[study.pk])
+        columns = [c for c in Line.export_columns([line]) if c.get_key() == 'Line.name']
+        by_point = TableExport(selection, ExportOption(
+            layout=ExportOption.DATA_COLUMN_BY_POINT,
+            columns=columns,
+        ))
+        self.assertEqual(
+            by_point.output(),
+            'Line Name,X,Y\nL1,0.0,0.1\nL1,4.0,0.5\nL1,8.0,1.5'
+        )
+        by_line = TableExport(selection, ExportOption(
+            layout=ExportOption.DATA_COLUMN_BY_LINE,
+            columns=columns,
+        ))
+        self.assertEqual(by_line.output(), 'Line Name,0.0,4.0,8.0\nL1,0.1,0.5,1.5')
+        transposed = TableExport(selection, ExportOption(
+            layout=ExportOption.LINE_COLUMN_BY_DATA,
+            columns=columns,
+        ))
+        self.assertEqual(
+            transposed.output(),
+            'Line Name,L1\n0.0,0.1\n4.0,0.5\n8.0,1.5'
+        )
+
     def test_user_permission(self):
         # TODO tests using main.forms.ExportSelectionForm, main.forms.ExportOptionForm, and
         #   main.views.ExportView
@@ -932,3 +1069,19 @@ class IceTests(TestCase):
         self.assertIsNone(ICE_ENTRY_URL_PATTERN.match(uri))
         uri = 'http://registry.jbei.org/entry/foobar'
         self.assertIsNone(ICE_ENTRY_URL_PATTERN.match(uri))
+
+    def test_ice_sync_coalesced(self):
+        from ..signals.core import queue_ice_sync
+
+        study = factory.StudyFactory()
+        callbacks = []
+        with patch('main.signals.core.transaction.on_commit') as on_commit, \
+                patch('main.signals.core.sync_study_ice_links') as sync:
+            on_commit.side_effect = lambda func, using=None: callbacks.append(func)
+            queue_ice_sync(study, [1, 2])
+            queue_ice_sync(study, [2, 3])
+            for func in callbacks:
+                func()
+        # changes in one transaction should result in a single task for the study
+        submitted = [c for c in sync.delay.call_args_list if c[0][1] == study.pk]
+        self.assertEqual(submitted, [call(ANY, study.pk, study.slug, [1, 2, 3])])
@@ -0,0 +1,57 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+"""
+Tests for queueing changes to the Solr indices.
+"""
+
+from mock import MagicMock, patch
+
+from .. import tasks
+from ..redis import SolrIndexQueue
+from . import TestCase
+
+
+class SolrIndexQueueTests(TestCase):
+    core = 'test_index_queue'
+
+    def setUp(self):
+        super(SolrIndexQueueTests, self).setUp()
+        self.queue = SolrIndexQueue(self.core)
+        self._clear()
+
+    def tearDown(self):
+        self._clear()
+        super(SolrIndexQueueTests, self).tearDown()
+
+    def _clear(self):
+        self.queue.pop_remove(1000)
+        self.queue.pop_update(1000)
+
+    def test_requeue_keeps_newer_action(self):
+        self.queue.update([1, 2])
+        ids = self.queue.pop_update(10)
+        self.queue.remove([1])
+        self.queue.requeue('update', ids)
+        self.assertEqual(self.queue.pop_update(10), [2])
+        self.assertEqual(self.queue.pop_remove(10), [1])
+
+    def test_drain_failed_update(self):
+        index = MagicMock(core=self.core)
+
+        def fail_update(docs, **kwargs):
+            # a document is queued for removal while the failing batch is sent
+            self.queue.remove([1])
+            raise IOError('Solr is unavailable')
+
+        index.update.side_effect = fail_update
+        self.queue.update([1, 2])
+        with patch('main.tasks.solr') as solr:
+            solr.StudySearch.return_value = index
+            solr.UserSearch.return_value = MagicMock(core='%s_user' % self.core)
+            solr.MeasurementTypeSearch.return_value = MagicMock(core='%s_type' % self.core)
+            tasks.drain_solr_queue()
+        index.update.assert_called_once()
+        # the failed batch is queued again, without cancelling the newer removal
+        self.assertEqual(self.queue.pop_update(10), [2])
+        self.assertEqual(self.queue.pop_remove(10), [1])
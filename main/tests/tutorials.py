@@ -218,6 +218,35 @@ class FBAImportDataTests(ImportDataTestsMixin, TestCase):
         response = self._run_parse_view('ImportData_FBA_HPLC.xlsx', 'xlsx', 'std')
         self.assertEqual(response.status_code, codes.ok)
 
+    def test_import_parse_thin_method(self):
+        name = 'ImportData_FBA_HPLC.xlsx'
+        with factory.load_test_file(name) as fp:
+            upload = BytesIO(fp.read())
+        upload.name = name
+        response = self.client.post(
+            reverse('main:import_parse'),
+            data={
+                "file": upload,
+                "X_EDD_FILE_TYPE": 'xlsx',
+                "X_EDD_IMPORT_MODE": 'std',
+                "thin": 10,
+                "thin_method": 'bogus',
+            },
+        )
+        self.assertEqual(response.status_code, codes.bad_request)
+        self.assertIn('python_error', response.json())
+        upload.seek(0)
+        response = self.client.post(
+            reverse('main:import_parse'),
+            data={
+                "file": upload,
+                "X_EDD_FILE_TYPE": 'xlsx',
+                "X_EDD_IMPORT_MODE": 'std',
+                "thin": -5,
+            },
+        )
+        self.assertEqual(response.status_code, codes.bad_request)
+
     def test_hplc_import_task(self):
         self._run_task('ImportData_FBA_HPLC.xlsx')
         self.assertEqual(self._assay_count(), 2)
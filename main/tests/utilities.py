@@ -317,6 +317,13 @@ class CombinatorialCreationTests(TestCase):
         created_line_count = len(creation_results.lines_created)
 
         self.assertEqual(created_line_count, planned_line_count)
+        # lines are created in bulk; verify they are all persisted with an update log
+        created_pks = [line.pk for line in creation_results.lines_created]
+        persisted = study.line_set.filter(pk__in=created_pks)
+        self.assertEqual(persisted.count(), planned_line_count)
+        for line in persisted.prefetch_related('updates'):
+            self.assertEqual(len(line.updates.all()), 1)
+            self.assertIsNotNone(line.uuid)
 
         for line_index, created_line in enumerate(creation_results.lines_created):
             # verify planned line name is the same as the created one
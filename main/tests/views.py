@@ -5,11 +5,17 @@ from __future__ import absolute_import, unicode_literals
 Tests used to validate the tutorial screencast functionality.
 """
 
+import json
+import struct
+
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import Client, TestCase
 from requests import codes
 
 from .. import models
+from ..autocomplete import trigram_search
+from ..views import MEASUREMENT_BINARY_TYPE
 from . import factory
 
 
@@ -37,3 +43,190 @@ class StudyViewTests(TestCase):
             data={},
         )
         self.assertEqual(response.status_code, codes.ok)
+
+    def test_measurements_pages(self):
+        """ Study measurement data is returned in pages linked by a cursor. """
+        protocol = models.Protocol.objects.get(name='OD600')
+        line = self.target_study.line_set.create(name='L1')
+        assay = line.assay_set.create(name='A1', protocol=protocol, experimenter=self.user)
+        mtype = models.Metabolite.objects.get(short_name='ac')
+        hours = models.MeasurementUnit.objects.get(unit_name='hours')
+        for i in range(3):
+            measurement = assay.measurement_set.create(
+                measurement_type=mtype, x_units=hours, y_units=hours,
+            )
+            measurement.measurementvalue_set.create(x=[i], y=[i * 2])
+        url = '%smeasurements/%s/' % (
+            reverse('main:detail', kwargs=self.target_kwargs),
+            protocol.pk,
+        )
+        first = self.fake_browser.get(url, data={'page_size': 2}).json()
+        self.assertEqual(len(first['measures']), 2)
+        self.assertEqual(first['total_measures'], {str(assay.pk): 3})
+        self.assertIsNotNone(first['next'])
+        second = self.fake_browser.get(
+            url,
+            data={'page_size': 2, 'cursor': first['next']},
+        ).json()
+        self.assertEqual(len(second['measures']), 1)
+        self.assertEqual(len(second['data']), 1)
+        self.assertIsNone(second['next'])
+
+    def test_measurements_binary(self):
+        """ Scalar measurement data is packed in columns when requesting the binary format. """
+        protocol = models.Protocol.objects.get(name='OD600')
+        line = self.target_study.line_set.create(name='L1')
+        assay = line.assay_set.create(name='A1', protocol=protocol, experimenter=self.user)
+        mtype = models.Metabolite.objects.get(short_name='ac')
+        hours = models.MeasurementUnit.objects.get(unit_name='hours')
+        measurement = assay.measurement_set.create(
+            measurement_type=mtype, x_units=hours, y_units=hours,
+        )
+        measurement.measurementvalue_set.create(x=[2], y=[])
+        measurement.measurementvalue_set.create(x=[1], y=[3])
+        url = '%smeasurements/%s/' % (
+            reverse('main:detail', kwargs=self.target_kwargs),
+            protocol.pk,
+        )
+        response = self.fake_browser.get(url, HTTP_ACCEPT=MEASUREMENT_BINARY_TYPE)
+        self.assertEqual(response['Content-Type'], MEASUREMENT_BINARY_TYPE)
+        self.assertIn('Accept', response['Vary'])
+        content = response.content
+        self.assertEqual(content[:4], b'EDDM')
+        (json_length, measure_count, point_count) = struct.unpack('<3I', content[4:16])
+        self.assertEqual((measure_count, point_count), (1, 2))
+        payload = json.loads(content[16:16 + json_length].decode('utf-8'))
+        self.assertEqual(len(payload['measures']), 1)
+        self.assertEqual(payload['data'], {})
+        offset = 16 + json_length
+        self.assertEqual(struct.unpack('<3i', content[offset:offset + 12]), (measurement.pk, 0, 2))
+        offset += 16
+        (x1, x2, y1, y2) = struct.unpack('<4d', content[offset:offset + 32])
+        self.assertEqual((x1, x2, y1), (1, 2, 3))
+        self.assertNotEqual(y2, y2)
+
+    def test_measurements_max_points(self):
+        """ Scalar measurement data is downsampled to max_points, keeping the end points. """
+        protocol = models.Protocol.objects.get(name='OD600')
+        line = self.target_study.line_set.create(name='L1')
+        assay = line.assay_set.create(name='A1', protocol=protocol, experimenter=self.user)
+        mtype = models.Metabolite.objects.get(short_name='ac')
+        hours = models.MeasurementUnit.objects.get(unit_name='hours')
+        measurement = assay.measurement_set.create(
+            measurement_type=mtype, x_units=hours, y_units=hours,
+        )
+        for i in range(20):
+            measurement.measurementvalue_set.create(x=[i], y=[i % 3])
+        url = '%smeasurements/%s/' % (
+            reverse('main:detail', kwargs=self.target_kwargs),
+            protocol.pk,
+        )
+        response = self.fake_browser.get(url, data={'max_points': 5})
+        points = response.json()['data'][str(measurement.pk)]
+        self.assertEqual(len(points), 5)
+        self.assertEqual((points[0][0], points[-1][0]), ([0], [19]))
+        response = self.fake_browser.get(url, data={'max_points': 5, 'downsample': 'bogus'})
+        self.assertEqual(response.status_code, codes.bad_request)
+
+    def test_edit_packed_measurement(self):
+        """ Editing a packed measurement shows and saves its values, keeping it packed. """
+        protocol = models.Protocol.objects.get(name='OD600')
+        line = self.target_study.line_set.create(name='L1')
+        assay = line.assay_set.create(name='A1', protocol=protocol, experimenter=self.user)
+        mtype = models.Metabolite.objects.get(short_name='ac')
+        hours = models.MeasurementUnit.objects.get(unit_name='hours')
+        measurement = assay.measurement_set.create(
+            measurement_type=mtype, x_units=hours, y_units=hours,
+        )
+        for i in range(3):
+            measurement.measurementvalue_set.create(x=[i], y=[i * 2])
+        measurement.pack_values()
+        response = self.fake_browser.post(
+            reverse('main:detail', kwargs=self.target_kwargs),
+            data={
+                'action': 'assay_action',
+                'assay_action': 'edit',
+                'measurementId': measurement.pk,
+            },
+        )
+        self.assertEqual(response.status_code, codes.ok)
+        formset = response.context['lines'][line.pk]['assays'][assay.pk]['measures'][
+            measurement.pk]['form']
+        self.assertEqual(len(formset.forms), 3)
+        self.assertEqual(formset.forms[2].initial, {'x': [2], 'y': [4]})
+        # showing the form does not unpack the measurement
+        self.assertIsNotNone(models.Measurement.objects.get(pk=measurement.pk).get_series())
+        prefix = str(measurement.pk)
+        self.fake_browser.post(
+            reverse('main:detail', kwargs=self.target_kwargs),
+            data={
+                'action': 'assay_action',
+                'assay_action': 'update',
+                'measureId': prefix,
+                prefix + '-TOTAL_FORMS': 3,
+                prefix + '-INITIAL_FORMS': 0,
+                prefix + '-0-x': '0',
+                prefix + '-0-y': '0',
+                prefix + '-1-x': '1',
+                prefix + '-1-y': '5',
+                prefix + '-2-x': '',
+                prefix + '-2-y': '',
+            },
+        )
+        # saving the form replaces the points, and packs them again
+        series = models.Measurement.objects.get(pk=measurement.pk).get_series()
+        self.assertEqual((series.x, series.y), ([0, 1], [0, 5]))
+        self.assertFalse(measurement.measurementvalue_set.exists())
+        self.fake_browser.post(
+            reverse('main:detail', kwargs=self.target_kwargs),
+            data={
+                'action': 'assay_action',
+                'assay_action': 'delete',
+                'measurementId': measurement.pk,
+            },
+        )
+        measurement = models.Measurement.objects.get(pk=measurement.pk)
+        self.assertFalse(measurement.active)
+
+    def test_edddata_etag(self):
+        """ Study data responses carry an ETag, and matching requests get Not Modified. """
+        url = '%sedddata/' % reverse('main:detail', kwargs=self.target_kwargs)
+        response = self.fake_browser.get(url)
+        self.assertEqual(response.status_code, codes.ok)
+        self.assertIn('Lines', response.json())
+        self.assertNotIn('Users', response.json())
+        etag = response['ETag']
+        response = self.fake_browser.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, codes.not_modified)
+
+    def test_misc_data_etag(self):
+        """ Shared lookup tables are loaded separately, and carry an ETag. """
+        response = self.fake_browser.get('/data/misc/')
+        self.assertEqual(response.status_code, codes.ok)
+        self.assertIn(str(self.user.pk), response.json()['EDDData']['Users'])
+        response = self.fake_browser.get('/data/misc/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, codes.not_modified)
+
+    def test_autocomplete_ranked(self):
+        """ Autocomplete results are ordered by similarity to the search term. """
+        response = self.fake_browser.get('/search/', data={
+            'model': 'MeasurementUnit',
+            'term': 'hours',
+        })
+        self.assertEqual(response.status_code, codes.ok)
+        rows = response.json()['rows']
+        self.assertEqual(rows[0]['name'], 'hours')
+
+    def test_autocomplete_trigram_index(self):
+        """ Autocomplete containment searches are served by the trigram indexes. """
+        found = trigram_search(
+            models.MeasurementType.objects.all(), ('type_name', 'short_name', ), 'glc',
+        )
+        (sql, params) = found.query.sql_with_params()
+        with connection.cursor() as cursor:
+            # the test tables are tiny, make sure the planner does not prefer a sequential scan
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN %s' % sql, params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn('measurement_type_type_name_trgm', plan)
+        self.assertIn('measurement_type_short_name_trgm', plan)
@@ -92,6 +92,11 @@ urlpatterns = [
 
     # "export" URLs
     url(r'^export/$', login_required(views.ExportView.as_view()), name='export'),
+    url(
+        r'^export/download/(?P<task>[0-9a-f-]{36})/$',
+        login_required(views.export_download),
+        name='export_download',
+    ),
     url(r'^worklist/$', login_required(views.WorklistView.as_view()), name='worklist'),
     url(r'^sbml/$', login_required(views.SbmlView.as_view()), name='sbml'),
 
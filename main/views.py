@@ -2,20 +2,29 @@
 from __future__ import unicode_literals
 
 import collections
+import functools
 import json
 import logging
+import os
 import re
+import struct
 
 from builtins import str
 from django.conf import settings
 from django.contrib import messages
 from django.core.exceptions import PermissionDenied, SuspiciousOperation, ValidationError
+from django.core.files.storage import default_storage
 from django.core.urlresolvers import reverse
 from django.db import transaction
 from django.db.models import Count, Prefetch, Q
-from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, QueryDict
+from django.db.models.expressions import RawSQL
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotModified, HttpResponseRedirect,
+    JsonResponse, QueryDict, StreamingHttpResponse,
+)
 from django.shortcuts import render, get_object_or_404, redirect
 from django.template.defaulttags import register
+from django.utils.cache import patch_vary_headers
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext as _
 from django.views import generic
@@ -45,11 +54,11 @@ from .importer import (import_rna_seq, import_rnaseq_edgepro, interpret_edgepro_
                        interpret_raw_rna_seq_data, )
 from .importer.experiment_desc import CombinatorialCreationImporter
 from .importer.parser import find_parser
-from .models import (Assay, Attachment, Line, Measurement, MeasurementType, MeasurementValue,
-                     Metabolite, MetaboliteSpecies, MetadataType, Protocol, SBMLTemplate, Study,
-                     StudyPermission, Update, )
+from .models import (Assay, Attachment, Line, Measurement, MeasurementSeries, MeasurementType,
+                     MeasurementValue, Metabolite, MetaboliteSpecies, MetadataType, Protocol,
+                     SBMLTemplate, Study, StudyPermission, Update, )
 from .solr import StudySearch
-from .tasks import import_table_task
+from .tasks import build_export_path, export_table_task, import_table_task
 from .utilities import (
     get_edddata_carbon_sources,
     get_edddata_measurement,
@@ -59,11 +68,17 @@ from .utilities import (
     get_edddata_users,
 )
 from edd import utilities
+from edd_utils import downsample
 
 
 logger = logging.getLogger(__name__)
 
 FILE_TYPE_HEADER = 'HTTP_X_EDD_FILE_TYPE'
+# default and maximum count of measurements in each page of study measurement data
+MEASUREMENT_PAGE_SIZE = 1000
+MEASUREMENT_PAGE_MAX = 5000
+# media type of the columnar binary format for study measurement data
+MEASUREMENT_BINARY_TYPE = 'application/x-edd-measurements'
 
 
 @register.filter(name='lookup')
@@ -98,14 +113,17 @@ def load_study(request, pk=None, slug=None, permission_type=StudyPermission.CAN_
     :param slug: study's slug ID; at least one of pk and slug must be provided
     :param permission_type: required permission for the study access
     """
-    permission = Q()
-    if not request.user.is_superuser:
-        permission = Study.user_permission_q(request.user, permission_type)
     if pk is not None:
-        return get_object_or_404(Study.objects.distinct(), permission, Q(pk=pk))
+        study = get_object_or_404(Study, pk=pk)
     elif slug is not None:
-        return get_object_or_404(Study.objects.distinct(), permission, Q(slug=slug))
-    raise Http404()
+        study = get_object_or_404(Study, slug=slug)
+    else:
+        raise Http404()
+    if not request.user.is_superuser:
+        permissions = Study.user_permission_map(request.user)
+        if permissions.get(study.pk) not in permission_type:
+            raise Http404()
+    return study
 
 
 class StudyCreateView(generic.edit.CreateView):
@@ -158,8 +176,9 @@ class StudyObjectMixin(generic.detail.SingleObjectMixin):
         qs = super(StudyObjectMixin, self).get_queryset()
         if self.request.user.is_superuser:
             return qs
-        return qs.filter(Study.user_permission_q(self.request.user,
-                                                 StudyPermission.CAN_VIEW)).distinct()
+        return qs.filter(
+            pk__in=Study.user_permission_ids(self.request.user, StudyPermission.CAN_VIEW),
+        )
 
 
 class StudyIndexView(generic.edit.CreateView):
@@ -777,17 +796,23 @@ class StudyDetailView(StudyDetailBaseView):
         measure_ids = request.POST.getlist('measurementId', [])
         # define base querysets first
         assays = Assay.objects.filter(pk__in=assay_ids)
-        assays_counted = assays.annotate(v_count=Count('measurement__measurementvalue'))
+        assays_counted = assays.annotate(
+            v_count=Count('measurement__measurementvalue'),
+            s_count=Count('measurement__series'),
+        )
         measures = Measurement.objects.filter(Q(assay_id__in=assay_ids) | Q(pk__in=measure_ids))
-        measures_counted = measures.annotate(v_count=Count('measurementvalue'))
+        measures_counted = measures.annotate(
+            v_count=Count('measurementvalue'),
+            s_count=Count('series'),
+        )
         # start counts at zero
         assay_count = 0
         measurement_count = 0
         try:
-            # real deletion for anything without measurement values
-            foo, info = measures_counted.filter(v_count=0).delete()
+            # real deletion for anything without measurement values or packed series
+            foo, info = measures_counted.filter(v_count=0, s_count=0).delete()
             measurement_count += info.get(Measurement._meta.label, 0)
-            foo, info = assays_counted.filter(v_count=0).delete()
+            foo, info = assays_counted.filter(v_count=0, s_count=0).delete()
             measurement_count += info.get(Measurement._meta.label, 0)
             assay_count += info.get(Assay._meta.label, 0)
             # "deleting" the rest by setting active to False
@@ -804,13 +829,44 @@ class StudyDetailView(StudyDetailBaseView):
             logger.exception('Failed to do measurement deletion')
         return True
 
+    def _measurement_formset(self, measure, data=None):
+        """ Creates a MeasurementValueFormSet for a measurement. The points of a packed
+            measurement are shown as extra forms, leaving the series packed until saved. """
+        series = measure.get_series()
+        if series is None:
+            return MeasurementValueFormSet(
+                data,
+                instance=measure,
+                prefix=str(measure.id),
+                queryset=measure.measurementvalue_set.order_by('x'),
+            )
+        formset = MeasurementValueFormSet(
+            data,
+            instance=measure,
+            prefix=str(measure.id),
+            queryset=MeasurementValue.objects.none(),
+            initial=None if data else [{'x': x, 'y': y} for x, y in series.to_points()],
+        )
+        formset.extra = len(series.x)
+        return formset
+
+    def _save_measurement_values(self, measure, formset):
+        """ Saves the edited values of a measurement. All points of a packed measurement are
+            submitted as new values, so these replace the series, then are packed again. """
+        series = measure.get_series()
+        if series is not None:
+            series.delete()
+        formset.save()
+        if series is not None:
+            measure.pack_values()
+
     def handle_measurement_edit(self, request):
         assay_ids = request.POST.getlist('assayId', [])
         measure_ids = request.POST.getlist('measurementId', [])
         measures = Measurement.objects.filter(
             Q(assay_id__in=assay_ids) | Q(id__in=measure_ids),
         ).select_related(
-            'assay__line', 'assay__protocol', 'measurement_type',
+            'assay__line', 'assay__protocol', 'measurement_type', 'series',
         ).order_by(
             'assay__line_id', 'assay_id',
         ).prefetch_related(
@@ -828,11 +884,7 @@ class StudyDetailView(StudyDetailBaseView):
             })
             assay_dict['measures'][m.id] = {
                 'measure': m,
-                'form': MeasurementValueFormSet(
-                    instance=m,
-                    prefix=str(m.id),
-                    queryset=m.measurementvalue_set.order_by('x')
-                ),
+                'form': self._measurement_formset(m),
             }
         return self.handle_measurement_edit_response(request, lines, measures)
 
@@ -852,13 +904,14 @@ class StudyDetailView(StudyDetailBaseView):
         measures = Measurement.objects.filter(
             id__in=measure_ids.split(',')
         ).select_related(
-            'assay__line', 'assay__protocol', 'measurement_type',
+            'assay__line', 'assay__protocol', 'measurement_type', 'series',
         ).order_by(
             'assay__line_id', 'assay_id',
         ).prefetch_related(
             Prefetch('measurementvalue_set', queryset=MeasurementValue.objects.order_by('x'))
         )
         is_valid = True
+        formsets = []
         # map sequence of measurements to structure of unique lines/assays
         lines = {}
         for m in measures:
@@ -872,14 +925,9 @@ class StudyDetailView(StudyDetailBaseView):
                     'measures': collections.OrderedDict(),
                 }
             )
-            aform = MeasurementValueFormSet(
-                request.POST or None,
-                instance=m,
-                prefix=str(m.id),
-                queryset=m.measurementvalue_set.order_by('x'),
-            )
+            aform = self._measurement_formset(m, request.POST or None)
             if aform.is_valid():
-                aform.save()
+                formsets.append((m, aform))
             else:
                 is_valid = False
             assay_dict['measures'][m.id] = {
@@ -888,6 +936,9 @@ class StudyDetailView(StudyDetailBaseView):
             }
         if not is_valid:
             return self.handle_measurement_edit_response(request, lines, measures)
+        with transaction.atomic():
+            for m, aform in formsets:
+                self._save_measurement_values(m, aform)
         return True
 
     def get(self, request, *args, **kwargs):
@@ -979,6 +1030,7 @@ class EDDExportView(generic.TemplateView):
         except Exception as e:
             logger.exception("Failed to validate forms for export: %s", e)
         return {
+            'background': payload.get('action', None) == 'background',
             'download': payload.get('action', None) == 'download',
             'select_form': select_form,
             'selection': self.selection,
@@ -991,7 +1043,7 @@ class EDDExportView(generic.TemplateView):
 
     def render_to_response(self, context, **kwargs):
         if context.get('download', False) and self._export:
-            response = HttpResponse(self._export.output(), content_type='text/csv')
+            response = StreamingHttpResponse(self._export.iter_output(), content_type='text/csv')
             # set download filename as the first name in the exported studies
             study = self._export.selection.studies[0]
             response['Content-Disposition'] = 'attachment; filename="%s.csv"' % study.name
@@ -1013,11 +1065,49 @@ class ExportView(EDDExportView):
             context.update(option_form=option_form)
             if option_form.is_valid():
                 self._export = TableExport(self.selection, option_form.options, None)
-                context.update(output=self._export.output())
+                if context.get('background', False):
+                    self._submit_background(request)
+                # downloads stream the export in render_to_response; skip building a preview
+                elif not context.get('download', False):
+                    context.update(output=self._export.output())
         except Exception as e:
             logger.exception("Failed to validate forms for export: %s", e)
         return context
 
+    def _submit_background(self, request):
+        storage = redis.ScratchStorage()
+        # save POST to scratch space as urlencoded string
+        key = storage.save(request.POST.urlencode())
+        result = export_table_task.delay(request.user.pk, key)
+        # save task ID for notification later
+        request.user.profile.tasks.create(uuid=result.id)
+        messages.add_message(
+            request,
+            msg_constants.SUCCESS_PERSISTENT,
+            _('Export is submitted. You may continue to use EDD, another message will appear '
+              'with a download link once the export is complete.')
+        )
+
+
+# /export/download/<task>/
+def export_download(request, task):
+    """ Downloads the output of a background export started by the requesting user. """
+    try:
+        found = request.user.profile.tasks.filter(uuid=task).exists()
+    except ValidationError:
+        found = False
+    if not found:
+        raise Http404(_('No export found.'))
+    directory = os.path.dirname(build_export_path(task, ''))
+    try:
+        filename = default_storage.listdir(directory)[1][0]
+    except (IndexError, OSError):
+        raise Http404(_('Export file is not available.'))
+    output = default_storage.open(os.path.join(directory, filename))
+    response = FileResponse(output, content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
+
 
 class WorklistView(EDDExportView):
     """ View to export lines in a worklist template. """
@@ -1089,56 +1179,19 @@ class SbmlView(EDDExportView):
 def study_measurements(request, pk=None, slug=None, protocol=None):
     """ Request measurement data in a study. """
     obj = load_study(request, pk=pk, slug=slug)
-    measure_types = MeasurementType.objects.filter(
-        measurement__assay__line__study=obj,
-        measurement__assay__protocol_id=protocol,
-    ).distinct()
-    # stash QuerySet to use in both measurements and total_measures below
     qmeasurements = Measurement.objects.filter(
         assay__line__study=obj,
         assay__protocol_id=protocol,
         active=True,
         assay__line__active=True,
     )
-    # Limit the measurements returned to keep browser performance
-    measurements = qmeasurements.order_by('id')[:5000]
-    total_measures = qmeasurements.values('assay_id').annotate(count=Count('assay_id'))
-    measure_list = list(measurements)
-    if len(measure_list):
-        # only try to pull values when we have measurement objects
-        values = MeasurementValue.objects.filter(
-            measurement__assay__line__study=obj,
-            measurement__assay__protocol_id=protocol,
-            measurement__active=True,
-            measurement__assay__line__active=True,
-            measurement__pk__range=(measure_list[0].id, measure_list[-1].id),
-        )
-    else:
-        values = []
-    value_dict = collections.defaultdict(list)
-    for v in values:
-        value_dict[v.measurement_id].append((v.x, v.y))
-    payload = {
-        'total_measures': {
-            x['assay_id']: x.get('count', 0) for x in total_measures if 'assay_id' in x
-        },
-        'types': {t.pk: t.to_json() for t in measure_types},
-        'measures': [m.to_json() for m in measure_list],
-        'data': value_dict,
-    }
-    return JsonResponse(payload, encoder=utilities.JSONEncoder)
+    return _build_measurement_page(request, qmeasurements)
 
 
 # /study/<study_id>/measurements/<protocol_id>/<assay_id>/
 def study_assay_measurements(request, pk=None, slug=None, protocol=None, assay=None):
     """ Request measurement data in a study, for a single assay. """
     obj = load_study(request, pk=pk, slug=slug)
-    measure_types = MeasurementType.objects.filter(
-        measurement__assay__line__study=obj,
-        measurement__assay__protocol_id=protocol,
-        measurement__assay=assay,
-        ).distinct()
-    # stash QuerySet to use in both measurements and total_measures below
     qmeasurements = Measurement.objects.filter(
         assay__line__study_id=obj.pk,
         assay__protocol_id=protocol,
@@ -1146,32 +1199,157 @@ def study_assay_measurements(request, pk=None, slug=None, protocol=None, assay=N
         active=True,
         assay__active=True,
         assay__line__active=True,
-        )
-    # Limit the measurements returned to keep browser performant
-    measurements = qmeasurements.order_by('id')[:5000]
-    total_measures = qmeasurements.values('assay_id').annotate(count=Count('assay_id'))
-    measure_list = list(measurements)
-    values = MeasurementValue.objects.filter(
-        measurement__assay__line__study_id=obj.pk,
-        measurement__assay__protocol_id=protocol,
-        measurement__assay=assay,
-        measurement__active=True,
-        measurement__assay__active=True,
-        measurement__assay__line__active=True,
-        measurement__id__range=(measure_list[0].id, measure_list[-1].id),
-        )
-    value_dict = collections.defaultdict(list)
-    for v in values:
-        value_dict[v.measurement_id].append((v.x, v.y))
+    )
+    return _build_measurement_page(request, qmeasurements)
+
+
+def _build_measurement_page(request, qmeasurements):
+    """
+    Builds a page of measurements and their values, for the Study Data page. Pages are ordered by
+    measurement ID; the cursor GET parameter is the last measurement ID from the previous page,
+    and the next key of the payload is the cursor for the following page, or None when there
+    are no more measurements. The page_size GET parameter sets the number of measurements per
+    page, up to MEASUREMENT_PAGE_MAX. Counts of measurements per assay are only included in the
+    first page. With the max_points GET parameter, scalar measurements are downsampled to at most
+    that many points, using the edd_utils.downsample method in the downsample GET parameter.
+    Requests accepting MEASUREMENT_BINARY_TYPE get scalar values in the columnar format of
+    _build_measurement_columns; all other requests get a JSON response.
+    """
+    try:
+        cursor = int(request.GET.get('cursor', 0))
+        page_size = int(request.GET.get('page_size', MEASUREMENT_PAGE_SIZE))
+        max_points = int(request.GET.get('max_points', 0))
+    except ValueError:
+        raise SuspiciousOperation(_('Invalid measurement page parameters.'))
+    method = request.GET.get('downsample', downsample.DEFAULT_METHOD)
+    if method not in downsample.METHODS:
+        raise SuspiciousOperation(_('Invalid measurement page parameters.'))
+    thin = None
+    if max_points > 0:
+        thin = functools.partial(downsample.downsample, max_points=max_points, method=method)
+    page_size = min(max(page_size, 1), MEASUREMENT_PAGE_MAX)
+    # fetch one extra record to find out if there is a following page
+    measure_list = list(qmeasurements.filter(pk__gt=cursor).order_by('pk')[:page_size + 1])
+    next_cursor = None
+    if len(measure_list) > page_size:
+        measure_list = measure_list[:page_size]
+        next_cursor = measure_list[-1].pk
+    total_measures = {}
+    if cursor == 0:
+        counts = qmeasurements.values('assay_id').annotate(count=Count('assay_id'))
+        total_measures = {x['assay_id']: x.get('count', 0) for x in counts if 'assay_id' in x}
+    measure_types = MeasurementType.objects.filter(measurement__in=measure_list).distinct()
     payload = {
-        'total_measures': {
-            x['assay_id']: x.get('count', 0) for x in total_measures if 'assay_id' in x
-        },
+        'total_measures': total_measures,
         'types': {t.pk: t.to_json() for t in measure_types},
-        'measures': map(lambda m: m.to_json(), measure_list),
-        'data': value_dict,
+        'measures': [m.to_json() for m in measure_list],
+        'next': next_cursor,
     }
-    return JsonResponse(payload, encoder=utilities.JSONEncoder)
+    if MEASUREMENT_BINARY_TYPE in request.META.get('HTTP_ACCEPT', ''):
+        scalars = [m for m in measure_list if m.measurement_format == Measurement.Format.SCALAR]
+        others = [m for m in measure_list if m.measurement_format != Measurement.Format.SCALAR]
+        # only non-scalar values are left in JSON, scalar values go in the packed columns
+        payload['data'] = _load_measurement_points(others)
+        content = _build_measurement_columns(payload, scalars, thin)
+        response = HttpResponse(content, content_type=MEASUREMENT_BINARY_TYPE)
+    else:
+        payload['data'] = _load_measurement_points(measure_list, thin)
+        response = JsonResponse(payload, encoder=utilities.JSONEncoder)
+    # the format of the response depends on the Accept header, caches must key on it
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def _load_measurement_points(measure_list, thin=None):
+    """
+    Creates a dict of measurement ID to list of (x, y) points for the measurements. When all the
+    points of a measurement are scalar, and a thin function is given, the points are sorted by x
+    and downsampled to the indices returned by thin(x_values, y_values).
+    """
+    value_dict = collections.defaultdict(list)
+    if measure_list:
+        # only try to pull values when we have measurement objects
+        values = MeasurementValue.objects.filter(measurement__in=measure_list)
+        for v in values:
+            value_dict[v.measurement_id].append((v.x, v.y))
+        for series in MeasurementSeries.objects.filter(measurement__in=measure_list):
+            value_dict[series.measurement_id].extend(series.to_points())
+    if thin is not None:
+        for measure_id, points in value_dict.items():
+            if all(len(x) == 1 and len(y) == 1 for x, y in points):
+                points.sort(key=lambda p: p[0][0])
+                # values load as Decimal, which does not mix with the float math of downsampling
+                keep = thin(
+                    [float(p[0][0]) for p in points],
+                    [float(p[1][0]) for p in points],
+                )
+                value_dict[measure_id] = [points[i] for i in keep]
+    return value_dict
+
+
+def _build_measurement_columns(payload, measure_list, thin=None):
+    """
+    Packs scalar measurement values into little-endian binary columns. The content is:
+      * a 16-byte header: the magic bytes EDDM, then uint32 byte length of the JSON payload,
+        uint32 count of measurements, and uint32 count of points;
+      * the UTF-8 JSON payload, space-padded to a multiple of 8 bytes;
+      * int32 measurement IDs, then int32 offsets into the point columns, with one more offset
+        than measurements to mark the end of the last measurement;
+      * zero-padding to a multiple of 8 bytes, then the float64 x column and the float64 y column.
+    Points with an undefined y-value have a NaN y. Within each measurement, points are sorted by x,
+    and when a thin function is given, downsampled to the indices returned by thin(x, y).
+    """
+    import numpy  # delayed loading of numpy, same as in main.utilities.interpolate_at
+    ids = numpy.empty(0, dtype='<i4')
+    x = numpy.empty(0, dtype='<f8')
+    y = numpy.empty(0, dtype='<f8')
+    if measure_list:
+        # only the first element of arrays is used in scalar measurements
+        values = MeasurementValue.objects.filter(
+            measurement__in=measure_list,
+        ).annotate(
+            x0=RawSQL('"measurement_value"."x"[1]::float8', []),
+            y0=RawSQL("COALESCE(\"measurement_value\".\"y\"[1]::float8, 'NaN')", []),
+        ).values_list('measurement_id', 'x0', 'y0')
+        rows = numpy.array(list(values), dtype='<f8').reshape(-1, 3)
+        columns = [rows]
+        for series in MeasurementSeries.objects.filter(measurement__in=measure_list):
+            packed = numpy.empty((len(series.x), 3), dtype='<f8')
+            packed[:, 0] = series.measurement_id
+            packed[:, 1] = series.x
+            packed[:, 2] = series.y
+            columns.append(packed)
+        rows = numpy.concatenate(columns)
+        # sort by measurement ID, then x-value
+        rows = rows[numpy.lexsort((rows[:, 1], rows[:, 0]))]
+        if thin is not None:
+            rows = _thin_columns(rows, thin)
+        ids = rows[:, 0].astype('<i4')
+        x = numpy.ascontiguousarray(rows[:, 1])
+        y = numpy.ascontiguousarray(rows[:, 2])
+    measure_ids, offsets = numpy.unique(ids, return_index=True)
+    offsets = numpy.append(offsets, len(ids)).astype('<i4')
+    measure_ids = measure_ids.astype('<i4')
+    body = json.dumps(payload, cls=utilities.JSONEncoder).encode('utf-8')
+    body += b' ' * (-len(body) % 8)
+    index = measure_ids.tobytes() + offsets.tobytes()
+    index += b'\0' * (-len(index) % 8)
+    header = b'EDDM' + struct.pack('<3I', len(body), len(measure_ids), len(x))
+    return b''.join([header, body, index, x.tobytes(), y.tobytes()])
+
+
+def _thin_columns(rows, thin):
+    """ Downsamples rows of (measurement ID, x, y), sorted by ID then x, per measurement. """
+    import numpy  # delayed loading of numpy, same as in main.utilities.interpolate_at
+    starts = numpy.unique(rows[:, 0], return_index=True)[1]
+    ends = numpy.append(starts[1:], len(rows))
+    keep = [
+        start + numpy.asarray(thin(rows[start:end, 1], rows[start:end, 2]), dtype=int)
+        for start, end in zip(starts, ends)
+    ]
+    if not keep:
+        return rows
+    return rows[numpy.concatenate(keep)]
 
 
 # /study/search/
@@ -1192,14 +1370,35 @@ def study_search(request):
 # /study/<study_id>/edddata/
 def study_edddata(request, pk=None, slug=None):
     """
-    Various information (both global and study-specific) that populates the
-    EDDData JS object on the client.
+    Study-specific information that populates the EDDData JS object on the client; global
+    information is loaded from data_misc.
     """
     model = load_study(request, pk=pk, slug=slug)
-    data_misc = get_edddata_misc()
-    data_study = get_edddata_study(model)
-    data_study.update(data_misc)
-    return JsonResponse(data_study, encoder=utilities.JSONEncoder)
+    return _cached_json_response(
+        request, redis.StudyDataCache(model.pk), get_edddata_study, model,
+    )
+
+
+def _cached_json_response(request, cache, loader, *args):
+    """
+    Creates a JSON response from the current version of a redis.VersionedCache, falling back to
+    serializing and caching the result of calling loader with args. The version is the ETag, and
+    browsers must revalidate any cached copy; a request with a matching If-None-Match gets a 304
+    Not Modified response without loading the cached data.
+    """
+    version = cache.version()
+    etag = '"%s"' % version
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    else:
+        content = cache.load(version)
+        if content is None:
+            content = json.dumps(loader(*args), cls=utilities.JSONEncoder)
+            cache.save(version, content)
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 # /study/<study_id>/assaydata/
@@ -1465,8 +1664,19 @@ def utilities_parse_import_file(request):
 
     parse_fn = find_parser(edd_import_mode, edd_file_type)
     if parse_fn:
+        # optionally downsample dense time-series to at most this many points per record
         try:
-            result = parse_fn(file)
+            thin = int(request.POST.get('thin', 0))
+        except ValueError:
+            thin = -1
+        thin_method = request.POST.get('thin_method', downsample.DEFAULT_METHOD)
+        if thin < 0 or thin_method not in downsample.METHODS:
+            return JsonResponse(
+                {'python_error': _('Invalid downsampling options.')},
+                status=codes.bad_request,
+            )
+        try:
+            result = parse_fn(file, thin=thin, thin_method=thin_method)
             return JsonResponse({
                 'file_type': result.file_type,
                 'file_data': result.parsed_data,
@@ -1619,7 +1829,11 @@ def data_users(request):
 
 # /data/misc/
 def data_misc(request):
-    return JsonResponse({"EDDData": get_edddata_misc()}, encoder=utilities.JSONEncoder)
+    return _cached_json_response(request, redis.MiscDataCache(), _load_edddata_misc)
+
+
+def _load_edddata_misc():
+    return {"EDDData": get_edddata_misc()}
 
 
 # /data/measurements/
@@ -614,6 +614,12 @@ export module Utl {
                     this.fileType = formData["X_EDD_FILE_TYPE"];
                     formData.append('X_EDD_FILE_TYPE', this.fileType);
                     formData.append('X_EDD_IMPORT_MODE', formData["X_EDD_IMPORT_MODE"]);
+                    if (formData["thin"]) {
+                        formData.append('thin', formData["thin"]);
+                    }
+                    if (formData["thin_method"]) {
+                        formData.append('thin_method', formData["thin_method"]);
+                    }
                 }
             });
             this.dropzone.on('complete', function(file) {
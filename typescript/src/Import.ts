@@ -42,6 +42,9 @@ module EDDTableImport {
     export var reviewStep: ReviewStep;
     export var atdGraphing: EDDATDGraphing;
 
+    // method used by the server to downsample dense time-series, when the user asks for it
+    var IMPORT_THIN_METHOD = 'lttb';
+
     export interface RawModeProcessor {
         parse(rawInputStep: RawInputStep, rawData: string): RawInputStat;
         process(rawInputStep: RawInputStep, stat: RawInputStat): void;
@@ -653,6 +656,8 @@ module EDDTableImport {
             var mode = this.selectMajorKindStep.interpretationMode;
             // update input visibility based on user selection in step 1
             this.updateInputVisible();
+            // only the server-side parsers of instrument time-series can downsample curves
+            $('#thinControl').toggle(mode === 'biolector' || mode === 'hplc');
 
             // By default, our drop zone wants excel or csv files, so we clear the
             // additional classes:
@@ -796,6 +801,13 @@ module EDDTableImport {
             var ft = file.name.split('.');
             ft = ft[1];
             formData['X_EDD_FILE_TYPE'] = ft;
+            // dense instrument time-series are only downsampled when the user sets a limit; the
+            // downsampled points are the ones imported
+            var thin = parseInt($('#thinPoints').val(), 10) || 0;
+            if (thin > 0) {
+                formData['thin'] = thin;
+                formData['thin_method'] = IMPORT_THIN_METHOD;
+            }
         }
 
         // This is called upon receiving a response from a file upload operation, and unlike
@@ -32,6 +32,10 @@ require('jquery-ui/ui/widgets/tooltip');
 export namespace StudyDataPage {
     'use strict';
 
+    // media type of the columnar binary format for study measurement data
+    var MEASUREMENT_BINARY_TYPE = 'application/x-edd-measurements';
+    // most points kept in each scalar measurement, plots are never wide enough to show more
+    var MEASUREMENT_MAX_POINTS = 2000;
     var viewingMode: 'linegraph'|'bargraph'|'table';
     var viewingModeIsStale:{[id:string]: boolean};
     var barGraphMode: 'time'|'line'|'measurement';
@@ -1585,14 +1589,34 @@ export namespace StudyDataPage {
     }
 
     export function fetchEDDData(success) {
-        $.ajax({
-            'url': 'edddata/',
-            'type': 'GET',
-            'error': (xhr, status, e) => {
+        var pending = 2, lookup = {}, study = {},
+            error = (xhr, status, e) => {
                 $('#content').prepend("<div class='noData'>Error. Please reload</div>");
                 console.log(['Loading EDDData failed: ', status, ';', e].join(''));
             },
-            'success': success
+            loaded = () => {
+                if (--pending === 0) {
+                    success($.extend(study, lookup));
+                }
+            };
+        // lookup tables shared by all studies are loaded separately from the study data
+        $.ajax({
+            'url': '/data/misc/',
+            'type': 'GET',
+            'error': error,
+            'success': (data) => {
+                lookup = (data || {}).EDDData;
+                loaded();
+            }
+        });
+        $.ajax({
+            'url': 'edddata/',
+            'type': 'GET',
+            'error': error,
+            'success': (data) => {
+                study = data || {};
+                loaded();
+            }
         });
     }
 
@@ -1628,19 +1652,76 @@ export namespace StudyDataPage {
     function fetchMeasurements(EDDData) {
         //pulling in protocol measurements AssayMeasurements
         $.each(EDDData.Protocols, (id, protocol) => {
-            $.ajax({
-                url: 'measurements/' + id + '/',
-                type: 'GET',
-                dataType: 'json',
-                error: (xhr, status) => {
-                    console.log('Failed to fetch measurement data on ' + protocol.name + '!');
-                    console.log(status);
-                },
-                success: processMeasurementData.bind(this, protocol)
-            });
+            fetchMeasurementPages('measurements/' + id + '/', protocol, protocol.name);
         });
     }
 
+    // requests pages of measurement data, starting the next request as each page arrives
+    function fetchMeasurementPages(url:string, protocol, label:string, cursor?:number) {
+        var xhr = new XMLHttpRequest(),
+            params:any = {'max_points': MEASUREMENT_MAX_POINTS};
+        if (cursor) {
+            params.cursor = cursor;
+        }
+        xhr.open('GET', url + '?' + $.param(params));
+        // ask for scalar values in packed columns; falls back to JSON for older servers
+        xhr.setRequestHeader('Accept', MEASUREMENT_BINARY_TYPE + ', application/json');
+        xhr.responseType = 'arraybuffer';
+        xhr.onload = () => {
+            var data;
+            if (xhr.status !== 200) {
+                console.log('Failed to fetch measurement data on ' + label + '!');
+                console.log(xhr.statusText);
+                return;
+            }
+            if (xhr.getResponseHeader('Content-Type') === MEASUREMENT_BINARY_TYPE) {
+                data = unpackMeasurementColumns(xhr.response);
+            } else {
+                data = JSON.parse(decodeUTF8(new Uint8Array(xhr.response)));
+            }
+            processMeasurementData(protocol, data);
+            if (data.next) {
+                fetchMeasurementPages(url, protocol, label, data.next);
+            }
+        };
+        xhr.onerror = () => {
+            console.log('Failed to fetch measurement data on ' + label + '!');
+        };
+        xhr.send();
+    }
+
+    function decodeUTF8(bytes:Uint8Array):string {
+        // TextDecoder is not in the DOM typings used here
+        return new (<any>window).TextDecoder('utf-8').decode(bytes);
+    }
+
+    // decodes the packed columns built in main.views._build_measurement_columns
+    function unpackMeasurementColumns(buffer:ArrayBuffer):any {
+        var header = new DataView(buffer, 0, 16),
+            jsonLength = header.getUint32(4, true),
+            measureCount = header.getUint32(8, true),
+            pointCount = header.getUint32(12, true),
+            offset = 16,
+            data, ids, offsets, xs, ys;
+        data = JSON.parse(decodeUTF8(new Uint8Array(buffer, offset, jsonLength)));
+        offset += jsonLength;
+        ids = new Int32Array(buffer, offset, measureCount);
+        offsets = new Int32Array(buffer, offset + measureCount * 4, measureCount + 1);
+        // index section is padded to a multiple of 8 bytes for the float64 columns
+        offset += Math.ceil((measureCount * 2 + 1) * 4 / 8) * 8;
+        xs = new Float64Array(buffer, offset, pointCount);
+        ys = new Float64Array(buffer, offset + pointCount * 8, pointCount);
+        data.data = data.data || {};
+        ids.forEach((id:number, i:number):void => {
+            var points = [];
+            for (var p = offsets[i]; p < offsets[i + 1]; ++p) {
+                points.push([[xs[p]], isNaN(ys[p]) ? [] : [ys[p]]]);
+            }
+            data.data[id] = points;
+        });
+        return data;
+    }
+
     function includeAllLinesIfEmpty() {
         if ($('#studyAssaysTable').find('tbody input[type=checkbox]:checked').length === 0) {
             //append study id to form
@@ -1688,16 +1769,11 @@ export namespace StudyDataPage {
 
     export function requestAssayData(assay) {
         var protocol = EDDData.Protocols[assay.pid];
-        $.ajax({
-            url: ['measurements', assay.pid, assay.id, ''].join('/'),
-            type: 'GET',
-            dataType: 'json',
-            error: (xhr, status) => {
-                console.log('Failed to fetch measurement data on ' + assay.name + '!');
-                console.log(status);
-            },
-            success: processMeasurementData.bind(this, protocol)
-        });
+        fetchMeasurementPages(
+            ['measurements', assay.pid, assay.id, ''].join('/'),
+            protocol,
+            assay.name
+        );
     }
 
     function processMeasurementData(protocol, data) {
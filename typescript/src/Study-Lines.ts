@@ -146,27 +146,26 @@ module StudyLines {
 
         $(window).on('resize', queuePositionActionsBar);
 
-        $.ajax({
-            'url': '../edddata/',
-            'type': 'GET',
-            'error': (xhr, status, e) => {
-                $('#overviewSection').prepend("<div class='noData'>Error. Please reload</div>");
-                console.log(['Loading EDDData failed: ', status, ';', e].join(''));
-            },
-            'success': (data) => {
-                EDDData = $.extend(EDDData || {}, data);
-                // Instantiate a table specification for the Lines table
-                StudyLines.linesDataGridSpec = new DataGridSpecLines();
-                StudyLines.linesDataGridSpec.init();
-                // Instantiate the table itself with the spec
-                StudyLines.linesDataGrid = new LineResults(this.linesDataGridSpec);
-
-                // Show possible next steps div if needed
-                if (_.keys(EDDData.Lines).length === 0) {
-                    $('.noLines').css('display', 'block');
-                } else {
-                    $('.noLines').css('display', 'none');
-                }
+        // lookup tables shared by all studies are loaded separately from the study data
+        $.when(
+            $.ajax({ 'url': '/data/misc/', 'type': 'GET' }),
+            $.ajax({ 'url': '../edddata/', 'type': 'GET' })
+        ).fail((xhr, status, e) => {
+            $('#overviewSection').prepend("<div class='noData'>Error. Please reload</div>");
+            console.log(['Loading EDDData failed: ', status, ';', e].join(''));
+        }).done((misc, study) => {
+            EDDData = $.extend(EDDData || {}, misc[0].EDDData, study[0]);
+            // Instantiate a table specification for the Lines table
+            StudyLines.linesDataGridSpec = new DataGridSpecLines();
+            StudyLines.linesDataGridSpec.init();
+            // Instantiate the table itself with the spec
+            StudyLines.linesDataGrid = new LineResults(this.linesDataGridSpec);
+
+            // Show possible next steps div if needed
+            if (_.keys(EDDData.Lines).length === 0) {
+                $('.noLines').css('display', 'block');
+            } else {
+                $('.noLines').css('display', 'none');
             }
         });
     }